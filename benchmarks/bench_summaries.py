@@ -0,0 +1,289 @@
+"""
+micro benchmark: the per-row summary/payload builders the embed job uses vs a
+columnar batch path (each field pulled off the batch once, conversions run over
+whole columns, then the same render_*_summary template), both followed by the
+fingerprint the embed job computes for every row.
+
+    python -m benchmarks.bench_summaries --rows 50000 --batch-size 500
+
+also checks that both paths produce exactly the same summaries and payloads. the
+columnar path lives here rather than in services.prepare because it doesn't win,
+see the README.
+"""
+import argparse
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from services.fingerprints import compute_fingerprint
+from services.summarizer import (
+    create_host_summary_from_dict,
+    create_vm_summary_from_dict,
+    host_metadata,
+    render_host_summary,
+    render_vm_summary,
+    vm_metadata,
+)
+
+
+def _maybe(rng, value, missing=0.1, none=0.1):
+    """a real export has blanks and missing columns, so leave some out"""
+    r = rng.random()
+    if r < missing:
+        return KeyError
+    if r < missing + none:
+        return None
+    return value
+
+
+def _doc(rng, fields):
+    doc = {k: _maybe(rng, v) for k, v in fields.items()}
+    return {k: v for k, v in doc.items() if v is not KeyError}
+
+
+def synthetic_vm(rng, i):
+    disks = rng.randint(1, 6)
+    return _doc(
+        rng,
+        {
+            "dataset_id": 1,
+            "vm": f"vm-{i:06d}",
+            "vm_hash": f"{rng.getrandbits(64):016x}",
+            "host": f"esx-{rng.randint(1, 200):03d}",
+            "cluster": f"cluster-{rng.randint(1, 10)}",
+            "datacenter": rng.choice(["dc-east", "dc-west"]),
+            "vcenter": "vc01",
+            "path": f"[ds{rng.randint(1, 40)}] vm-{i}/vm-{i}.vmx",
+            "resource_pool": rng.choice(["prod", "dev", ""]),
+            "powerstate": rng.choice(["poweredOn", "poweredOff", "suspended"]),
+            "created_at": "2024-05-01T10:00:00",
+            "cpus": rng.choice([1, 2, 4, 8, 16]),
+            "memory": rng.choice([1024, 2048, 4096, 8192, 16384, 3000]),
+            "memory_gb": rng.choice([0, 2.0, 4.0]),
+            "disks": disks,
+            "nics": rng.randint(1, 3),
+            "provisioned_mib": rng.uniform(1000, 500000),
+            "provisioned_gb": rng.choice([0, rng.uniform(1, 500)]),
+            "in_use_mib": rng.uniform(0, 400000),
+            "in_use_gb": rng.choice([0, rng.uniform(1, 400)]),
+            "consumed_mib": rng.uniform(0, 200000),
+            "capacity_mib": rng.uniform(1000, 500000),
+            "network": [f"vlan{rng.randint(1, 99)}" for _ in range(rng.randint(0, 3))],
+            "switch": [f"dvs{rng.randint(1, 4)}" for _ in range(rng.randint(0, 2))],
+            "config_os": rng.choice(["Microsoft Windows Server 2019", "Red Hat Enterprise Linux 8", ""]),
+            "vm_tools_os": rng.choice(["Ubuntu Linux (64-bit)", ""]),
+            "phys_cores_used": rng.uniform(0, 4),
+            "phys_ram_used": rng.uniform(0, 32),
+            "is_desktop": rng.random() < 0.2,
+            "thin": [rng.random() < 0.5 for _ in range(disks)],
+            "collection": "rvtools",
+        },
+    )
+
+
+def synthetic_host(rng, i):
+    return _doc(
+        rng,
+        {
+            "dataset_id": 1,
+            "host": f"esx-{i:04d}",
+            "host_hash": f"{rng.getrandbits(64):016x}",
+            "datacenter": rng.choice(["dc-east", "dc-west"]),
+            "cluster": f"cluster-{rng.randint(1, 10)}",
+            "vcenter": "vc01",
+            "vendor": "Dell Inc.",
+            "model": "PowerEdge R750",
+            "cpu_model": "Intel(R) Xeon(R) Gold 6338",
+            "cpus": 2,
+            "cores": 64,
+            "vcpus": rng.randint(50, 400),
+            "speed": 2000,
+            "memory": 524288,
+            "memory_gb": 512,
+            "nics": 4,
+            "hbas": 2,
+            "cpu_usage": rng.randint(0, 100),
+            "memory_usage": rng.randint(0, 100),
+            "vms": rng.randint(0, 80),
+            "desktop_vms": rng.randint(0, 10),
+            "server_vms": rng.randint(0, 70),
+            "vram": rng.randint(0, 400000),
+            "esx_version": "VMware ESXi 7.0.3",
+            "ht_active": rng.random() < 0.8,
+            "collection": "rvtools",
+            "created_at": "2024-05-01T10:00:00",
+        },
+    )
+
+
+def _column(batch: List[Dict[str, Any]], field: str, default: Any = None) -> List[Any]:
+    return [doc.get(field, default) for doc in batch]
+
+
+def _or_column(batch: List[Dict[str, Any]], field: str, fallback: Any) -> List[Any]:
+    return [doc.get(field) or fallback for doc in batch]
+
+
+def _mib_to_gb(gb_values: List[Any], mib_values: List[Any]) -> List[Any]:
+    return [
+        round(gb or (mib / 1024 if mib else 0), 2) for gb, mib in zip(gb_values, mib_values)
+    ]
+
+
+def _joined(values: List[Any]) -> List[str]:
+    return [", ".join(v) if v else "none" for v in values]
+
+
+def summarize_vm_batch(batch: List[Dict[str, Any]]) -> Tuple[List[str], List[Dict[str, Any]]]:
+    memory_gb = [
+        gb or (round(mib / 1024, 2) if mib else 0)
+        for gb, mib in zip(_column(batch, "memory_gb"), _column(batch, "memory", 0))
+    ]
+    consumed_gb = [round(mib / 1024 if mib else 0, 2) for mib in _column(batch, "consumed_mib", 0)]
+    os_info = [
+        c or t or "unknown"
+        for c, t in zip(_column(batch, "config_os"), _column(batch, "vm_tools_os"))
+    ]
+    power = [
+        "powered on" if p == "poweredOn" else p
+        for p in _column(batch, "powerstate", "unknown")
+    ]
+    thin_count = [sum(1 for t in thin if t) if thin else 0 for thin in _column(batch, "thin")]
+
+    summaries = list(
+        map(
+            render_vm_summary,
+            _column(batch, "vm", "unknown"),
+            _column(batch, "vm_hash", "unknown"),
+            _column(batch, "dataset_id", "unknown"),
+            power,
+            _column(batch, "host", "unknown"),
+            _column(batch, "cluster", "unknown"),
+            _column(batch, "datacenter", "unknown"),
+            _column(batch, "cpus", 0),
+            memory_gb,
+            _mib_to_gb(_column(batch, "provisioned_gb"), _column(batch, "provisioned_mib", 0)),
+            _mib_to_gb(_column(batch, "in_use_gb"), _column(batch, "in_use_mib", 0)),
+            consumed_gb,
+            os_info,
+            _column(batch, "is_desktop", False),
+            _joined(_column(batch, "network")),
+            _joined(_column(batch, "switch")),
+            thin_count,
+            _column(batch, "disks", 0),
+            _or_column(batch, "resource_pool", "N/A"),
+            _or_column(batch, "path", "N/A"),
+            _or_column(batch, "phys_cores_used", "unknown"),
+            _or_column(batch, "phys_ram_used", "unknown"),
+            _or_column(batch, "created_at", "unknown time"),
+        )
+    )
+    return summaries, list(map(vm_metadata, batch))
+
+
+def summarize_host_batch(batch: List[Dict[str, Any]]) -> Tuple[List[str], List[Dict[str, Any]]]:
+    ht = ["active" if v else "inactive" for v in _column(batch, "ht_active", False)]
+
+    summaries = list(
+        map(
+            render_host_summary,
+            _column(batch, "host", "unknown"),
+            _column(batch, "host_hash", "unknown"),
+            _column(batch, "dataset_id", "unknown"),
+            _column(batch, "datacenter", "unknown"),
+            _column(batch, "cluster", "unknown"),
+            _column(batch, "vendor", "unknown"),
+            _column(batch, "model", "unknown"),
+            _column(batch, "cpu_model", "unknown"),
+            _column(batch, "esx_version", "unknown"),
+            ht,
+            _column(batch, "cores", 0),
+            _column(batch, "vcpus", 0),
+            _column(batch, "cpu_usage", 0),
+            _column(batch, "memory", 0),
+            _column(batch, "memory_gb", 0),
+            _column(batch, "memory_usage", 0),
+            _column(batch, "vms", 0),
+            _column(batch, "desktop_vms", 0),
+            _column(batch, "server_vms", 0),
+            _column(batch, "vram", 0),
+            _column(batch, "nics", 0),
+            _column(batch, "hbas", 0),
+            _column(batch, "cpus", 0),
+            _column(batch, "speed", 0),
+            _column(batch, "vcenter", "unknown"),
+            _or_column(batch, "created_at", "unknown time"),
+        )
+    )
+    return summaries, list(map(host_metadata, batch))
+
+
+def _batches(docs, batch_size):
+    return [docs[i : i + batch_size] for i in range(0, len(docs), batch_size)]
+
+
+def _per_row(batches, summarize, metadata):
+    for batch in batches:
+        summaries = [summarize(doc) for doc in batch]
+        metadata_list = [metadata(doc) for doc in batch]
+        list(map(compute_fingerprint, summaries, metadata_list))
+
+
+def _columnar(batches, summarize_batch):
+    for batch in batches:
+        summaries, metadata_list = summarize_batch(batch)
+        list(map(compute_fingerprint, summaries, metadata_list))
+
+
+def _best_of(repeat, fn, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1].rstrip(','))
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cases = [
+        (
+            "vm",
+            [synthetic_vm(rng, i) for i in range(args.rows)],
+            (create_vm_summary_from_dict, vm_metadata),
+            summarize_vm_batch,
+        ),
+        (
+            "host",
+            [synthetic_host(rng, i) for i in range(args.rows)],
+            (create_host_summary_from_dict, host_metadata),
+            summarize_host_batch,
+        ),
+    ]
+
+    for kind, docs, row_fns, batch_fn in cases:
+        batches = _batches(docs, args.batch_size)
+        summarize, metadata = row_fns
+        for batch in batches:
+            expected = ([summarize(doc) for doc in batch], [metadata(doc) for doc in batch])
+            if batch_fn(batch) != expected:
+                raise SystemExit(f"{kind}: columnar output differs from the per-row builders")
+
+        row_time = _best_of(args.repeat, _per_row, batches, *row_fns)
+        col_time = _best_of(args.repeat, _columnar, batches, batch_fn)
+        print(
+            f"{kind:<5} {args.rows} rows  per-row {args.rows / row_time:>10,.0f} rows/s  "
+            f"columnar {args.rows / col_time:>10,.0f} rows/s  ({row_time / col_time:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+side by side view of saved benchmarks.run results, oldest first
+
+    python -m benchmarks.compare                      # everything in benchmarks/results
+    python -m benchmarks.compare a.json b.json
+"""
+import glob
+import json
+import os
+import sys
+
+from benchmarks.run import RESULTS_DIR
+
+COLUMNS = [
+    ("commit", lambda r: (r["git"]["sha"] or "?") + ("*" if r["git"]["dirty"] else "")),
+    ("rows", lambda r: r["dataset"]["vms"] + r["dataset"]["hosts"]),
+    ("embed rows/s", lambda r: r["embed_full"]["rows_per_second"]),
+    ("embed p50", lambda r: r["embed_full"]["embed_batch"]["p50_ms"]),
+    ("embed p99", lambda r: r["embed_full"]["embed_batch"]["p99_ms"]),
+    ("upsert p99", lambda r: r["embed_full"]["upsert_batch"]["p99_ms"]),
+    ("incr rows/s", lambda r: r["embed_incremental"]["rows_per_second"]),
+    ("chat req/s", lambda r: r["chat"]["requests_per_second"]),
+    ("chat p50", lambda r: r["chat"]["latency"]["p50_ms"]),
+    ("chat p99", lambda r: r["chat"]["latency"]["p99_ms"]),
+    ("rss MB", lambda r: r["peak_rss_mb"]["self"] + r["peak_rss_mb"]["children"]),
+]
+
+
+def cell(fn, result) -> str:
+    try:
+        value = fn(result)
+    except (KeyError, TypeError):
+        return "-"
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def main():
+    paths = sys.argv[1:] or glob.glob(os.path.join(RESULTS_DIR, "*.json"))
+    results = []
+    for path in paths:
+        with open(path) as f:
+            results.append(json.load(f))
+    if not results:
+        print("no results yet, run python -m benchmarks.run first")
+        return
+    results.sort(key=lambda r: r["timestamp"])
+
+    rows = [["when"] + [name for name, _ in COLUMNS]]
+    rows += [[r["timestamp"]] + [cell(fn, r) for _, fn in COLUMNS] for r in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+    print("\nembed/upsert latencies are per batch, chat per request, all in ms. * = uncommitted changes")
+
+
+if __name__ == "__main__":
+    main()
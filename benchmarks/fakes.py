@@ -0,0 +1,144 @@
+"""
+in-process stand-ins for Gemini (embeddings + chat) and a pymongo/mongomock shim.
+install() swaps them into google.generativeai, so the code under test runs unchanged
+up to the point where it would have gone over the network.
+"""
+import asyncio
+import random
+import threading
+import time
+import zlib
+from typing import Dict, List
+
+import google.generativeai as genai
+import numpy as np
+
+
+class FakeGeminiError(Exception):
+    """what the fakes raise, the message looks like what the real client raises"""
+
+
+class Behaviour:
+    """latency (ms, +-jitter) and the share of calls that get a 429"""
+
+    def __init__(self, latency_ms: float, jitter_ms: float, rate_limit: float, seed: int):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.rate_limit = rate_limit
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+
+    def next(self):
+        """(seconds to wait, whether to answer with a 429)"""
+        with self.lock:
+            self.calls += 1
+            delay = max(self.latency + self.rng.uniform(-self.jitter, self.jitter), 0)
+            throttle = self.rng.random() < self.rate_limit
+            if throttle:
+                self.throttled += 1
+        return delay, throttle
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "rate_limited": self.throttled}
+
+
+def _vector(text: str, dims: int) -> List[float]:
+    rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+    return rng.standard_normal(dims, dtype=np.float32).tolist()
+
+
+class FakeEmbeddings:
+    def __init__(self, behaviour: Behaviour, dims: int, per_item_ms: float):
+        self.behaviour = behaviour
+        self.dims = dims
+        self.per_item = per_item_ms / 1000
+
+    def _answer(self, content):
+        if isinstance(content, list):
+            return {"embedding": [_vector(t, self.dims) for t in content]}
+        return {"embedding": _vector(content, self.dims)}
+
+    def _plan(self, content):
+        delay, throttle = self.behaviour.next()
+        if isinstance(content, list):
+            delay += self.per_item * len(content)
+        return delay, throttle
+
+    def embed_content(self, model=None, content=None, task_type=None, **kwargs):
+        delay, throttle = self._plan(content)
+        time.sleep(delay)
+        if throttle:
+            raise FakeGeminiError("429 Resource has been exhausted (e.g. check quota).")
+        return self._answer(content)
+
+    async def embed_content_async(self, model=None, content=None, task_type=None, **kwargs):
+        delay, throttle = self._plan(content)
+        await asyncio.sleep(delay)
+        if throttle:
+            raise FakeGeminiError("429 Resource has been exhausted (e.g. check quota).")
+        return self._answer(content)
+
+
+class _Chunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeChatModel:
+    """generate_content / generate_content_async(stream=True) with a canned answer"""
+
+    answer = "Based on the records above, the VMs you asked about are listed with their hosts and clusters."
+
+    def __init__(self, behaviour: Behaviour, chunks: int):
+        self.behaviour = behaviour
+        self.chunks = max(chunks, 1)
+
+    def generate_content(self, prompt, **kwargs):
+        delay, throttle = self.behaviour.next()
+        time.sleep(delay)
+        if throttle:
+            raise FakeGeminiError("429 Resource has been exhausted (e.g. check quota).")
+        return _Chunk(self.answer)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        delay, throttle = self.behaviour.next()
+        if throttle:
+            await asyncio.sleep(delay)
+            raise FakeGeminiError("429 Resource has been exhausted (e.g. check quota).")
+        words = self.answer.split(" ")
+        step = max(len(words) // self.chunks, 1)
+        parts = [" ".join(words[i : i + step]) + " " for i in range(0, len(words), step)]
+
+        async def chunks():
+            for part in parts:
+                await asyncio.sleep(delay / len(parts))
+                yield _Chunk(part)
+
+        if stream:
+            return chunks()
+        await asyncio.sleep(delay)
+        return _Chunk(self.answer)
+
+
+def install(embed: FakeEmbeddings, chat_behaviour: Behaviour, chunks: int = 8):
+    genai.configure = lambda *args, **kwargs: None
+    genai.embed_content = embed.embed_content
+    genai.embed_content_async = embed.embed_content_async
+    genai.GenerativeModel = lambda *args, **kwargs: FakeChatModel(chat_behaviour, chunks)
+
+
+def patch_mongomock():
+    """
+    pymongo >= 4.9 passes sort= through UpdateOne to the bulk builder, which
+    mongomock 4.x doesn't take. it's always None for us, drop it.
+    """
+    from mongomock.collection import BulkOperationBuilder
+
+    add_update = BulkOperationBuilder.add_update
+
+    def compat(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+
+    BulkOperationBuilder.add_update = compat
@@ -0,0 +1,90 @@
+"""
+cold import time of the API (or any module) with python -X importtime, plus a check
+that importing it has no side effects: no signal handlers, no Qdrant clients, no
+Gemini setup. exits 1 over budget or on a side effect, so CI can run it.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --module services.worker --budget-ms 1500 --top 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs in the child after the import, prints one line per problem
+SIDE_EFFECTS = """
+import signal, sys
+import services.vector_store as vector_store
+import services.genai_client as genai_client
+if signal.getsignal(signal.SIGINT) is not signal.default_int_handler:
+    print("SIGINT handler installed on import")
+if signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL:
+    print("SIGTERM handler installed on import")
+if vector_store._qdrant is not None or vector_store._async_qdrant is not None:
+    print("Qdrant client created on import")
+if genai_client._genai is not None or "google.generativeai" in sys.modules:
+    print("google.generativeai imported on import")
+"""
+
+
+def profile(module: str) -> Tuple[float, List[Tuple[str, int, int]], List[str]]:
+    """(total ms, [(module, self us, cumulative us)], side effects) for one cold import"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}\n{SIDE_EFFECTS}"],
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr[-2000:])
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    total = next(cumulative for name, _, cumulative in rows if name == module)
+    return total / 1000, rows, proc.stdout.split("\n")[:-1]
+
+
+def by_package(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """self time summed per top level package, what to go after first"""
+    totals: Dict[str, int] = {}
+    for name, self_us, _ in rows:
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=2000)
+    parser.add_argument("--repeat", type=int, default=3, help="cold imports, the fastest counts")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [profile(args.module) for _ in range(args.repeat)]
+    total, rows, side_effects = min(runs, key=lambda run: run[0])
+
+    print(f"import {args.module}: {total:.0f}ms (best of {args.repeat}, budget {args.budget_ms:.0f}ms)\n")
+    print("slowest packages (self time):")
+    for package, self_us in sorted(by_package(rows).items(), key=lambda item: -item[1])[: args.top]:
+        print(f"  {self_us / 1000:8.1f}ms  {package}")
+
+    failed = False
+    for problem in side_effects:
+        print(f"side effect: {problem}")
+        failed = True
+    if total > args.budget_ms:
+        print(f"\nover budget by {total - args.budget_ms:.0f}ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
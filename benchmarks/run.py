@@ -0,0 +1,362 @@
+"""
+end to end benchmark: process_embeddings and POST /chat against a synthetic RVTools
+dataset, with Gemini faked in-process, an in-memory Qdrant (or the local numpy
+backend) and mongomock. pass --mongo-uri / --qdrant-url to use real local servers.
+the in-memory Qdrant only takes one writer, so upserts run serially with it.
+
+    python -m benchmarks.run --rows 10000 --embed-latency-ms 120 --rate-limit 0.02
+    python -m benchmarks.run --rows 100000 --batch-size 50 --embed-workers 8 --chat-requests 0
+
+every run writes a json file to benchmarks/results/ (git sha, settings, numbers),
+compare runs with python -m benchmarks.compare.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+BENCH_DATASET_ID = 900001
+
+# flag -> env var it sets, so runs can sweep the knobs we actually tune
+KNOBS = {
+    "batch_size": "EMBED_PIPELINE_BATCH_SIZE",
+    "embed_workers": "EMBED_EMBED_WORKERS",
+    "write_workers": "EMBED_WRITE_WORKERS",
+    "prepare_workers": "EMBED_PREPARE_WORKERS",
+    "prepare_processes": "EMBED_PREPARE_PROCESSES",
+    "upsert_chunk": "QDRANT_UPSERT_BATCH_SIZE",
+    "embed_engine": "EMBED_ENGINE",
+    "dims": "EMBED_DIMENSIONS",
+}
+
+# write concurrency forced to 1 for the in-memory qdrant
+SERIAL_WRITES = ("QDRANT_UPSERT_PARALLELISM", "EMBED_WRITE_WORKERS")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, Any]:
+    return {
+        "count": len(seconds),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 2),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 2),
+        "max_ms": round(max(seconds) * 1000, 2) if seconds else 0.0,
+    }
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is KiB on linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def git_revision() -> Dict[str, Any]:
+    def git(*args):
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, cwd=os.path.dirname(__file__)
+        ).stdout.strip()
+
+    try:
+        return {"sha": git("rev-parse", "--short", "HEAD"), "dirty": bool(git("status", "--porcelain", "-uno"))}
+    except OSError:
+        return {"sha": None, "dirty": None}
+
+
+class Recorder:
+    """wraps a function and keeps how long each call took"""
+
+    def __init__(self, fn: Callable):
+        self.fn = fn
+        self.seconds: List[float] = []
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.seconds.append(elapsed)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="embed + chat benchmark with faked Gemini")
+    parser.add_argument("--rows", type=int, default=10000, help="VM rows (hosts are ~rows/25)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=["qdrant", "local"], default="qdrant")
+    parser.add_argument("--qdrant-url", default=None, help="real Qdrant instead of :memory:")
+    parser.add_argument("--mongo-uri", default=None, help="real (throwaway!) Mongo instead of mongomock")
+    parser.add_argument("--embed-latency-ms", type=float, default=100)
+    parser.add_argument("--embed-per-item-ms", type=float, default=2, help="extra latency per text in a batch request")
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of fake Gemini calls answered with a 429")
+    parser.add_argument("--incremental", action="store_true", help="also time an incremental re-run (everything unchanged)")
+    parser.add_argument("--chat-requests", type=int, default=50)
+    parser.add_argument("--chat-concurrency", type=int, default=1)
+    for flag, env in KNOBS.items():
+        parser.add_argument(f"--{flag.replace('_', '-')}", dest=flag, default=None, help=f"sets {env}")
+    parser.add_argument("--set", action="append", default=[], metavar="ENV=VALUE", help="any other config env var")
+    parser.add_argument("--out", default=None, help=f"result file (default: {RESULTS_DIR}/<time>-<sha>.json)")
+    return parser.parse_args()
+
+
+def configure_env(args) -> Dict[str, str]:
+    """Config reads the environment on import, so this has to run before any services import"""
+    env = {
+        "VECTOR_BACKEND": args.backend,
+        "QDRANT_COLLECTION": "bench_vectors",
+        "EMBED_DIMENSIONS": "768",
+        "EMBED_CACHE_ENABLED": "false",
+        "DATASET_VERSION_PURGE_DELAY_SECONDS": "0",
+        "EMBED_INPROCESS_WORKER": "false",
+        "MONGO_DB": "exempla_bench",
+        "GOOGLE_API_KEY": "fake",
+    }
+    if args.backend == "local":
+        env["LOCAL_VECTOR_PATH"] = tempfile.mkdtemp(prefix="exempla-bench-")
+    if args.qdrant_url:
+        env["QDRANT_URL"] = args.qdrant_url
+    if args.mongo_uri:
+        env["MONGO_URI"] = args.mongo_uri
+    else:
+        # mongomock can't hand out RawBSONDocuments, keep prep on threads
+        env["EMBED_PREPARE_PROCESSES"] = "0"
+    for flag, name in KNOBS.items():
+        value = getattr(args, flag)
+        if value is not None:
+            env[name] = str(value)
+    for item in args.set:
+        key, _, value = item.partition("=")
+        env[key] = value
+    if args.backend == "qdrant" and not args.qdrant_url:
+        # qdrant's in-memory local mode isn't thread safe, concurrent upserts corrupt
+        # it ("index N is out of bounds"). one writer, timings are still comparable
+        for name in SERIAL_WRITES:
+            if env.get(name, "1") != "1":
+                print(f"in-memory qdrant: ignoring {name}={env[name]}, it only takes one writer")
+            env[name] = "1"
+    os.environ.update(env)
+    return env
+
+
+def setup_stores(args):
+    import services.mongo as mongo
+    import services.vector_store as vector_store
+
+    if not args.mongo_uri:
+        import mongomock
+
+        from benchmarks.fakes import patch_mongomock
+
+        patch_mongomock()
+        mongo._client = mongomock.MongoClient()
+    if args.backend == "qdrant" and not args.qdrant_url:
+        from qdrant_client import QdrantClient
+
+        vector_store._qdrant = QdrantClient(":memory:")
+    vector_store.ensure_collection()
+    vector_store.ensure_payload_indexes()
+
+
+def load_dataset(args) -> Dict[str, Any]:
+    from benchmarks.synthetic import generate
+    from services.config import Config
+    from services.mongo import get_mongo_client
+
+    db = get_mongo_client()[Config.MONGO_DB]
+    cleanup_dataset()
+    start = time.perf_counter()
+    counts = {"vm": 0, "host": 0}
+    for kind, rows in generate(BENCH_DATASET_ID, args.rows, seed=args.seed):
+        db[f"rvtools_{kind}s"].insert_many(rows, ordered=False)
+        counts[kind] += len(rows)
+    return {"vms": counts["vm"], "hosts": counts["host"], "seconds": round(time.perf_counter() - start, 2)}
+
+
+def cleanup_dataset():
+    from services.config import Config
+    from services.mongo import get_mongo_client
+
+    client = get_mongo_client()
+    for name in ("rvtools_vms", "rvtools_hosts"):
+        client[Config.MONGO_DB][name].delete_many({"dataset_id": BENCH_DATASET_ID})
+    for name in ("embedding_status", "embedding_fingerprints"):
+        client.exempla[name].delete_many({"dataset_id": BENCH_DATASET_ID})
+
+
+def bench_embed(incremental: bool) -> Dict[str, Any]:
+    import services.embed_job as embed_job
+
+    embed = Recorder(embed_job.batch_embed_texts)
+    upsert = Recorder(embed_job.batch_upsert_vectors)
+    embed_job.batch_embed_texts, embed_job.batch_upsert_vectors = embed, upsert
+    try:
+        start = time.perf_counter()
+        outcome = embed_job.process_embeddings(BENCH_DATASET_ID, incremental=incremental)
+        seconds = time.perf_counter() - start
+    finally:
+        embed_job.batch_embed_texts, embed_job.batch_upsert_vectors = embed.fn, upsert.fn
+
+    status = embed_job.get_mongo_client().exempla.embedding_status.find_one(
+        {"dataset_id": BENCH_DATASET_ID}
+    ) or {}
+    rows = (status.get("processed_items") or 0) + (status.get("unchanged_items") or 0)
+    return {
+        "outcome": outcome,
+        "seconds": round(seconds, 2),
+        "rows_per_second": round(rows / seconds, 1) if seconds else 0.0,
+        "processed": status.get("processed_items"),
+        "skipped": status.get("skipped_items"),
+        "unchanged": status.get("unchanged_items"),
+        "embed_batch": latency_summary(embed.seconds),
+        "upsert_batch": latency_summary(upsert.seconds),
+    }
+
+
+def bench_chat(requests: int, concurrency: int, rows: int, seed: int) -> Dict[str, Any]:
+    import random
+
+    from fastapi.testclient import TestClient
+
+    import main
+
+    rng = random.Random(seed)
+    templates = [
+        "What host is vm-{n:07d} running on and how much memory does it have?",
+        "Which VMs in cluster dc-0{dc}-cl0{cl} are powered off?",
+        "Show me the Windows Server 2022 VMs on network VLAN{vlan}",
+        "Is vm-{n:07d} thin provisioned?",
+    ]
+    prompts = [
+        rng.choice(templates).format(
+            n=rng.randrange(max(rows, 1)), dc=rng.randint(1, 3), cl=rng.randint(1, 8), vlan=rng.randint(100, 999)
+        )
+        for _ in range(requests)
+    ]
+    client = TestClient(main.app)
+    phases: Dict[str, List[float]] = {}
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def ask(prompt: str):
+        start = time.perf_counter()
+        response = client.post("/chat/", json={"dataset_id": BENCH_DATASET_ID, "user_prompt": prompt})
+        elapsed = time.perf_counter() - start
+        response.raise_for_status()
+        with lock:
+            latencies.append(elapsed)
+            for part in response.headers.get("server-timing", "").split(","):
+                name, _, dur = part.strip().partition(";dur=")
+                if dur:
+                    phases.setdefault(name, []).append(float(dur) / 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        list(pool.map(ask, prompts))
+    seconds = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": round(seconds, 2),
+        "requests_per_second": round(requests / seconds, 2) if seconds else 0.0,
+        "latency": latency_summary(latencies),
+        "phases": {name: latency_summary(values) for name, values in phases.items()},
+    }
+
+
+def print_report(result: Dict[str, Any]):
+    print(f"\ndataset: {result['dataset']['vms']} VMs, {result['dataset']['hosts']} hosts")
+    for name in ("embed_full", "embed_incremental"):
+        embed = result.get(name)
+        if embed:
+            print(
+                f"{name}: {embed['outcome']} in {embed['seconds']}s, {embed['rows_per_second']} rows/s | "
+                f"embed batch p50 {embed['embed_batch']['p50_ms']}ms p99 {embed['embed_batch']['p99_ms']}ms | "
+                f"upsert batch p50 {embed['upsert_batch']['p50_ms']}ms p99 {embed['upsert_batch']['p99_ms']}ms"
+            )
+    chat = result.get("chat")
+    if chat:
+        print(
+            f"chat: {chat['requests_per_second']} req/s, p50 {chat['latency']['p50_ms']}ms "
+            f"p99 {chat['latency']['p99_ms']}ms"
+        )
+        for name, phase in chat["phases"].items():
+            print(f"  {name:<10} p50 {phase['p50_ms']}ms p99 {phase['p99_ms']}ms")
+    print(f"fake gemini: {result['fake_gemini']}")
+    print(f"peak rss (MB): {result['peak_rss_mb']}")
+
+
+def main():
+    args = parse_args()
+    env = configure_env(args)
+
+    from benchmarks.fakes import Behaviour, FakeEmbeddings, install
+
+    embed_behaviour = Behaviour(args.embed_latency_ms, args.jitter_ms, args.rate_limit, args.seed)
+    chat_behaviour = Behaviour(args.llm_latency_ms, args.jitter_ms, args.rate_limit, args.seed + 1)
+    install(
+        FakeEmbeddings(embed_behaviour, int(env["EMBED_DIMENSIONS"]), args.embed_per_item_ms),
+        chat_behaviour,
+    )
+    setup_stores(args)
+
+    result: Dict[str, Any] = {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "args": vars(args),
+        "env": env,
+    }
+    try:
+        result["dataset"] = load_dataset(args)
+        result["embed_full"] = bench_embed(incremental=False)
+        if args.incremental:
+            result["embed_incremental"] = bench_embed(incremental=True)
+        if args.chat_requests:
+            result["chat"] = bench_chat(args.chat_requests, args.chat_concurrency, args.rows, args.seed)
+    finally:
+        cleanup_dataset()
+        from services.prepare import shutdown_prepare_pool
+
+        shutdown_prepare_pool()
+        if "LOCAL_VECTOR_PATH" in env:
+            shutil.rmtree(env["LOCAL_VECTOR_PATH"], ignore_errors=True)
+
+    result["fake_gemini"] = {"embed": embed_behaviour.stats(), "chat": chat_behaviour.stats()}
+    result["peak_rss_mb"] = peak_rss_mb()
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"{datetime.utcnow():%Y%m%d-%H%M%S}-{result['git']['sha'] or 'nogit'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2, default=str)
+
+    print_report(result)
+    print(f"saved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+synthetic RVTools rows shaped like models.rvtools_vms.VMSchema and
+models.rvtools_hosts.HostSchema, for benchmarks. deterministic for a given seed.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List
+
+_OS = [
+    ("Microsoft Windows Server 2019 (64-bit)", "Microsoft Windows Server 2019 (64-bit)"),
+    ("Microsoft Windows Server 2022 (64-bit)", "Microsoft Windows Server 2022 (64-bit)"),
+    ("Red Hat Enterprise Linux 8 (64-bit)", "Red Hat Enterprise Linux 8.6 (64-bit)"),
+    ("Ubuntu Linux (64-bit)", "Ubuntu 22.04.3 LTS"),
+    ("Microsoft Windows 10 (64-bit)", "Microsoft Windows 10 Enterprise"),
+    ("Other 3.x or later Linux (64-bit)", None),
+]
+_POWER = ["poweredOn"] * 8 + ["poweredOff", "suspended"]
+_POOLS = ["Resources", "prod", "dev", "test", "vdi", None]
+_VENDORS = [("Dell Inc.", "PowerEdge R750"), ("HPE", "ProLiant DL380 Gen10"), ("Lenovo", "ThinkSystem SR650")]
+_CPUS = ["Intel(R) Xeon(R) Gold 6338 CPU @ 2.00GHz", "AMD EPYC 7543 32-Core Processor"]
+_ESX = ["VMware ESXi 7.0.3 build-21686933", "VMware ESXi 8.0.1 build-22088125"]
+
+
+def hosts_for(vm_rows: int) -> int:
+    """roughly 25 VMs a host, like the exports we usually get"""
+    return max(vm_rows // 25, 1)
+
+
+def _topology(host_index: int):
+    datacenter = f"dc-{host_index % 3 + 1:02d}"
+    cluster = f"{datacenter}-cl{host_index % 8 + 1:02d}"
+    vcenter = f"vc{host_index % 2 + 1:02d}.corp.example"
+    return datacenter, cluster, vcenter
+
+
+def host_row(rng: random.Random, dataset_id: int, i: int, created_at: datetime) -> Dict[str, Any]:
+    datacenter, cluster, vcenter = _topology(i)
+    vendor, model = rng.choice(_VENDORS)
+    cpus = 2
+    cores = rng.choice([32, 48, 64])
+    memory_gb = rng.choice([512, 768, 1024])
+    vms = rng.randint(10, 40)
+    desktop = rng.randint(0, vms // 4)
+    return {
+        "dataset_id": dataset_id,
+        "host": f"esx{i:05d}.corp.example",
+        "host_hash": f"{rng.getrandbits(64):016x}",
+        "datacenter": datacenter,
+        "cluster": cluster,
+        "vcenter": vcenter,
+        "vendor": vendor,
+        "model": model,
+        "cpu_model": rng.choice(_CPUS),
+        "cpus": cpus,
+        "cores": cores,
+        "vcpus": rng.randint(cores, cores * 6),
+        "speed": rng.choice([2000.0, 2800.0, 3000.0]),
+        "memory": memory_gb * 1024,
+        "memory_gb": memory_gb,
+        "nics": rng.choice([2, 4, 6]),
+        "hbas": rng.choice([0, 2]),
+        "cpu_usage": round(rng.uniform(5, 90), 1),
+        "memory_usage": round(rng.uniform(20, 95), 1),
+        "vms": vms,
+        "desktop_vms": desktop,
+        "server_vms": vms - desktop,
+        "vram": rng.randint(10000, memory_gb * 1024),
+        "esx_version": rng.choice(_ESX),
+        "ht_active": rng.random() < 0.9,
+        "collection": "rvtools_hosts",
+        "created_at": created_at,
+    }
+
+
+def vm_row(
+    rng: random.Random, dataset_id: int, i: int, hosts: int, created_at: datetime
+) -> Dict[str, Any]:
+    host_index = rng.randrange(hosts)
+    datacenter, cluster, vcenter = _topology(host_index)
+    config_os, tools_os = rng.choice(_OS)
+    disks = rng.randint(1, 4)
+    capacity = [float(rng.choice([40960, 81920, 102400, 512000])) for _ in range(disks)]
+    provisioned = sum(capacity) + rng.uniform(0, 8192)
+    in_use = provisioned * rng.uniform(0.2, 0.9)
+    memory = rng.choice([2048, 4096, 8192, 16384, 32768])
+    name = f"vm-{i:07d}"
+    networks = [f"VLAN{rng.randint(100, 999)}" for _ in range(rng.randint(1, 2))]
+    return {
+        "dataset_id": dataset_id,
+        "vm": name,
+        "vm_hash": f"{rng.getrandbits(64):016x}",
+        "host": f"esx{host_index:05d}.corp.example",
+        "cluster": cluster,
+        "datacenter": datacenter,
+        "vcenter": vcenter,
+        "path": f"[ds{rng.randint(1, 60):03d}] {name}/{name}.vmx",
+        "resource_pool": rng.choice(_POOLS),
+        "powerstate": rng.choice(_POWER),
+        "created_at": created_at,
+        "cpus": rng.choice([1, 2, 4, 8, 16]),
+        "memory": memory,
+        "memory_gb": memory // 1024,
+        "disks": disks,
+        "nics": len(networks),
+        "provisioned_mib": provisioned,
+        "provisioned_gb": None,
+        "in_use_mib": in_use,
+        "in_use_gb": None,
+        "consumed_mib": in_use * rng.uniform(0.5, 1.0),
+        "capacity_mib": capacity,
+        "network": networks,
+        "switch": [f"dvs-{cluster}"],
+        "config_os": config_os,
+        "vm_tools_os": tools_os,
+        "phys_cores_used": round(rng.uniform(0, 4), 2),
+        "phys_ram_used": round(rng.uniform(0, memory / 1024), 2),
+        "is_desktop": "Windows 10" in config_os,
+        "thin": [rng.random() < 0.7 for _ in range(disks)],
+        "collection": "rvtools_vms",
+    }
+
+
+def generate(
+    dataset_id: int, vm_rows: int, seed: int = 0, chunk_size: int = 10000
+) -> Iterator[tuple]:
+    """yields ("host" | "vm", [rows]) in chunks so 1M rows never sit in memory at once"""
+    rng = random.Random(seed)
+    created_at = datetime(2024, 5, 1) + timedelta(seconds=seed)
+    hosts = hosts_for(vm_rows)
+    for start in range(0, hosts, chunk_size):
+        yield "host", [
+            host_row(rng, dataset_id, i, created_at)
+            for i in range(start, min(start + chunk_size, hosts))
+        ]
+    for start in range(0, vm_rows, chunk_size):
+        yield "vm", [
+            vm_row(rng, dataset_id, i, hosts, created_at)
+            for i in range(start, min(start + chunk_size, vm_rows))
+        ]
+
+
+def sample(kind: str, count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """a handful of rows without the rest of the dataset"""
+    rng = random.Random(seed)
+    created_at = datetime(2024, 5, 1)
+    if kind == "host":
+        return [host_row(rng, 1, i, created_at) for i in range(count)]
+    return [vm_row(rng, 1, i, hosts_for(count), created_at) for i in range(count)]
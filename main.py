@@ -1,15 +1,50 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Response, status
 from routes.embed import router as embed_router
 from routes.chat import router as chat_router
-import google.generativeai as genai
 
-from services.mongo import get_mongo_client
+from services.health import readiness, start_startup_thread
+from services.mongo import close_mongo_client, get_mongo_client
+from services.prepare import shutdown_prepare_pool
+from services.task_manager import task_manager
+from services.worker import start_background_worker
 from services.config import Config
-from services.embedding import embed_text
-from services.llm import generate_chat_response
-from services.vector_store import qdrant
+from services.metrics import render_metrics
+from services.vector_store import close_qdrant_clients, get_vector_backend
 
-app = FastAPI(title="Exempla AI")
+cfg = Config()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # MongoClient connects in the background, building it here just gets the pool going
+    get_mongo_client()
+    # indexes and the Qdrant collection are set up off the event loop and retried,
+    # /readyz reports when they're done
+    startup_stop = threading.Event()
+    start_startup_thread(startup_stop)
+
+    # normally embedding runs in separate worker processes (python -m services.worker),
+    # which also pick up interrupted jobs when they start
+    if cfg.EMBED_INPROCESS_WORKER:
+        start_background_worker()
+    yield
+
+    # uvicorn has drained HTTP by now. under serve.py background jobs were told to stop
+    # when the signal came in, otherwise this starts the drain deadline
+    startup_stop.set()
+    task_manager.request_shutdown()
+    # off the event loop, so this never stalls anything still being served
+    await asyncio.to_thread(task_manager.wait_for_tasks)
+    shutdown_prepare_pool()
+    close_mongo_client()
+    get_vector_backend().close()
+    await close_qdrant_clients()
+
+
+app = FastAPI(title="Exempla AI", lifespan=lifespan)
 
 app.include_router(embed_router, prefix="/embed", tags=["embedding"])
 app.include_router(chat_router, prefix="/chat", tags=["chat"])
@@ -17,4 +52,29 @@ app.include_router(chat_router, prefix="/chat", tags=["chat"])
 
 @app.get("/")
 def health_check():
-    return {"message": "Exempla AI is taking over"}
\ No newline at end of file
+    return {"message": "Exempla AI is taking over"}
+
+
+@app.get("/healthz", include_in_schema=False)
+def liveness():
+    """
+    liveness: the process is up and serving. deliberately doesn't touch Mongo or
+    Qdrant, an outage there shouldn't get every pod restarted
+    """
+    return {"status": "ok"}
+
+
+@app.get("/readyz", include_in_schema=False)
+def readyz(response: Response):
+    """readiness: startup setup is done and Mongo and the vector store answer"""
+    ready, checks = readiness()
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status": "ready" if ready else "not ready", "checks": checks}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """prometheus scrape endpoint"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
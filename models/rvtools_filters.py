@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict
 
 
@@ -32,6 +32,8 @@ class InfrastructureFilterOptions(BaseModel):
 
 
 class FilterOptions(BaseModel):
-    host_filters: HostFilterOptions
-    vm_filters: VmFilterOptions
-    infrastructure_filters: InfrastructureFilterOptions
+    host_filters: HostFilterOptions = Field(default_factory=HostFilterOptions)
+    vm_filters: VmFilterOptions = Field(default_factory=VmFilterOptions)
+    infrastructure_filters: InfrastructureFilterOptions = Field(
+        default_factory=InfrastructureFilterOptions
+    )
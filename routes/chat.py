@@ -1,9 +1,28 @@
-from fastapi import APIRouter, Body
-from services.embedding import embed_text
-from services.vector_store import search_vectors
-from services.llm import generate_chat_response
+import asyncio
+import json
+from fastapi import APIRouter, Body, Response
+from fastapi.responses import StreamingResponse
+from services.query_cache import (
+    acached_search_vectors,
+    aget_query_embedding,
+    cache_stats,
+    cached_search_vectors,
+    get_query_embedding,
+)
+from services.aggregation import answer_aggregate
+from services.config import Config
+from services.llm import (
+    build_aggregate_prompt,
+    build_chat_prompt,
+    call_llm,
+    generate_chat_response,
+    LLMStreamError,
+    stream_llm,
+)
+from services.metrics import RequestTimings
 from typing import Dict
 
+cfg = Config()
 router = APIRouter()
 
 
@@ -13,25 +32,131 @@ def chat_with_dataset(
     user_prompt: str = Body(...),
     filter_options: Dict = Body({}),
     top_k: int = Body(5),
+    search_mode: str = Body(cfg.SEARCH_MODE),
+    response: Response = None,
 ):
     """
+    0. Counting/sizing questions ("how many powered-on VMs per cluster") are computed
+       with a MongoDB aggregation and the LLM only phrases the result.
     1. Embed user prompt.
-    2. Search top_k docs in Qdrant filtered by dataset_id.
+    2. Search top_k docs in Qdrant filtered by dataset_id and filter_options.
+       search_mode "hybrid" also matches VM/host names, hashes, paths and networks
+       exactly (sparse vectors) and fuses that with the dense ranking.
     3. Call Google LLM with context + filter_options + user prompt.
-    4. Return LLM response (which might suggest filters or more Qs).
+    4. Return LLM response (which might suggest filters or more Qs), plus the
+       prompt token count and how many docs fit in the context budget.
+    Time spent per step comes back in a Server-Timing header.
     """
+    timings = RequestTimings()
 
-    query_vector = embed_text(user_prompt)
-    docs = search_vectors(query_vector, dataset_id=dataset_id, top_k=top_k)
+    with timings.phase("aggregate"):
+        aggregation = answer_aggregate(dataset_id, user_prompt)
+    if aggregation is not None:
+        with timings.phase("llm"):
+            response_text = call_llm(build_aggregate_prompt(user_prompt, aggregation))
+        response.headers["Server-Timing"] = timings.header()
+        return {"response": response_text, "aggregation": aggregation}
 
-    # Log what we got from the vector store
-    print(f"Retrieved {len(docs)} documents from vector store")
-    for i, doc in enumerate(docs):
-        print(f"Document {i+1} - Score: {doc.get('score')}")
-        print(f"  Content length: {len(doc.get('content', ''))}")
-        print(f"  Metadata keys: {list(doc.get('metadata', {}).keys())}")
+    with timings.phase("embed"):
+        query_vector = get_query_embedding(user_prompt)
+    with timings.phase("search"):
+        docs = cached_search_vectors(
+            query_vector,
+            dataset_id=dataset_id,
+            top_k=top_k,
+            filters=filter_options,
+            mode=search_mode,
+            query_text=user_prompt,
+        )
 
+    print(f"Retrieved {len(docs)} documents from vector store")
 
     # docs is a list of nearest matches with metadata
-    response_text = generate_chat_response(user_prompt, docs, filter_options)
-    return {"response": response_text}
+    with timings.phase("llm"):
+        response_text, usage = generate_chat_response(user_prompt, docs, filter_options)
+    response.headers["Server-Timing"] = timings.header()
+    return {"response": response_text, "usage": usage}
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def _stream_answer(prompt: str):
+    """token events for the answer, or an error event if the stream breaks off"""
+    try:
+        async for text in stream_llm(prompt):
+            yield _sse("token", {"text": text})
+    except LLMStreamError as e:
+        yield _sse("error", {"message": str(e)})
+
+
+@router.post("/stream")
+async def chat_with_dataset_stream(
+    dataset_id: int = Body(...),
+    user_prompt: str = Body(...),
+    filter_options: Dict = Body({}),
+    top_k: int = Body(5),
+    search_mode: str = Body(cfg.SEARCH_MODE),
+):
+    """
+    Same as POST /chat but fully async, and the answer is streamed back as
+    Server-Sent Events while the LLM generates it:
+    - "aggregation": the computed result, for counting/sizing questions
+    - "sources": how many docs were retrieved, their scores and the prompt usage
+    - "token": a chunk of answer text
+    - "error": the answer broke off (blocked by the model's safety filters or the
+      call failed), "done" still follows
+    - "done": end of the answer, with the time spent per step in ms (headers are
+      long gone by then, so no Server-Timing here)
+    """
+
+    async def events():
+        timings = RequestTimings()
+        with timings.phase("aggregate"):
+            aggregation = await asyncio.to_thread(answer_aggregate, dataset_id, user_prompt)
+        if aggregation is not None:
+            yield _sse("aggregation", aggregation)
+            with timings.phase("llm"):
+                async for event in _stream_answer(build_aggregate_prompt(user_prompt, aggregation)):
+                    yield event
+            yield _sse("done", {"timings": timings.as_ms()})
+            return
+
+        with timings.phase("embed"):
+            query_vector = await aget_query_embedding(user_prompt)
+        with timings.phase("search"):
+            docs = await acached_search_vectors(
+                query_vector,
+                dataset_id=dataset_id,
+                top_k=top_k,
+                filters=filter_options,
+                mode=search_mode,
+                query_text=user_prompt,
+            )
+        prompt, usage = build_chat_prompt(user_prompt, docs, filter_options)
+        yield _sse(
+            "sources",
+            {
+                "count": len(docs),
+                "scores": [doc.get("score") for doc in docs],
+                "usage": usage,
+            },
+        )
+        with timings.phase("llm"):
+            async for event in _stream_answer(prompt):
+                yield event
+        yield _sse("done", {"timings": timings.as_ms()})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # stop proxies (nginx) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    """hit rates for the query embedding and search result caches"""
+    return cache_stats()
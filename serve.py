@@ -0,0 +1,42 @@
+"""
+production entry point: python serve.py [--host 0.0.0.0] [--port 8000]
+
+plain uvicorn only runs the app's lifespan shutdown after it has finished draining
+HTTP, so background jobs (EMBED_INPROCESS_WORKER) would only start stopping then.
+this tells them on the signal itself, so requests and jobs drain side by side,
+both within SHUTDOWN_DRAIN_SECONDS. /readyz turns 503 at the same moment.
+`uvicorn main:app` still works (and --reload is for that), shutdown is just slower.
+"""
+import argparse
+
+import uvicorn
+
+from services.config import Config
+from services.task_manager import task_manager
+
+cfg = Config()
+
+
+class DrainingServer(uvicorn.Server):
+    def handle_exit(self, sig, frame):
+        task_manager.request_shutdown()
+        super().handle_exit(sig, frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run the API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    config = uvicorn.Config(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        timeout_graceful_shutdown=int(cfg.SHUTDOWN_DRAIN_SECONDS),
+    )
+    DrainingServer(config).run()
+
+
+if __name__ == "__main__":
+    main()
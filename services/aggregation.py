@@ -0,0 +1,355 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+from services.config import Config
+from services.mongo import get_mongo_client
+from services.query_cache import TTLCache, dataset_epoch
+
+cfg = Config()
+
+
+class AggregateIntent(BaseModel):
+    """a counting/sizing question boiled down to something mongo can compute"""
+
+    kind: str  # "vm" or "host"
+    op: str  # count, sum, avg, max, min
+    field: Optional[str] = None
+    group_by: Optional[str] = None
+    match: Dict[str, Any] = Field(default_factory=dict)
+    # groups come out largest value first unless this is set
+    ascending: bool = False
+
+
+COLLECTIONS = {"vm": "rvtools_vms", "host": "rvtools_hosts"}
+
+# MiB/MB fields get reported in GB
+_GB_FIELDS = {"provisioned_mib", "in_use_mib", "consumed_mib", "memory"}
+
+# checked in order, first hit wins. max/min come before "number of" so "max number
+# of vcpus" is a max, and count before sum so "total number of VMs" is a count
+_OPS = [
+    (r"\b(average|avg|mean)\b", "avg"),
+    (r"\b(max|maximum|largest|biggest|highest|most)\b", "max"),
+    (r"\b(min|minimum|smallest|lowest|least|fewest)\b", "min"),
+    (r"\b(how many|count|number of)\b", "count"),
+    (r"\b(total|sum|overall|combined)\b", "sum"),
+]
+
+# (pattern, field) checked in order, first hit wins
+_VM_MEASURES = [
+    (r"\bprovisioned\b", "provisioned_mib"),
+    (r"\b(in[- ]use|used)\b", "in_use_mib"),
+    (r"\bconsumed\b", "consumed_mib"),
+    (r"\b(memory|ram)\b", "memory"),
+    (r"\b(vcpus?|cpus?)\b", "cpus"),
+    (r"\bdisks?\b", "disks"),
+    (r"\bnics?\b", "nics"),
+]
+_HOST_MEASURES = [
+    (r"\bcpu usage\b", "cpu_usage"),
+    (r"\bmemory usage\b", "memory_usage"),
+    (r"\b(memory|ram)\b", "memory"),
+    (r"\bvcpus?\b", "vcpus"),
+    (r"\bcores?\b", "cores"),
+    (r"\b(cpus?|cpu packages?|sockets?)\b", "cpus"),
+    (r"\bnics?\b", "nics"),
+    (r"\bhbas?\b", "hbas"),
+    (r"\bdesktop vms\b", "desktop_vms"),
+    (r"\bserver vms\b", "server_vms"),
+    (r"\bvms\b", "vms"),
+]
+
+_GROUP_BYS = [
+    (r"clusters?", "cluster"),
+    (r"datacenters?|data centers?|dcs?", "datacenter"),
+    (r"vcenters?", "vcenter"),
+    (r"hosts?", "host"),
+    (r"os|operating systems?", "config_os"),
+    (r"power ?states?|states?", "powerstate"),
+    (r"vendors?", "vendor"),
+    (r"models?", "model"),
+    (r"esx(i)? versions?|versions?", "esx_version"),
+]
+
+# ranked with avg rather than sum in "which cluster has the highest cpu usage"
+_PERCENT_FIELDS = {"cpu_usage", "memory_usage"}
+
+_VM_WORDS = r"vms?|virtual machines?|guests?"
+_HOST_WORDS = r"hosts?|esxi?"
+
+_SCOPES = ("cluster", "datacenter", "vcenter", "host")
+# words that can follow "cluster"/"host" etc. without being a name
+_NOT_NAMES = {
+    "is", "are", "has", "have", "with", "in", "and", "or", "count", "counts",
+    "total", "memory", "cpu", "cpus", "cores", "usage", "level", "name", "names",
+    "named", "called", "the", "a", "that", "which", "what", "same", "other", "each",
+    "every", "any", "this", "these", "those",
+}
+
+# words that may be left over once the parse is done. anything else (a name, a
+# number, "more than", "vmware tools", "named") is a constraint the intent doesn't
+# capture, and a dataset-wide number would answer a different question
+_FILLER = {
+    "how", "much", "what", "what's", "whats", "is", "are", "was", "were", "be",
+    "the", "a", "an", "of", "in", "on", "across", "at", "for", "to", "from",
+    "do", "does", "did", "we", "i", "you", "me", "us", "there", "have", "has",
+    "had", "got", "with", "and", "all", "our", "my", "your", "this", "its", "it",
+    "dataset", "data", "environment", "inventory", "infrastructure", "entire",
+    "whole", "altogether", "together", "total", "overall", "combined", "sum",
+    "number", "count", "amount", "value", "please", "can", "tell", "show",
+    "give", "currently", "now", "gb", "mb", "gib", "mib",
+}
+
+_TOKEN = re.compile(r"\w[\w'.\-]*")
+
+
+class _Parse:
+    """regex searches over the question that remember which parts of it they used"""
+
+    def __init__(self, question: str):
+        self.question = question
+        self.spans: List[Tuple[int, int]] = []
+
+    def find(self, pattern: str, consume: bool = True) -> Optional[re.Match]:
+        found = re.search(pattern, self.question, re.I)
+        if found and consume:
+            self.spans.append(found.span())
+        return found
+
+    def first(self, patterns: List[Tuple[str, str]]) -> Optional[str]:
+        for pattern, value in patterns:
+            if self.find(pattern):
+                return value
+        return None
+
+    def consume_all(self, pattern: str):
+        self.spans.extend(found.span() for found in re.finditer(pattern, self.question, re.I))
+
+    def leftovers(self) -> List[str]:
+        words = []
+        for token in _TOKEN.finditer(self.question):
+            if any(start <= token.start() and token.end() <= end for start, end in self.spans):
+                continue
+            word = token.group().lower().rstrip(".-'")
+            if word and word not in _FILLER:
+                words.append(word)
+        return words
+
+
+def _scope_value(parse: _Parse, scope: str) -> Optional[str]:
+    """
+    "cluster prod-01", "cluster named 'prod'", "in the prod cluster", "on host esx07".
+    not "per cluster" / "by cluster", those are group bys
+    """
+    name = r"['\"]?([\w.\-]+)['\"]?"
+    for pattern in (
+        rf"(?<!per )(?<!by )(?<!each )\b{scope}\s+(?:named|called)\s+{name}",
+        rf"\b(?:in|on)\s+(?:the\s+)?{name}\s+{scope}\b",
+        rf"(?<!per )(?<!by )(?<!each )\b{scope}\s+{name}",
+    ):
+        found = parse.find(pattern, consume=False)
+        if found and found.group(1).lower() not in _NOT_NAMES:
+            parse.spans.append(found.span())
+            return found.group(1)
+    return None
+
+
+def _which_group(parse: _Parse) -> Tuple[bool, Optional[str]]:
+    """
+    "which host has ...", "which cluster has ...": (asked, what to group by). the
+    group by is None when "which" asks about something we can't group on
+    """
+    which = parse.find(rf"\bwhich\s+({_VM_WORDS}|\w+)\b", consume=False)
+    if which is None:
+        return False, None
+    target = which.group(1).lower()
+    group_by = "vm" if re.fullmatch(_VM_WORDS, target) else None
+    for pattern, value in _GROUP_BYS:
+        if group_by is None and re.fullmatch(pattern, target):
+            group_by = value
+    if group_by is not None:
+        parse.spans.append(which.span())
+    return True, group_by
+
+
+def parse_aggregate_intent(question: str) -> Optional[AggregateIntent]:
+    """
+    cheap keyword parse. returns None for anything that isn't clearly a
+    count/sum/avg style question so it goes down the normal RAG path, including
+    questions with a qualifier the parse doesn't understand.
+    """
+    parse = _Parse(question)
+
+    op = parse.first(_OPS)
+    if op is None:
+        return None
+
+    mentions_host = parse.find(rf"\b({_HOST_WORDS})\b", consume=False) is not None
+    mentions_vm = parse.find(rf"\b({_VM_WORDS})\b", consume=False) is not None
+    kind = "host" if mentions_host and not mentions_vm else "vm"
+
+    field = parse.first(_VM_MEASURES if kind == "vm" else _HOST_MEASURES)
+    if op == "count" and field is not None and parse.find(r"\bhow many\b", consume=False):
+        # "how many vCPUs ..." is asking for a total, not a row count
+        op = "sum"
+    # whatever else names the kind ("how many VMs") is used up by now, "host" in
+    # "how many VMs per host" is still there for the group by / scope below
+    parse.consume_all(rf"\b({_VM_WORDS if kind == 'vm' else _HOST_WORDS})\b")
+
+    ascending = op == "min"
+    asked_which, group_by = _which_group(parse)
+    if asked_which:
+        # "which host has the highest cpu usage": groups ranked by the value, the
+        # first one is the answer
+        highest = parse.find(_OPS[1][0])
+        lowest = parse.find(_OPS[2][0])
+        if group_by is None or bool(highest) == bool(lowest):
+            return None
+        ascending = lowest is not None
+        if field is None:
+            # "which cluster has the most VMs" ranks row counts
+            op = "count"
+        elif op != "avg" and group_by != kind:
+            # a cluster's memory is what its VMs add up to, usage is a percentage
+            op = "avg" if field in _PERCENT_FIELDS else "sum"
+        elif op != "avg":
+            # one row per vm / host, any accumulator gives its own value
+            op = "max"
+    else:
+        for pattern, value in _GROUP_BYS:
+            if parse.find(rf"\b(?:per|by|for each|each|grouped by)\s+(?:{pattern})\b"):
+                group_by = value
+                break
+
+    if op != "count" and field is None:
+        return None
+
+    match: Dict[str, Any] = {}
+    if kind == "vm":
+        if parse.find(r"\b(powered[- ]on|running)\b"):
+            match["powerstate"] = "poweredOn"
+        elif parse.find(r"\b(powered[- ]off|stopped)\b"):
+            match["powerstate"] = "poweredOff"
+        elif parse.find(r"\bsuspended\b"):
+            match["powerstate"] = "suspended"
+        if parse.find(r"\bdesktops?\b"):
+            match["is_desktop"] = True
+        os_match = parse.find(r"\b(windows|linux|ubuntu|centos|red hat|rhel|debian|suse)\b")
+        if os_match:
+            match["config_os"] = {"$regex": re.escape(os_match.group(1)), "$options": "i"}
+
+    for scope in _SCOPES:
+        if scope == group_by:
+            continue
+        value = _scope_value(parse, scope)
+        if value is not None:
+            match[scope] = value
+
+    # anything not understood ("more than 8 GB", "vmware tools installed", a VM
+    # name) narrows the question. answering it with a dataset-wide number would
+    # be confidently wrong, leave it to retrieval
+    leftovers = parse.leftovers()
+    if leftovers:
+        return None
+
+    return AggregateIntent(
+        kind=kind, op=op, field=field, group_by=group_by, match=match, ascending=ascending
+    )
+
+
+def compile_pipeline(dataset_id: int, intent: AggregateIntent) -> List[Dict[str, Any]]:
+    match = {"dataset_id": dataset_id, **intent.match}
+    if intent.op == "count":
+        accumulator = {"$sum": 1}
+    else:
+        accumulator = {f"${intent.op}": f"${intent.field}"}
+
+    return [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": f"${intent.group_by}" if intent.group_by else None,
+                "value": accumulator,
+                "rows": {"$sum": 1},
+            }
+        },
+        {"$sort": {"value": 1 if intent.ascending else -1}},
+        # one extra so run_aggregation can tell whether anything was cut off
+        {"$limit": cfg.AGGREGATION_MAX_GROUPS + 1},
+    ]
+
+
+def _describe(intent: AggregateIntent) -> str:
+    what = "row count" if intent.op == "count" else f"{intent.op} of {intent.field}"
+    if intent.op != "count" and intent.field in _GB_FIELDS:
+        what += " (GB)"
+    parts = [f"{what} over {intent.kind}s"]
+    if intent.match:
+        parts.append(f"where {json.dumps(intent.match, default=str)}")
+    if intent.group_by:
+        order = "lowest" if intent.ascending else "highest"
+        parts.append(f"grouped by {intent.group_by}, {order} value first")
+    return " ".join(parts)
+
+
+_result_cache = TTLCache(
+    cfg.AGGREGATION_CACHE_SIZE, cfg.AGGREGATION_CACHE_TTL_SECONDS, "aggregation"
+)
+
+
+def run_aggregation(dataset_id: int, intent: AggregateIntent) -> Dict[str, Any]:
+    key = (
+        dataset_id,
+        dataset_epoch(dataset_id),
+        json.dumps(intent.model_dump(), sort_keys=True, default=str),
+    )
+    cached = _result_cache.get(key)
+    if cached is not None:
+        return cached
+
+    db = get_mongo_client()[cfg.MONGO_DB]
+    rows = list(db[COLLECTIONS[intent.kind]].aggregate(compile_pipeline(dataset_id, intent)))
+
+    to_gb = intent.op != "count" and intent.field in _GB_FIELDS
+    truncated = len(rows) > cfg.AGGREGATION_MAX_GROUPS
+    groups = []
+    for row in rows[: cfg.AGGREGATION_MAX_GROUPS]:
+        value = row.get("value")
+        if to_gb and value is not None:
+            value = value / 1024
+        if isinstance(value, float):
+            value = round(value, 2)
+        groups.append({"group": row["_id"], "value": value, "rows": row["rows"]})
+
+    result = {
+        "dataset_id": dataset_id,
+        "query": _describe(intent),
+        "intent": intent.model_dump(),
+        "groups": groups,
+        "truncated": truncated,
+    }
+    _result_cache.put(key, result)
+    return result
+
+
+def answer_aggregate(dataset_id: int, question: str) -> Optional[Dict[str, Any]]:
+    """router entry point: computed result for aggregate questions, None otherwise"""
+    intent = parse_aggregate_intent(question)
+    if intent is None:
+        return None
+    try:
+        return run_aggregation(dataset_id, intent)
+    except Exception as e:
+        print(f"Error running aggregation, falling back to retrieval: {str(e)}")
+        return None
+
+
+def ensure_aggregation_indexes():
+    """compound indexes for the $match/$group dimensions we see most"""
+    db = get_mongo_client()[cfg.MONGO_DB]
+    for field in ("cluster", "datacenter", "powerstate", "host", "vcenter"):
+        db["rvtools_vms"].create_index([("dataset_id", 1), (field, 1)])
+    for field in ("cluster", "datacenter", "vcenter"):
+        db["rvtools_hosts"].create_index([("dataset_id", 1), (field, 1)])
@@ -0,0 +1,327 @@
+import asyncio
+import threading
+import time
+from typing import List, Optional
+
+from services.config import Config
+from services.genai_client import get_genai
+from services.metrics import EMBED_REQUEST_SECONDS, RATE_LIMITED, RETRIES, timed
+
+cfg = Config()
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    error_str = str(e).lower()
+    return (
+        "429" in error_str
+        or "rate limit" in error_str
+        or "resource exhausted" in error_str
+        or "resource_exhausted" in error_str
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 chars per token is close enough for budgeting requests
+    return len(text) // 4 + 1
+
+
+class EmbeddingRateLimited(Exception):
+    """a request was still being rate limited after every retry"""
+
+
+def split_into_batches(
+    texts: List[str], max_items: int, max_tokens: int
+) -> List[List[int]]:
+    """
+    group text indexes into request sized batches, capped by item count and by
+    estimated tokens. a single oversized text still gets a batch of its own.
+    """
+    batches = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (
+            len(current) >= max_items or current_tokens + tokens > max_tokens
+        ):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class AdaptiveRateLimiter:
+    """
+    token bucket whose refill rate is tuned AIMD style:
+    every success nudges the rate up a little, a 429 cuts it by a factor.
+    thread safe so it can be shared by every event loop / thread in the process.
+    """
+
+    def __init__(
+        self,
+        initial_rate: float,
+        min_rate: float,
+        max_rate: float,
+        increase_per_second: float = 1.0,
+        decrease_factor: float = 0.5,
+        cooldown_seconds: float = 1.0,
+    ):
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_per_second = increase_per_second
+        self.decrease_factor = decrease_factor
+        self.cooldown_seconds = cooldown_seconds
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+        self.last_decrease = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        # allow roughly one second worth of burst
+        capacity = max(1.0, self.rate)
+        self.tokens = min(capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def try_acquire(self) -> float:
+        """take a token, returns 0 on success or how long to wait before trying again"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0.0
+            return (1.0 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            # spread the additive increase over ~rate successes so it's per second
+            self.rate = min(self.max_rate, self.rate + self.increase_per_second / self.rate)
+
+    def on_throttle(self):
+        with self.lock:
+            now = time.monotonic()
+            # a burst of 429s from requests already in flight should only count once
+            if now - self.last_decrease < self.cooldown_seconds:
+                return
+            self.last_decrease = now
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self.tokens = 0.0
+            print(f"Embedding rate limited, backing off to {self.rate:.2f} req/s")
+
+
+class AsyncEmbeddingEngine:
+    """
+    runs embedding calls on a dedicated event loop thread so sync callers
+    (the embed worker threads) and async callers all share one in-flight limit
+    and one rate limiter.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        limiter: AdaptiveRateLimiter,
+        request_timeout: float,
+        max_retries: int,
+        batch_max_items: int = 1,
+        batch_max_tokens: int = 0,
+    ):
+        self.max_in_flight = max_in_flight
+        self.batch_max_items = batch_max_items
+        self.batch_max_tokens = batch_max_tokens
+        self.limiter = limiter
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.loop = asyncio.new_event_loop()
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run_loop, name="embedding-engine", daemon=True
+        )
+        self.thread.start()
+        self.ready.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.ready.set()
+        self.loop.run_forever()
+
+    async def _call(self, content, task_type: str):
+        """content is either one text or a list of texts (one request either way)"""
+        genai = get_genai()
+        embed_async = getattr(genai, "embed_content_async", None)
+        if embed_async is not None:
+            return await embed_async(
+                model=cfg.GOOGLE_EMBED_MODEL, content=content, task_type=task_type
+            )
+        return await asyncio.to_thread(
+            genai.embed_content,
+            model=cfg.GOOGLE_EMBED_MODEL,
+            content=content,
+            task_type=task_type,
+        )
+
+    async def _embed_one(self, text: str, task_type: str) -> List[float]:
+        reason = None  # why the last attempt failed
+        for attempt in range(self.max_retries):
+            async with self.semaphore:
+                await self.limiter.acquire()
+                if attempt:
+                    RETRIES.labels(call="embed", reason=reason).inc()
+                try:
+                    with timed(EMBED_REQUEST_SECONDS, kind="single"):
+                        response = await asyncio.wait_for(
+                            self._call(text, task_type), timeout=self.request_timeout
+                        )
+                    self.limiter.on_success()
+                    return response["embedding"]
+                except asyncio.TimeoutError:
+                    reason = "timeout"
+                    print(
+                        f"Embedding request timed out after {self.request_timeout}s "
+                        f"(attempt {attempt+1}/{self.max_retries})"
+                    )
+                except Exception as e:
+                    if is_rate_limit_error(e):
+                        reason = "rate_limited"
+                        RATE_LIMITED.labels(call="embed").inc()
+                        self.limiter.on_throttle()
+                    else:
+                        reason = "error"
+                        print(
+                            f"Error in async embed (attempt {attempt+1}/{self.max_retries}): {e}"
+                        )
+
+        from services.embedding import zero_vector
+
+        return zero_vector()
+
+    async def _embed_batch(
+        self, texts: List[str], task_type: str
+    ) -> Optional[List[List[float]]]:
+        """
+        embed a whole batch in one request. returns None if the batch keeps failing
+        for reasons other than rate limiting, so the caller can fall back to singles.
+        raises EmbeddingRateLimited if it's still throttled after the last retry,
+        splitting it into more requests then would only make that worse.
+        """
+        reason = None  # why the last attempt failed
+        for attempt in range(self.max_retries):
+            async with self.semaphore:
+                await self.limiter.acquire()
+                if attempt:
+                    RETRIES.labels(call="embed", reason=reason).inc()
+                try:
+                    with timed(EMBED_REQUEST_SECONDS, kind="batch"):
+                        response = await asyncio.wait_for(
+                            self._call(texts, task_type), timeout=self.request_timeout
+                        )
+                    embeddings = response["embedding"]
+                    if len(embeddings) != len(texts):
+                        print(
+                            f"Batch embed returned {len(embeddings)} vectors for {len(texts)} texts"
+                        )
+                        return None
+                    self.limiter.on_success()
+                    return embeddings
+                except asyncio.TimeoutError:
+                    reason = "timeout"
+                    print(
+                        f"Batch embed of {len(texts)} texts timed out after {self.request_timeout}s "
+                        f"(attempt {attempt+1}/{self.max_retries})"
+                    )
+                except Exception as e:
+                    if not is_rate_limit_error(e):
+                        print(f"Batch embed of {len(texts)} texts failed: {e}")
+                        return None
+                    reason = "rate_limited"
+                    RATE_LIMITED.labels(call="embed").inc()
+                    self.limiter.on_throttle()
+        if reason == "rate_limited":
+            raise EmbeddingRateLimited(
+                f"Batch embed of {len(texts)} texts still rate limited after {self.max_retries} attempts"
+            )
+        return None
+
+    async def _embed_group(self, texts: List[str], task_type: str) -> List[List[float]]:
+        if len(texts) > 1:
+            try:
+                embeddings = await self._embed_batch(texts, task_type)
+            except EmbeddingRateLimited as e:
+                # zero vectors are how a failed embed is reported everywhere else too,
+                # the rows get skipped and retried by the next run
+                print(f"{e}, giving up on the batch")
+                from services.embedding import zero_vector
+
+                return [zero_vector() for _ in texts]
+            if embeddings is not None:
+                return embeddings
+            print(f"Falling back to single embeds for {len(texts)} texts")
+        return await asyncio.gather(*(self._embed_one(t, task_type) for t in texts))
+
+    async def _embed_many(self, texts: List[str], task_type: str) -> List[List[float]]:
+        groups = split_into_batches(texts, self.batch_max_items, self.batch_max_tokens)
+        group_results = await asyncio.gather(
+            *(self._embed_group([texts[i] for i in g], task_type) for g in groups)
+        )
+
+        results: List[List[float]] = [None] * len(texts)
+        for group, embeddings in zip(groups, group_results):
+            for i, embedding in zip(group, embeddings):
+                results[i] = embedding
+        return results
+
+    def embed_many(
+        self, texts: List[str], task_type: str = "retrieval_document"
+    ) -> List[List[float]]:
+        """blocking entry point for worker threads"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._embed_many(texts, task_type), self.loop
+        )
+        return future.result()
+
+    async def aembed_many(
+        self, texts: List[str], task_type: str = "retrieval_document"
+    ) -> List[List[float]]:
+        """entry point for coroutines running on some other event loop"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._embed_many(texts, task_type), self.loop
+        )
+        return await asyncio.wrap_future(future)
+
+
+_engine: Optional[AsyncEmbeddingEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_embedding_engine() -> AsyncEmbeddingEngine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                limiter = AdaptiveRateLimiter(
+                    initial_rate=cfg.EMBED_RATE_INITIAL_QPS,
+                    min_rate=cfg.EMBED_RATE_MIN_QPS,
+                    max_rate=cfg.EMBED_RATE_MAX_QPS,
+                )
+                _engine = AsyncEmbeddingEngine(
+                    max_in_flight=cfg.EMBED_MAX_IN_FLIGHT,
+                    limiter=limiter,
+                    request_timeout=cfg.EMBED_REQUEST_TIMEOUT_SECONDS,
+                    max_retries=cfg.EMBED_MAX_RETRIES,
+                    batch_max_items=cfg.EMBED_BATCH_MAX_ITEMS,
+                    batch_max_tokens=cfg.EMBED_BATCH_MAX_TOKENS,
+                )
+    return _engine
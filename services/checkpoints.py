@@ -0,0 +1,20 @@
+from typing import Any, Dict, Optional
+
+
+class BatchWatermark:
+    """
+    batches finish out of order in the pipeline, so the checkpoint is the last _id
+    of the highest batch for which every earlier batch has also finished.
+    resuming from it can redo a few batches but never skips one.
+    """
+
+    def __init__(self, start_value: Optional[Any] = None):
+        self.value = start_value
+        self.next_seq = 0
+        self.pending: Dict[int, Any] = {}
+
+    def complete(self, seq: int, last_id: Any):
+        self.pending[seq] = last_id
+        while self.next_seq in self.pending:
+            self.value = self.pending.pop(self.next_seq)
+            self.next_seq += 1
@@ -7,13 +7,133 @@ class Config:
     # Mongo
     MONGO_URI = os.getenv("MONGO_URI")
     MONGO_DB = os.getenv("MONGO_DB", "infra_db")
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    # 0 means no socket timeout
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0"))
+    MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
 
     # Qdrant
     QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
     QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", "")
-    QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "infra_vectors")
+    QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "dataset_vectors")
+    QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+    QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+    QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "30"))
+    QDRANT_UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "256"))
+    QDRANT_UPSERT_PARALLELISM = int(os.getenv("QDRANT_UPSERT_PARALLELISM", "4"))
+    # false = don't wait for indexing on each upsert, the job waits once at the end
+    QDRANT_UPSERT_WAIT = os.getenv("QDRANT_UPSERT_WAIT", "false").lower() == "true"
+    QDRANT_UPSERT_MAX_RETRIES = int(os.getenv("QDRANT_UPSERT_MAX_RETRIES", "3"))
+    # collection storage: "scalar" (int8), "binary" or "none" quantization. the
+    # quantized vectors stay in RAM, the full float32 ones live on disk for rescoring
+    QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "scalar")
+    QDRANT_ON_DISK_VECTORS = os.getenv("QDRANT_ON_DISK_VECTORS", "true").lower() == "true"
+    QDRANT_ON_DISK_PAYLOAD = os.getenv("QDRANT_ON_DISK_PAYLOAD", "true").lower() == "true"
+    QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", "16"))
+    QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "100"))
+    QDRANT_HNSW_ON_DISK = os.getenv("QDRANT_HNSW_ON_DISK", "false").lower() == "true"
+    # search time, can be overridden per search_vectors call
+    QDRANT_SEARCH_HNSW_EF = int(os.getenv("QDRANT_SEARCH_HNSW_EF", "128"))
+    QDRANT_SEARCH_RESCORE = os.getenv("QDRANT_SEARCH_RESCORE", "true").lower() == "true"
+    QDRANT_SEARCH_OVERSAMPLING = float(os.getenv("QDRANT_SEARCH_OVERSAMPLING", "2.0"))
 
     # Google
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
     GOOGLE_EMBED_MODEL = os.getenv("GOOGLE_EMBED_MODEL", "models/embedding-gecko-004")
+    # 0 = work it out from GOOGLE_EMBED_MODEL
+    EMBED_DIMENSIONS = int(os.getenv("EMBED_DIMENSIONS", "0"))
     GOOGLE_CHAT_MODEL = os.getenv("GOOGLE_CHAT_MODEL", "models/gemini-pro")
+
+    # Embedding cache
+    EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+    EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "embedding_cache.sqlite3")
+    EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "2000000"))
+
+    # Embedding engine ("async" = concurrent + adaptive rate limit, "sync" = one call at a time)
+    EMBED_ENGINE = os.getenv("EMBED_ENGINE", "async")
+    EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "16"))
+    EMBED_RATE_INITIAL_QPS = float(os.getenv("EMBED_RATE_INITIAL_QPS", "10"))
+    EMBED_RATE_MIN_QPS = float(os.getenv("EMBED_RATE_MIN_QPS", "1"))
+    EMBED_RATE_MAX_QPS = float(os.getenv("EMBED_RATE_MAX_QPS", "100"))
+    EMBED_REQUEST_TIMEOUT_SECONDS = float(os.getenv("EMBED_REQUEST_TIMEOUT_SECONDS", "30"))
+    EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+    # multi-doc requests: the API takes up to 100 texts per call, set to 1 to disable batching
+    EMBED_BATCH_MAX_ITEMS = int(os.getenv("EMBED_BATCH_MAX_ITEMS", "100"))
+    EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "20000"))
+
+    # Embedding pipeline (mongo reader -> summarize -> embed -> qdrant writer)
+    EMBED_PIPELINE_BATCH_SIZE = int(os.getenv("EMBED_PIPELINE_BATCH_SIZE", "20"))
+    EMBED_PIPELINE_QUEUE_SIZE = int(os.getenv("EMBED_PIPELINE_QUEUE_SIZE", "8"))
+    # prepare is cpu-bound, embed and write wait on the network. with
+    # EMBED_PREPARE_PROCESSES > 0 prepare runs in that many worker processes fed raw
+    # BSON (the prepare threads just hand batches over), 0 keeps it on the threads
+    EMBED_PREPARE_WORKERS = int(os.getenv("EMBED_PREPARE_WORKERS", "1"))
+    EMBED_PREPARE_PROCESSES = int(
+        os.getenv("EMBED_PREPARE_PROCESSES", str(max((os.cpu_count() or 1) - 1, 0)))
+    )
+    EMBED_EMBED_WORKERS = int(os.getenv("EMBED_EMBED_WORKERS", "4"))
+    EMBED_WRITE_WORKERS = int(os.getenv("EMBED_WRITE_WORKERS", "2"))
+    # prometheus endpoint of a standalone worker (python -m services.worker), 0 = off.
+    # the API serves its metrics at /metrics
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+    # restart interrupted embed jobs from their checkpoint when the app boots
+    EMBED_AUTO_RESUME = os.getenv("EMBED_AUTO_RESUME", "true").lower() == "true"
+
+    # Embedding job queue / workers
+    EMBED_JOB_MAX_ATTEMPTS = int(os.getenv("EMBED_JOB_MAX_ATTEMPTS", "3"))
+    EMBED_JOB_LEASE_SECONDS = int(os.getenv("EMBED_JOB_LEASE_SECONDS", "60"))
+    EMBED_JOB_POLL_SECONDS = float(os.getenv("EMBED_JOB_POLL_SECONDS", "2"))
+    EMBED_JOB_RETRY_DELAY_SECONDS = int(os.getenv("EMBED_JOB_RETRY_DELAY_SECONDS", "30"))
+    # run a worker thread inside the API process (local dev), off by default
+    EMBED_INPROCESS_WORKER = os.getenv("EMBED_INPROCESS_WORKER", "false").lower() == "true"
+
+    # API startup / probes. index and collection setup runs in the background and is
+    # retried (backing off up to STARTUP_RETRY_MAX_SECONDS), /readyz fails until it's done
+    STARTUP_RETRY_MAX_SECONDS = float(os.getenv("STARTUP_RETRY_MAX_SECONDS", "30"))
+    # how long /readyz waits on each dependency check
+    READINESS_TIMEOUT_SECONDS = float(os.getenv("READINESS_TIMEOUT_SECONDS", "2"))
+    # on SIGTERM: time for in-flight requests and embed batches to finish. keep it a few
+    # seconds under the orchestrator's grace period (k8s default 30s), the rest is cleanup
+    SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "20"))
+
+    # /chat caches
+    QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+    QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+    SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+    SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "300"))
+    # how often to re-check whether a dataset was re-embedded by another process
+    CACHE_EPOCH_TTL_SECONDS = float(os.getenv("CACHE_EPOCH_TTL_SECONDS", "5"))
+    # after a version swap, how long old points stay around for readers that haven't
+    # noticed yet. keep it above CACHE_EPOCH_TTL_SECONDS
+    DATASET_VERSION_PURGE_DELAY_SECONDS = float(
+        os.getenv("DATASET_VERSION_PURGE_DELAY_SECONDS", "15")
+    )
+
+    # aggregate questions answered straight from mongo
+    AGGREGATION_MAX_GROUPS = int(os.getenv("AGGREGATION_MAX_GROUPS", "50"))
+    AGGREGATION_CACHE_SIZE = int(os.getenv("AGGREGATION_CACHE_SIZE", "512"))
+    AGGREGATION_CACHE_TTL_SECONDS = float(os.getenv("AGGREGATION_CACHE_TTL_SECONDS", "600"))
+
+    # retrieval: "dense" or "hybrid" (dense + sparse identifier match, fused with RRF)
+    SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+    HYBRID_PREFETCH_FACTOR = int(os.getenv("HYBRID_PREFETCH_FACTOR", "4"))
+    # sparse hits scoring under this fraction of the best one are left out of the fusion
+    SPARSE_MIN_SCORE_RATIO = float(os.getenv("SPARSE_MIN_SCORE_RATIO", "0.5"))
+
+    # rough token cap for the retrieved records in a chat prompt
+    CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "4000"))
+
+    # vector store: "qdrant", or "local" for the in-process numpy store (offline dev, CI, benchmarks)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+    LOCAL_VECTOR_PATH = os.getenv("LOCAL_VECTOR_PATH", "./local_vectors")
+    # "flat" (always brute force), "ivf" or "hnsw" (needs hnswlib) for big datasets
+    LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "flat")
+    LOCAL_INDEX_MIN_POINTS = int(os.getenv("LOCAL_INDEX_MIN_POINTS", "20000"))
+    LOCAL_IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", "8"))
+    LOCAL_HNSW_EF = int(os.getenv("LOCAL_HNSW_EF", "128"))
+    # writes don't drop the ivf/hnsw index, changed rows are scanned exactly until
+    # they make up this share of the dataset, then the index is rebuilt
+    LOCAL_INDEX_STALE_RATIO = float(os.getenv("LOCAL_INDEX_STALE_RATIO", "0.1"))
@@ -0,0 +1,135 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.async_embedding import estimate_tokens
+from services.config import Config
+
+cfg = Config()
+
+# bookkeeping fields, or ones that repeat another column in different units
+_HIDDEN_FIELDS = {
+    "dataset_id",
+    "version",
+    "type",
+    "collection",
+    "created_at",
+    "vm_hash",
+    "host_hash",
+    "memory",
+    "provisioned_mib",
+    "in_use_mib",
+}
+_MAX_CELL_CHARS = 60
+_TYPE_TITLES = {"vm": "VMs", "host": "Hosts"}
+
+
+def _cell(value: Any) -> str:
+    if isinstance(value, list):
+        value = ",".join(str(v) for v in value if v not in (None, ""))
+    elif isinstance(value, float):
+        value = f"{value:g}"
+    text = str(value).replace("|", "/").replace("\n", " ")
+    if len(text) > _MAX_CELL_CHARS:
+        text = text[: _MAX_CELL_CHARS - 1] + "…"
+    return text
+
+
+def _has_value(value: Any) -> bool:
+    return value not in (None, "", [], "unknown")
+
+
+def _row_facts(doc: Dict[str, Any]) -> Dict[str, str]:
+    metadata = doc.get("metadata") or {}
+    return {
+        key: _cell(value)
+        for key, value in metadata.items()
+        if key not in _HIDDEN_FIELDS and _has_value(value)
+    }
+
+
+def _render_table(kind: str, rows: List[Dict[str, str]]) -> str:
+    """one pipe table per type. columns that are the same for every row go in a shared line"""
+    columns: List[str] = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+
+    shared = {}
+    if len(rows) > 1:
+        for key in columns:
+            values = {row.get(key) for row in rows}
+            if len(values) == 1 and None not in values:
+                shared[key] = rows[0][key]
+    columns = [key for key in columns if key not in shared]
+
+    lines = [f"{_TYPE_TITLES.get(kind, kind)} ({len(rows)}):"]
+    if shared:
+        lines.append("all rows: " + "; ".join(f"{k}={v}" for k, v in shared.items()))
+    if columns:
+        lines.append(" | ".join(columns))
+        for row in rows:
+            lines.append(" | ".join(row.get(key, "") for key in columns))
+    return "\n".join(lines)
+
+
+def build_context(
+    docs: List[Dict[str, Any]], token_budget: Optional[int] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    compact context for the chat prompt. docs go in best score first, duplicates
+    are dropped, each fact is written once (the payload, not the summary text
+    which restates it) and rows stop once the token budget is used up.
+    returns the text and some counts for logging.
+    """
+    token_budget = token_budget or cfg.CHAT_CONTEXT_TOKEN_BUDGET
+    ranked = sorted(docs, key=lambda d: d.get("score") or 0, reverse=True)
+
+    seen = set()
+    selected: Dict[str, List[Dict[str, str]]] = {}
+    loose_content: List[str] = []
+    used = 0
+    duplicates = 0
+    dropped = 0
+
+    for doc in ranked:
+        kind = (doc.get("metadata") or {}).get("type", "other")
+        row = _row_facts(doc)
+        if row:
+            key = (kind, tuple(sorted(row.items())))
+            cost = estimate_tokens(" | ".join(row.values()))
+            if kind not in selected:
+                cost += estimate_tokens(" | ".join(row.keys()))
+        else:
+            # nothing structured to show, fall back to the text we have
+            content = (doc.get("content") or "").strip()
+            if not content:
+                continue
+            key = ("content", content)
+            cost = estimate_tokens(content)
+
+        if key in seen:
+            duplicates += 1
+            continue
+        if used + cost > token_budget:
+            dropped += 1
+            continue
+        seen.add(key)
+        used += cost
+        if row:
+            selected.setdefault(kind, []).append(row)
+        else:
+            loose_content.append(content)
+
+    sections = [_render_table(kind, rows) for kind, rows in selected.items()]
+    sections.extend(loose_content)
+    text = "\n\n".join(sections) if sections else "No matching documents were found."
+
+    stats = {
+        "docs_in": len(docs),
+        "docs_used": sum(len(rows) for rows in selected.values()) + len(loose_content),
+        "duplicates": duplicates,
+        "dropped_for_budget": dropped,
+        "context_tokens": estimate_tokens(text),
+        "token_budget": token_budget,
+    }
+    return text, stats
@@ -0,0 +1,55 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from services.config import Config
+from services.fingerprints import delete_other_versions
+from services.mongo import get_mongo_client
+from services.vector_store import delete_dataset_vectors
+
+cfg = Config()
+
+
+def _status():
+    return get_mongo_client().exempla.embedding_status
+
+
+def choose_version(
+    previous: Optional[Dict[str, Any]], incremental: bool, resuming: bool
+) -> int:
+    """
+    which version a job writes to. full runs build a new version next to the active
+    one, incremental runs patch the active version in place, resumed runs carry on
+    with the version they were building.
+    """
+    previous = previous or {}
+    active = previous.get("active_version")
+    if resuming and previous.get("building_version") is not None:
+        return previous["building_version"]
+    if incremental and active is not None:
+        return active
+    return max(active or 0, previous.get("building_version") or 0) + 1
+
+
+def activate_version(dataset_id: int, version: int, extra: Dict[str, Any]):
+    """
+    switch chat over to the new version. it's a single document update so readers
+    see either the old version or the new one, never a mix
+    """
+    _status().update_one(
+        {"dataset_id": dataset_id},
+        {
+            "$set": {
+                **extra,
+                "active_version": version,
+                "building_version": None,
+                "activated_at": datetime.utcnow(),
+            }
+        },
+    )
+
+
+def purge_inactive_versions(dataset_id: int, keep_version: int):
+    """bulk delete every point (and fingerprint) of the dataset outside keep_version"""
+    delete_dataset_vectors(dataset_id, keep_version=keep_version)
+    delete_other_versions(dataset_id, keep_version)
+    print(f"Purged old versions of dataset {dataset_id}, keeping version {keep_version}")
@@ -0,0 +1,500 @@
+import threading
+from typing import Any, Dict, Optional
+from datetime import datetime
+from services.checkpoints import BatchWatermark
+from services.config import Config
+from services.dataset_versions import (
+    activate_version,
+    choose_version,
+    purge_inactive_versions,
+)
+from services.embedding import batch_embed_texts
+from services.fingerprints import (
+    delete_fingerprints,
+    ensure_fingerprint_indexes,
+    load_fingerprints,
+    save_fingerprints,
+)
+from services.mongo import (
+    count_hosts_for_dataset,
+    count_vms_for_dataset,
+    ensure_dataset_indexes,
+    get_mongo_client,
+    iter_host_batches,
+    iter_vm_batches,
+)
+from services.metrics import EMBED_ITEMS
+from services.pipeline import StreamingPipeline
+from services.prepare import get_prepare_pool, prepare_batch, prepare_raw_batch
+from services.query_cache import invalidate_dataset
+from services.summarizer import HOST_FIELDS, VM_FIELDS
+from services.task_manager import task_manager
+from services.vector_store import (
+    batch_upsert_vectors,
+    delete_vectors,
+    wait_for_pending_upserts,
+)
+
+cfg = Config()
+
+# running totals kept in embedding_status, carried over when a job resumes
+COUNTER_FIELDS = (
+    "processed_items",
+    "skipped_items",
+    "unchanged_items",
+    "deleted_items",
+    "cache_hits",
+    "cache_misses",
+)
+
+
+def process_embeddings_with_tracking(
+    dataset_id: int,
+    task_id: str,
+    incremental: bool = False,
+    resume: bool = False,
+    lease_lost: Optional[threading.Event] = None,
+) -> str:
+    """
+    wrapper for our internal task manager.
+    returns how the job ended: "completed", "failed" or "interrupted"
+    """
+    try:
+        task_manager.register_task(
+            task_id,
+            {
+                "type": "embedding",
+                "dataset_id": dataset_id,
+                "started_at": datetime.utcnow(),
+                "incremental": incremental,
+                "resume": resume,
+            },
+        )
+
+        return process_embeddings(
+            dataset_id, incremental=incremental, resume=resume, lease_lost=lease_lost
+        )
+    except InterruptedError as e:
+        if lease_lost is not None and lease_lost.is_set():
+            print(f"Task {task_id} stopped, another worker owns the job now")
+            return "interrupted"
+        mongo_client = get_mongo_client()
+        embedding_status = mongo_client.exempla.embedding_status
+
+        embedding_status.update_one(
+            {"dataset_id": dataset_id},
+            {
+                "$set": {
+                    "status": "interrupted",
+                    "message": str(e),
+                    "interrupted_at": datetime.utcnow(),
+                }
+            },
+        )
+        print(f"Task {task_id} was interrupted: {str(e)}")
+        return "interrupted"
+    except Exception as e:
+        print(f"Error in task {task_id}: {str(e)}")
+        return "failed"
+    finally:
+        task_manager.unregister_task(task_id)
+
+
+def drop_unchanged(prepared: Dict[str, Any], existing: Dict[str, str]) -> int:
+    """remove rows whose fingerprint matches what's already embedded, returns how many"""
+    keep = [
+        i
+        for i, (point_id, fp) in enumerate(zip(prepared["ids"], prepared["fingerprints"]))
+        if existing.get(point_id) != fp
+    ]
+    unchanged = len(prepared["ids"]) - len(keep)
+    if unchanged:
+        for key in ("summaries", "ids", "metadata_list", "fingerprints", "sparse"):
+            prepared[key] = [prepared[key][i] for i in keep]
+    return unchanged
+
+
+def process_embeddings(
+    dataset_id: int,
+    incremental: bool = False,
+    resume: bool = False,
+    lease_lost: Optional[threading.Event] = None,
+) -> str:
+    """
+    lease_lost is set by the worker when its job lease went to another worker. the
+    run then stops at the next batch boundary like on shutdown, but leaves the
+    dataset's status and checkpoint alone, the new owner is writing those now
+    """
+    mongo_client = get_mongo_client()
+    embedding_status = mongo_client.exempla.embedding_status
+
+    previous = embedding_status.find_one({"dataset_id": dataset_id}) or {}
+    checkpoint = (previous.get("checkpoint") or {}) if resume else {}
+    resuming = bool(checkpoint)
+
+    counters = {field: 0 for field in COUNTER_FIELDS}
+    if resuming:
+        # pick up where the interrupted run left off, same mode and running totals
+        incremental = previous.get("incremental", incremental)
+        for field in COUNTER_FIELDS:
+            counters[field] = previous.get(field) or 0
+        print(f"Resuming embedding for dataset {dataset_id} from checkpoint {checkpoint}")
+    elif incremental and previous.get("active_version") is None:
+        # nothing versioned to patch yet
+        print(f"Dataset {dataset_id} has no active version, running a full embed instead")
+        incremental = False
+
+    # full runs build a new version while chat keeps reading the active one
+    version = choose_version(previous, incremental, resuming)
+
+    embedding_status.update_one(
+        {"dataset_id": dataset_id},
+        {
+            "$set": {
+                "status": "processing",
+                "started_at": previous.get("started_at") if resuming else datetime.utcnow(),
+                "resumed_at": datetime.utcnow() if resuming else None,
+                "message": "Resuming embedding process"
+                if resuming
+                else "Starting embedding process",
+                "error": None,
+                "failed_at": None,
+                "incremental": incremental,
+                "building_version": version,
+                "checkpoint": checkpoint or {"vm": None, "host": None},
+                **({} if resuming else {"progress": 0, **counters}),
+            }
+        },
+        upsert=True,
+    )
+
+    cache_stats = {
+        "cache_hits": counters["cache_hits"],
+        "cache_misses": counters["cache_misses"],
+    }
+    cache_stats_lock = threading.Lock()
+    watermarks = {
+        "vm": BatchWatermark(checkpoint.get("vm")),
+        "host": BatchWatermark(checkpoint.get("host")),
+    }
+
+    def current_checkpoint():
+        return {kind: wm.value for kind, wm in watermarks.items()}
+
+    def lost_lease() -> bool:
+        return lease_lost is not None and lease_lost.is_set()
+
+    def should_stop() -> bool:
+        return task_manager.should_shutdown() or lost_lease()
+
+    try:
+        if should_stop():
+            raise InterruptedError("Embedding process interrupted by server shutdown")
+
+        ensure_dataset_indexes()
+        ensure_fingerprint_indexes()
+        existing_fingerprints = load_fingerprints(dataset_id, version) if incremental else {}
+        seen_ids = set()
+        seen_lock = threading.Lock()
+
+        vm_count = count_vms_for_dataset(dataset_id)
+        host_count = count_hosts_for_dataset(dataset_id)
+        total_items = vm_count + host_count
+        processed_items = counters["processed_items"]
+        skipped_items = counters["skipped_items"]
+        unchanged_items = counters["unchanged_items"]
+        deleted_items = counters["deleted_items"]
+
+        print(f"Embedding {vm_count} VMs and {host_count} hosts for dataset {dataset_id}")
+
+        embedding_status.update_one(
+            {"dataset_id": dataset_id},
+            {
+                "$set": {
+                    "total_items": total_items,
+                    "vm_count": vm_count,
+                    "host_count": host_count,
+                    "message": f"Processing {vm_count} VMs and {host_count} hosts",
+                }
+            },
+        )
+
+        batch_size = cfg.EMBED_PIPELINE_BATCH_SIZE
+
+        prepare_pool = get_prepare_pool()
+
+        def prepare_stage(item):
+            kind, seq, batch = item
+            if prepare_pool is not None:
+                # ship the raw bytes, the worker decodes and renders the batch and
+                # sends back only what the embed and write stages need
+                prepared = prepare_pool.submit(
+                    prepare_raw_batch, kind, [doc.raw for doc in batch], dataset_id, version
+                ).result()
+            else:
+                prepared = prepare_batch(kind, batch, dataset_id, version)
+
+            prepared["seq"] = seq
+            prepared["last_id"] = batch[-1]["_id"]
+            prepared["unchanged"] = 0
+            if incremental:
+                with seen_lock:
+                    seen_ids.update(prepared["seen"])
+                prepared["unchanged"] = drop_unchanged(prepared, existing_fingerprints)
+            return prepared
+
+        def embed_stage(prepared):
+            if not prepared["summaries"]:
+                prepared["embeddings"] = []
+                return prepared
+            try:
+                batch_stats = {}
+                prepared["embeddings"] = batch_embed_texts(
+                    prepared["summaries"], stats=batch_stats
+                )
+                with cache_stats_lock:
+                    for key, value in batch_stats.items():
+                        cache_stats[key] += value
+            except Exception as e:
+                print(f"Error embedding {prepared['kind']} batch: {str(e)}")
+                prepared["embeddings"] = None
+            return prepared
+
+        def write_stage(prepared):
+            """returns per-batch counts plus where the batch sits for checkpointing"""
+            if lost_lease():
+                # unlike a shutdown, batches that already got embedded aren't ours
+                # to write anymore, the new owner redoes them from its checkpoint
+                return None
+            result = {
+                "kind": prepared["kind"],
+                "seq": prepared["seq"],
+                "last_id": prepared["last_id"],
+                "processed": 0,
+                "skipped": prepared["skipped"],
+                "unchanged": prepared["unchanged"],
+            }
+            embedded = len(prepared["summaries"])
+            if not embedded:
+                return result
+            if prepared["embeddings"] is None:
+                result["skipped"] += embedded
+                return result
+            # rows whose embed failed got zero vectors. they'd only be junk points in the
+            # vector store, skip them (no fingerprint either, so the next incremental
+            # run picks them up again)
+            rows = [i for i, vec in enumerate(prepared["embeddings"]) if any(vec)]
+            result["skipped"] += embedded - len(rows)
+            if not rows:
+                return result
+            ids = [prepared["ids"][i] for i in rows]
+            try:
+                failed_ids = set(
+                    batch_upsert_vectors(
+                        ids,
+                        [prepared["embeddings"][i] for i in rows],
+                        [prepared["metadata_list"][i] for i in rows],
+                        sparse_vectors=[prepared["sparse"][i] for i in rows],
+                    )
+                )
+                # same for the ones the vector store rejected
+                ok = [i for i in rows if prepared["ids"][i] not in failed_ids]
+                save_fingerprints(
+                    dataset_id,
+                    version,
+                    prepared["kind"],
+                    [prepared["ids"][i] for i in ok],
+                    [prepared["fingerprints"][i] for i in ok],
+                )
+            except InterruptedError:
+                raise
+            except Exception as e:
+                print(f"Error writing {prepared['kind']} batch: {str(e)}")
+                result["skipped"] += len(rows)
+                return result
+            result["processed"] = len(rows) - len(failed_ids)
+            result["skipped"] += len(failed_ids)
+            return result
+
+        pipeline = StreamingPipeline(
+            stages=[
+                # with a process pool each prepare thread just waits on a worker,
+                # so have at least one per process to keep them all busy
+                (
+                    "prepare",
+                    prepare_stage,
+                    max(cfg.EMBED_PREPARE_WORKERS, cfg.EMBED_PREPARE_PROCESSES),
+                ),
+                ("embed", embed_stage, cfg.EMBED_EMBED_WORKERS),
+                ("write", write_stage, cfg.EMBED_WRITE_WORKERS),
+            ],
+            queue_size=cfg.EMBED_PIPELINE_QUEUE_SIZE,
+            # on shutdown finish the batches in flight, past the drain deadline drop them
+            should_stop=should_stop,
+            should_abort=task_manager.drain_expired,
+        )
+        # VMs and hosts are read concurrently and share the downstream stages
+        sources = [
+            (
+                ("vm", seq, batch)
+                for seq, batch in enumerate(
+                    iter_vm_batches(
+                        dataset_id,
+                        batch_size,
+                        checkpoint.get("vm"),
+                        VM_FIELDS,
+                        raw=prepare_pool is not None,
+                    )
+                )
+            ),
+            (
+                ("host", seq, batch)
+                for seq, batch in enumerate(
+                    iter_host_batches(
+                        dataset_id,
+                        batch_size,
+                        checkpoint.get("host"),
+                        HOST_FIELDS,
+                        raw=prepare_pool is not None,
+                    )
+                )
+            ),
+        ]
+
+        for batch_index, result in enumerate(pipeline.run(sources)):
+            processed_items += result["processed"]
+            skipped_items += result["skipped"]
+            unchanged_items += result["unchanged"]
+            for outcome in ("processed", "skipped", "unchanged"):
+                EMBED_ITEMS.labels(outcome=outcome).inc(result[outcome])
+            watermarks[result["kind"]].complete(result["seq"], result["last_id"])
+            counters.update(
+                processed_items=processed_items,
+                skipped_items=skipped_items,
+                unchanged_items=unchanged_items,
+            )
+
+            if batch_index % 5 == 0 and not lost_lease():
+                done_items = processed_items + unchanged_items
+                progress_percentage = int((done_items / max(total_items, 1)) * 100)
+                embedding_status.update_one(
+                    {"dataset_id": dataset_id},
+                    {
+                        "$set": {
+                            "progress": progress_percentage,
+                            "processed_items": processed_items,
+                            "skipped_items": skipped_items,
+                            "unchanged_items": unchanged_items,
+                            "checkpoint": current_checkpoint(),
+                            **cache_stats,
+                            "message": f"Processed {done_items}/{total_items} items ({progress_percentage}%)",
+                        }
+                    },
+                )
+
+        # upserts may have been fire-and-forget, make sure they've all landed
+        wait_for_pending_upserts()
+
+        if lost_lease():
+            raise InterruptedError("Embedding stopped at a batch boundary, the job lease was lost")
+        if pipeline.stopped:
+            # the checkpoint covers every batch that made it through, resume from there
+            raise InterruptedError("Embedding stopped at a batch boundary for server shutdown")
+
+        if incremental and resuming:
+            # rows seen before the restart aren't in seen_ids, so we can't tell
+            # what's stale. the next incremental run will sweep them.
+            print(f"Skipping stale point cleanup for resumed dataset {dataset_id}")
+        elif incremental:
+            # anything we embedded before that isn't in mongo anymore
+            stale_ids = [pid for pid in existing_fingerprints if pid not in seen_ids]
+            if stale_ids:
+                delete_vectors(stale_ids)
+                delete_fingerprints(dataset_id, stale_ids)
+                deleted_items += len(stale_ids)
+                EMBED_ITEMS.labels(outcome="deleted").inc(len(stale_ids))
+                print(f"Deleted {len(stale_ids)} stale points for dataset {dataset_id}")
+
+        switched = previous.get("active_version") != version
+        activate_version(
+            dataset_id,
+            version,
+            {
+                "status": "completed",
+                "completed_at": datetime.utcnow(),
+                "progress": 100,
+                "processed_items": processed_items,
+                "skipped_items": skipped_items,
+                "unchanged_items": unchanged_items,
+                "deleted_items": deleted_items,
+                "checkpoint": None,
+                **cache_stats,
+                "message": f"Successfully embedded {processed_items}/{total_items} items ({skipped_items} skipped, {unchanged_items} unchanged, {deleted_items} deleted)",
+            },
+        )
+
+        invalidate_dataset(dataset_id)
+        print(f"Dataset {dataset_id} embedded successfully as version {version}.")
+
+        # other processes may still be searching the old version until their cached
+        # dataset state expires, give them that long before deleting it
+        if switched and task_manager.shutdown_event.wait(cfg.DATASET_VERSION_PURGE_DELAY_SECONDS):
+            print(f"Shutting down, old versions of dataset {dataset_id} get purged next run")
+            return "completed"
+        try:
+            purge_inactive_versions(dataset_id, version)
+        except Exception as e:
+            # not fatal, the next completed run purges them
+            print(f"Error purging old versions of dataset {dataset_id}: {str(e)}")
+        return "completed"
+
+    except InterruptedError as e:
+        error_message = str(e)
+        print(
+            f"Embedding process for dataset {dataset_id} was interrupted: {error_message}"
+        )
+        if not task_manager.drain_expired():
+            try:
+                wait_for_pending_upserts()
+            except Exception as flush_error:
+                # the checkpoint may then be a little ahead of qdrant, resuming an
+                # incremental run fixes that, a full run rebuilds the version anyway
+                print(f"Error flushing upserts for dataset {dataset_id}: {str(flush_error)}")
+        if lost_lease():
+            raise
+
+        embedding_status.update_one(
+            {"dataset_id": dataset_id},
+            {
+                "$set": {
+                    "status": "interrupted",
+                    "error": error_message,
+                    "interrupted_at": datetime.utcnow(),
+                    "checkpoint": current_checkpoint(),
+                    **counters,
+                    **cache_stats,
+                    "message": f"Embedding interrupted: {error_message}",
+                }
+            },
+        )
+        raise
+
+    except Exception as e:
+        error_message = str(e)
+        print(f"Error embedding dataset {dataset_id}: {error_message}")
+        if lost_lease():
+            return "failed"
+
+        embedding_status.update_one(
+            {"dataset_id": dataset_id},
+            {
+                "$set": {
+                    "status": "failed",
+                    "error": error_message,
+                    "failed_at": datetime.utcnow(),
+                    "checkpoint": current_checkpoint(),
+                    "message": f"Embedding failed: {error_message}",
+                }
+            },
+        )
+        return "failed"
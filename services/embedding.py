@@ -1,33 +1,36 @@
-import google.generativeai as genai
-from typing import List
+from typing import Dict, List, Optional
 import time
 from services.config import Config
+from services.genai_client import get_genai
+from services.embedding_cache import get_embedding_cache, text_hash
+from services.async_embedding import get_embedding_engine
+from services.metrics import EMBED_REQUEST_SECONDS, RATE_LIMITED, RETRIES, count_cache, timed
 
 cfg = Config()
-_is_configured = False
 
 # throttle to avoid rate limits....bastards
 EMBED_THROTTLE_SECONDS = 0.1
 
-def init_google_embeddings(api_key: str, model_name: str):
-    global _is_configured
-    if not _is_configured:
-        genai.configure(api_key=api_key)
-        _is_configured = True
-
-def embed_text(text: str) -> List[float]:
-    if not _is_configured:
-        init_google_embeddings(cfg.GOOGLE_API_KEY, cfg.GOOGLE_EMBED_MODEL)
+# output size of the embedding models we know, EMBED_DIMENSIONS overrides
+EMBED_MODEL_DIMENSIONS = {
+    "models/embedding-001": 768,
+    "models/text-embedding-004": 768,
+    "models/text-embedding-005": 768,
+    "models/gemini-embedding-001": 3072,
+}
+_dimensions: Optional[int] = None
 
+def embed_text(text: str, task_type: str = "retrieval_document") -> List[float]:
     max_retries = 3
     backoff = 1.0
     for attempt in range(max_retries):
         try:
-            response = genai.embed_content(
-                model=cfg.GOOGLE_EMBED_MODEL,
-                content=text,
-                task_type="retrieval_document"
-            )
+            with timed(EMBED_REQUEST_SECONDS, kind="single"):
+                response = get_genai().embed_content(
+                    model=cfg.GOOGLE_EMBED_MODEL,
+                    content=text,
+                    task_type=task_type
+                )
             embedding = response["embedding"]
             time.sleep(EMBED_THROTTLE_SECONDS)
             return embedding
@@ -35,28 +38,98 @@ def embed_text(text: str) -> List[float]:
         except Exception as e:
             error_str = str(e).lower()
             is_rate_limited = ("429" in error_str) or ("rate limit" in error_str)
+            if is_rate_limited:
+                RATE_LIMITED.labels(call="embed").inc()
             if is_rate_limited and attempt < max_retries - 1:
+                RETRIES.labels(call="embed", reason="rate_limited").inc()
                 print(f"Rate-limited or transient error. Retrying in {backoff}s. Error={e}")
                 time.sleep(backoff)
                 backoff *= 2
             else:
                 print(f"Error in embed_text (attempt {attempt+1}/{max_retries}): {e}")
                 if attempt >= max_retries - 1:
-                    return [0.0]*768
+                    return zero_vector()
+
+
+def embedding_dimensions() -> int:
+    """vector size of GOOGLE_EMBED_MODEL, asks the model once if we don't know it"""
+    global _dimensions
+    if _dimensions is None:
+        known = cfg.EMBED_DIMENSIONS or EMBED_MODEL_DIMENSIONS.get(cfg.GOOGLE_EMBED_MODEL)
+        if known:
+            _dimensions = known
+        else:
+            response = get_genai().embed_content(
+                model=cfg.GOOGLE_EMBED_MODEL,
+                content="dimension probe",
+                task_type="retrieval_document",
+            )
+            _dimensions = len(response["embedding"])
+            print(f"{cfg.GOOGLE_EMBED_MODEL} returns {_dimensions}-dim vectors")
+    return _dimensions
+
 
-def batch_embed_texts(texts: List[str]) -> List[List[float]]:
+def zero_vector() -> List[float]:
+    """what a failed embed comes back as, callers treat all zeros as missing"""
+    size = _dimensions or cfg.EMBED_DIMENSIONS or EMBED_MODEL_DIMENSIONS.get(
+        cfg.GOOGLE_EMBED_MODEL, 768
+    )
+    return [0.0] * size
+
+
+async def aembed_text(text: str, task_type: str = "retrieval_document") -> List[float]:
+    """embed_text for coroutines, goes through the shared async engine without blocking the loop"""
+    vectors = await get_embedding_engine().aembed_many([text], task_type)
+    return vectors[0]
+
+
+def batch_embed_texts(
+    texts: List[str],
+    task_type: str = "retrieval_document",
+    stats: Optional[Dict[str, int]] = None,
+) -> List[List[float]]:
     """
-    because 0.8.4's embed_content doesn't support multi-doc arrays, we do one doc at a time....
-    we can still chunk them or parallelize at a higher level if we want.
+    anything already in the embedding cache is returned without an API call.
+    the rest goes through the async engine, which packs them into multi-doc requests
+    (falling back to single calls for batches that fail) with concurrency and an
+    adaptive rate limit. EMBED_ENGINE=sync keeps the old one-doc-at-a-time loop.
+    pass a stats dict to get cache_hits / cache_misses added to it.
     """
     if not texts:
         return []
 
-    if not _is_configured:
-        init_google_embeddings(cfg.GOOGLE_API_KEY, cfg.GOOGLE_EMBED_MODEL)
+    cache = get_embedding_cache()
+    hashes = [text_hash(t) for t in texts]
+    cached = cache.get_many(cfg.GOOGLE_EMBED_MODEL, task_type, hashes) if cache else {}
+
+    # only embed each distinct missing text once
+    missing = {}
+    for text, h in zip(texts, hashes):
+        if h not in cached and h not in missing:
+            missing[h] = text
+
+    fresh = {}
+    if missing:
+        miss_texts = list(missing.values())
+        if cfg.EMBED_ENGINE == "async":
+            vectors = get_embedding_engine().embed_many(miss_texts, task_type)
+        else:
+            vectors = [embed_text(t, task_type=task_type) for t in miss_texts]
+        fresh = dict(zip(missing.keys(), vectors))
+
+    if cache and fresh:
+        # failed embeds come back as all zeros, don't keep those around
+        cache.put_many(
+            cfg.GOOGLE_EMBED_MODEL,
+            task_type,
+            {h: v for h, v in fresh.items() if any(v)},
+        )
+
+    hits = sum(1 for h in hashes if h in cached)
+    if cache:
+        count_cache("embedding", hits, len(texts) - hits)
+    if stats is not None:
+        stats["cache_hits"] = stats.get("cache_hits", 0) + hits
+        stats["cache_misses"] = stats.get("cache_misses", 0) + len(texts) - hits
 
-    results = []
-    for text in texts:
-        vec = embed_text(text)
-        results.append(vec)
-    return results
+    return [cached[h] if h in cached else fresh[h] for h in hashes]
@@ -0,0 +1,154 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from services.config import Config
+
+cfg = Config()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vec = array("f")
+    vec.frombytes(blob)
+    return vec.tolist()
+
+
+class EmbeddingCache:
+    """
+    on-disk embedding cache keyed by (model, task_type, sha256(text)).
+    vectors are stored as float32 blobs in sqlite, least recently used rows get
+    evicted once we go over max_entries.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_evict = 0
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    task_type TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, task_type, text_hash)
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get_many(
+        self, model: str, task_type: str, hashes: List[str]
+    ) -> Dict[str, List[float]]:
+        """look up a bunch of text hashes, returns {hash: vector} for the ones we have"""
+        if not hashes:
+            return {}
+
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        now = time.time()
+        with self.lock:
+            conn = self._get_conn()
+            # sqlite caps bound params, stay well under it
+            for i in range(0, len(unique), 500):
+                chunk = unique[i : i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND task_type = ? AND text_hash IN ({placeholders})",
+                    [model, task_type, *chunk],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = _unpack(blob)
+
+            if found:
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? "
+                    "WHERE model = ? AND task_type = ? AND text_hash = ?",
+                    [(now, model, task_type, h) for h in found],
+                )
+                conn.commit()
+        return found
+
+    def put_many(
+        self, model: str, task_type: str, items: Dict[str, Sequence[float]]
+    ):
+        if not items:
+            return
+
+        now = time.time()
+        with self.lock:
+            conn = self._get_conn()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, task_type, text_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(model, task_type, h, _pack(v), now) for h, v in items.items()],
+            )
+            conn.commit()
+
+            self._writes_since_evict += len(items)
+            # counting rows on every write is wasteful, only check every so often
+            if self._writes_since_evict >= 1000:
+                self._writes_since_evict = 0
+                self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return
+
+        conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (overflow,),
+        )
+        conn.commit()
+        print(f"Embedding cache evicted {overflow} entries")
+
+    def close(self):
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """shared cache for this process, None if caching is turned off"""
+    global _cache
+    if not cfg.EMBED_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(cfg.EMBED_CACHE_PATH, cfg.EMBED_CACHE_MAX_ENTRIES)
+    return _cache
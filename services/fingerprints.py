@@ -0,0 +1,74 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+
+from pymongo import UpdateOne
+from services.mongo import get_mongo_client
+
+# json.dumps builds a fresh encoder on every call when given options, share one
+_encode_metadata = json.JSONEncoder(sort_keys=True, default=str).encode
+
+
+def compute_fingerprint(summary: str, metadata: Dict[str, Any]) -> str:
+    """
+    hash of everything that ends up in qdrant for a row (summary text + payload),
+    so any change to a field we summarize or store flips the fingerprint
+    """
+    h = hashlib.sha256()
+    h.update(summary.encode("utf-8"))
+    h.update(b"\0")
+    h.update(_encode_metadata(metadata).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _collection():
+    return get_mongo_client().exempla.embedding_fingerprints
+
+
+def ensure_fingerprint_indexes():
+    _collection().create_index([("dataset_id", 1), ("point_id", 1)], unique=True)
+
+
+def load_fingerprints(dataset_id: int, version: int) -> Dict[str, str]:
+    """point_id -> fingerprint for everything in one version of the dataset"""
+    cursor = _collection().find(
+        {"dataset_id": dataset_id, "version": version},
+        {"_id": 0, "point_id": 1, "fingerprint": 1},
+    )
+    return {doc["point_id"]: doc["fingerprint"] for doc in cursor}
+
+
+def save_fingerprints(
+    dataset_id: int,
+    version: int,
+    kind: str,
+    point_ids: List[str],
+    fingerprints: List[str],
+):
+    if not point_ids:
+        return
+
+    now = datetime.utcnow()
+    ops = [
+        UpdateOne(
+            {"dataset_id": dataset_id, "point_id": point_id},
+            {"$set": {"version": version, "kind": kind, "fingerprint": fp, "updated_at": now}},
+            upsert=True,
+        )
+        for point_id, fp in zip(point_ids, fingerprints)
+    ]
+    _collection().bulk_write(ops, ordered=False)
+
+
+def delete_fingerprints(dataset_id: int, point_ids: Iterable[str]):
+    point_ids = list(point_ids)
+    for i in range(0, len(point_ids), 1000):
+        _collection().delete_many(
+            {"dataset_id": dataset_id, "point_id": {"$in": point_ids[i : i + 1000]}}
+        )
+
+
+def delete_other_versions(dataset_id: int, keep_version: int):
+    """also drops fingerprints from before versioning, which have no version at all"""
+    _collection().delete_many({"dataset_id": dataset_id, "version": {"$ne": keep_version}})
@@ -0,0 +1,23 @@
+import threading
+
+from services.config import Config
+
+# google.generativeai pulls in grpc and protobuf (~0.7s), so it's only imported
+# (and configured with the API key) the first time something actually calls Gemini
+
+cfg = Config()
+
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def get_genai():
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+
+                genai.configure(api_key=cfg.GOOGLE_API_KEY)
+                _genai = genai
+    return _genai
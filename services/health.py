@@ -0,0 +1,108 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Callable, Dict, List, Tuple
+
+from services.aggregation import ensure_aggregation_indexes
+from services.config import Config
+from services.job_queue import ensure_job_indexes
+from services.mongo import ensure_status_indexes, get_mongo_client
+from services.task_manager import task_manager
+from services.vector_store import ensure_collection, ensure_payload_indexes, ping_vector_store
+
+# startup setup and the /healthz + /readyz probes. the API process starts serving
+# straight away, a slow or unreachable Mongo/Qdrant only keeps it out of rotation
+# (readyz 503) until setup has gone through, instead of failing the whole boot.
+
+cfg = Config()
+
+
+def _mongo_indexes():
+    ensure_status_indexes()
+    ensure_job_indexes()
+    ensure_aggregation_indexes()
+
+
+def _vector_collection():
+    ensure_collection()
+    ensure_payload_indexes()
+
+
+STARTUP_STEPS: List[Tuple[str, Callable[[], None]]] = [
+    ("mongo", _mongo_indexes),
+    ("vector_store", _vector_collection),
+]
+
+_started = threading.Event()
+_startup_errors: Dict[str, str] = {}
+
+
+def run_startup(stop_event: threading.Event):
+    """run each setup step until it succeeds, backing off between rounds"""
+    pending = dict(STARTUP_STEPS)
+    delay = 1.0
+    while pending and not stop_event.is_set():
+        for name, step in list(pending.items()):
+            try:
+                step()
+                del pending[name]
+                _startup_errors.pop(name, None)
+            except Exception as e:
+                _startup_errors[name] = str(e)
+                print(f"Startup step {name} failed, retrying in {delay:.0f}s: {str(e)}")
+        if pending:
+            stop_event.wait(delay)
+            delay = min(delay * 2, cfg.STARTUP_RETRY_MAX_SECONDS)
+    if not pending:
+        _started.set()
+        print("Startup complete")
+
+
+def start_startup_thread(stop_event: threading.Event) -> threading.Thread:
+    thread = threading.Thread(target=run_startup, args=(stop_event,), name="startup", daemon=True)
+    thread.start()
+    return thread
+
+
+def startup_complete() -> bool:
+    return _started.is_set()
+
+
+def _ping_mongo():
+    get_mongo_client().admin.command("ping")
+
+
+DEPENDENCY_CHECKS: List[Tuple[str, Callable[[], None]]] = [
+    ("mongo", _ping_mongo),
+    ("vector_store", ping_vector_store),
+]
+
+# checks that hang past the timeout keep their thread until the client's own
+# timeout fires, a few spares keep the next probe from queueing behind them
+_check_pool = ThreadPoolExecutor(max_workers=len(DEPENDENCY_CHECKS) * 2, thread_name_prefix="readyz")
+
+
+def readiness() -> Tuple[bool, Dict[str, str]]:
+    """(ready, check name -> "ok" or what went wrong)"""
+    checks: Dict[str, str] = {}
+    if task_manager.should_shutdown():
+        # out of rotation while in-flight requests drain
+        checks["shutdown"] = "draining"
+    if startup_complete():
+        checks["startup"] = "ok"
+    else:
+        failing = ", ".join(f"{name}: {error}" for name, error in _startup_errors.items())
+        checks["startup"] = f"pending ({failing})" if failing else "pending"
+
+    futures = {name: _check_pool.submit(check) for name, check in DEPENDENCY_CHECKS}
+    deadline = time.monotonic() + cfg.READINESS_TIMEOUT_SECONDS
+    for name, future in futures.items():
+        try:
+            future.result(timeout=max(deadline - time.monotonic(), 0))
+            checks[name] = "ok"
+        except FutureTimeout:
+            checks[name] = f"timed out after {cfg.READINESS_TIMEOUT_SECONDS}s"
+        except Exception as e:
+            checks[name] = str(e) or type(e).__name__
+    return all(value == "ok" for value in checks.values()), checks
@@ -0,0 +1,239 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from services.config import Config
+from services.mongo import get_mongo_client
+
+cfg = Config()
+
+# mongo backed queue for embed jobs.
+#
+# a job is "active" while it's queued or running, and a partial unique index on
+# dataset_id over active jobs means there's only ever one live job per dataset.
+# workers claim a job by taking a lease, keep it alive with heartbeats, and if a
+# worker dies its lease runs out and another worker picks the job back up (resuming
+# from the checkpoint in embedding_status).
+
+
+def _jobs():
+    return get_mongo_client().exempla.embedding_jobs
+
+
+_indexes_ready = False
+_indexes_lock = threading.Lock()
+
+
+def ensure_job_indexes():
+    jobs = _jobs()
+    jobs.create_index(
+        [("dataset_id", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"active": True},
+        name="one_active_job_per_dataset",
+    )
+    jobs.create_index([("active", ASCENDING), ("status", ASCENDING), ("available_at", ASCENDING)])
+    jobs.create_index([("active", ASCENDING), ("lease_expires_at", ASCENDING)])
+
+
+def enqueue_job(
+    dataset_id: int, incremental: bool = False, resume: bool = False
+) -> Tuple[Dict[str, Any], bool]:
+    """queue a job for the dataset. returns (job, created), created is False if one was already live"""
+    now = datetime.utcnow()
+    job = {
+        "dataset_id": dataset_id,
+        "incremental": incremental,
+        "resume": resume,
+        "status": "queued",
+        "active": True,
+        "attempts": 0,
+        "max_attempts": cfg.EMBED_JOB_MAX_ATTEMPTS,
+        "created_at": now,
+        "available_at": now,
+        "worker_id": None,
+        "lease_expires_at": None,
+        "error": None,
+    }
+    # make sure the unique index exists before taking work, without it two concurrent
+    # upserts could both insert. startup creates it too, this covers the window before
+    _ensure_job_indexes_once()
+    job["_id"] = ObjectId()
+    # dataset_id and active come from the filter on insert
+    on_insert = {k: v for k, v in job.items() if k not in ("dataset_id", "active")}
+    for _ in range(2):
+        try:
+            # only inserts when the dataset has no active job, otherwise returns that one
+            current = _jobs().find_one_and_update(
+                {"dataset_id": dataset_id, "active": True},
+                {"$setOnInsert": on_insert},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            return current, current["_id"] == job["_id"]
+        except DuplicateKeyError:
+            # lost an insert race against another enqueue, the next round finds its job
+            continue
+    existing = _jobs().find_one({"dataset_id": dataset_id, "active": True})
+    return existing, False
+
+
+def _ensure_job_indexes_once():
+    global _indexes_ready
+    if not _indexes_ready:
+        with _indexes_lock:
+            if not _indexes_ready:
+                ensure_job_indexes()
+                _indexes_ready = True
+
+
+def claim_job(worker_id: str) -> Optional[Dict[str, Any]]:
+    """
+    lease the oldest runnable job: queued and due, or running with an expired lease
+    (its worker went away). returns None if there's nothing to do.
+    """
+    now = datetime.utcnow()
+    return _jobs().find_one_and_update(
+        {
+            "active": True,
+            "$or": [
+                {"status": "queued", "available_at": {"$lte": now}},
+                {"status": "running", "lease_expires_at": {"$lt": now}},
+            ],
+            "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+        },
+        {
+            "$set": {
+                "status": "running",
+                "worker_id": worker_id,
+                "lease_expires_at": now + timedelta(seconds=cfg.EMBED_JOB_LEASE_SECONDS),
+                "heartbeat_at": now,
+                "started_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def heartbeat(job_id: Any, worker_id: str) -> bool:
+    """extend our lease, False means someone else owns the job now"""
+    now = datetime.utcnow()
+    result = _jobs().update_one(
+        {"_id": job_id, "worker_id": worker_id, "status": "running"},
+        {
+            "$set": {
+                "heartbeat_at": now,
+                "lease_expires_at": now + timedelta(seconds=cfg.EMBED_JOB_LEASE_SECONDS),
+            }
+        },
+    )
+    return result.matched_count == 1
+
+
+def complete_job(job_id: Any, worker_id: str):
+    _jobs().update_one(
+        {"_id": job_id, "worker_id": worker_id},
+        {
+            "$set": {
+                "status": "completed",
+                "active": False,
+                "completed_at": datetime.utcnow(),
+                "lease_expires_at": None,
+            }
+        },
+    )
+
+
+def release_job(job_id: Any, worker_id: str):
+    """
+    hand an interrupted job straight back to the queue (e.g. on shutdown).
+    doesn't count as an attempt, and the next run resumes from the checkpoint.
+    """
+    _jobs().update_one(
+        {"_id": job_id, "worker_id": worker_id},
+        {
+            "$set": {
+                "status": "queued",
+                "resume": True,
+                "worker_id": None,
+                "lease_expires_at": None,
+                "available_at": datetime.utcnow(),
+            },
+            "$inc": {"attempts": -1},
+        },
+    )
+
+
+def fail_job(job: Dict[str, Any], worker_id: str, error: str):
+    """retry later (resuming) if there are attempts left, otherwise give up"""
+    now = datetime.utcnow()
+    if job.get("attempts", 0) < job.get("max_attempts", cfg.EMBED_JOB_MAX_ATTEMPTS):
+        update = {
+            "status": "queued",
+            "resume": True,
+            "worker_id": None,
+            "lease_expires_at": None,
+            "available_at": now + timedelta(seconds=cfg.EMBED_JOB_RETRY_DELAY_SECONDS),
+            "error": error,
+        }
+    else:
+        update = {
+            "status": "failed",
+            "active": False,
+            "failed_at": now,
+            "lease_expires_at": None,
+            "error": error,
+        }
+    _jobs().update_one({"_id": job["_id"], "worker_id": worker_id}, {"$set": update})
+
+
+def fail_exhausted_jobs() -> int:
+    """jobs whose worker died on the last attempt never get claimed again, close them out"""
+    now = datetime.utcnow()
+    result = _jobs().update_many(
+        {
+            "active": True,
+            "status": "running",
+            "lease_expires_at": {"$lt": now},
+            "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+        },
+        {
+            "$set": {
+                "status": "failed",
+                "active": False,
+                "failed_at": now,
+                "error": "Lease expired on final attempt",
+            }
+        },
+    )
+    return result.modified_count
+
+
+def get_active_job(dataset_id: int) -> Optional[Dict[str, Any]]:
+    return _jobs().find_one({"dataset_id": dataset_id, "active": True})
+
+
+def requeue_interrupted_jobs() -> int:
+    """
+    datasets left "interrupted" with a checkpoint but no live job (e.g. the process
+    was killed before it could release its job) get a resume job queued
+    """
+    embedding_status = get_mongo_client().exempla.embedding_status
+    interrupted = embedding_status.find(
+        {"status": "interrupted", "checkpoint": {"$ne": None}},
+        {"dataset_id": 1, "incremental": 1},
+    )
+    queued = 0
+    for record in interrupted:
+        _, created = enqueue_job(
+            record["dataset_id"], incremental=record.get("incremental", False), resume=True
+        )
+        if created:
+            queued += 1
+            print(f"Queued resume job for interrupted dataset {record['dataset_id']}")
+    return queued
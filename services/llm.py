@@ -1,35 +1,25 @@
-import google.generativeai as genai
+import time
+from typing import AsyncIterator
+from services.async_embedding import estimate_tokens
 from services.config import Config
+from services.metrics import LLM_FIRST_TOKEN_SECONDS, LLM_SECONDS, timed
+from services.context_builder import build_context
+from services.genai_client import get_genai
 
 cfg = Config()
-genai.configure(api_key=cfg.GOOGLE_API_KEY)
 _model = None
 
 
 def get_model():
     global _model
     if _model is None:
-        _model = genai.GenerativeModel(cfg.GOOGLE_CHAT_MODEL)
+        _model = get_genai().GenerativeModel(cfg.GOOGLE_CHAT_MODEL)
     return _model
 
 
-def generate_chat_response(user_prompt, docs, filter_options):
-    context_text = "Here are some relevant documents from the dataset:\n\n"
-
-    for i, doc in enumerate(docs):
-        context_text += f"\n--- Document {i+1} ---\n"
-
-        if "metadata" in doc:
-            metadata = doc["metadata"]
-            context_text += "Metadata:\n"
-            for key, value in metadata.items():
-                context_text += f"- {key}: {value}\n"
-
-        if doc.get("content"):
-            context_text += f"\nContent:\n{doc['content']}\n"
-
-        if doc.get("score"):
-            context_text += f"\nRelevance score: {doc['score']:.4f}\n"
+def build_chat_prompt(user_prompt, docs, filter_options, token_budget=None):
+    """returns the prompt plus token/doc counts for it"""
+    context_text, usage = build_context(docs, token_budget)
 
     filter_text = ""
     if filter_options:
@@ -37,25 +27,114 @@ def generate_chat_response(user_prompt, docs, filter_options):
 
     prompt = f"""
     You are an AI assistant helping with infrastructure data analysis.
-    
-    {context_text}
+
+    Here are the most relevant records from the dataset:
+
+{context_text}
     {filter_text}
-    
+
+    User question: {user_prompt}
+
+    Please provide a helpful response based on the information above. If the information needed to answer the question is not available in the records, explain what information is missing.
+    """
+
+    usage["prompt_tokens"] = estimate_tokens(prompt)
+    return prompt, usage
+
+
+def build_aggregate_prompt(user_prompt, aggregation):
+    groups_text = "\n".join(
+        f"- {row['group'] if row['group'] is not None else 'all'}: {row['value']} ({row['rows']} rows)"
+        for row in aggregation["groups"]
+    ) or "- no matching rows"
+    truncated = (
+        "\nOnly the top groups are listed." if aggregation.get("truncated") else ""
+    )
+
+    return f"""
+    You are an AI assistant helping with infrastructure data analysis.
+
+    The following result was computed exactly from the full dataset ({aggregation['query']}):
+    {groups_text}{truncated}
+
     User question: {user_prompt}
-    
-    Please provide a helpful response based on the information above. If the information needed to answer the question is not available in the documents, explain what information is missing.
+
+    Answer the question using these computed numbers as-is. Do not recalculate or estimate them.
+    If the computation above doesn't match what the question asks (a condition it left out,
+    a different measure), say that it can't be answered from it instead of using it.
     """
-    
-    print(f"LLM PROMPT:\n{prompt}")
+
+
+def generate_chat_response(user_prompt, docs, filter_options, token_budget=None):
+    """returns the answer and the prompt usage counts"""
+    prompt, usage = build_chat_prompt(user_prompt, docs, filter_options, token_budget)
+    print(
+        f"LLM prompt: ~{usage['prompt_tokens']} tokens, "
+        f"{usage['docs_used']}/{usage['docs_in']} docs used"
+    )
     response = call_llm(prompt)
-    return response
+    return response, usage
 
 
 def call_llm(prompt):
     try:
         model = get_model()
-        response = model.generate_content(prompt)
+        with timed(LLM_SECONDS, call="generate"):
+            response = model.generate_content(prompt)
         return response.text
     except Exception as e:
         print(f"Error calling LLM: {str(e)}")
         return f"Sorry, I encountered an error: {str(e)}"
+
+
+class LLMStreamError(Exception):
+    """the stream broke off: the model blocked the answer or the call failed"""
+
+
+def _reason_name(reason) -> str:
+    return getattr(reason, "name", str(reason))
+
+
+def _chunk_text(chunk) -> str:
+    """
+    chunk.text raises ValueError when the chunk has no text, which is either an
+    empty chunk at the end of the stream or the answer getting blocked
+    """
+    try:
+        return chunk.text
+    except ValueError:
+        feedback = getattr(chunk, "prompt_feedback", None)
+        block_reason = getattr(feedback, "block_reason", None)
+        if block_reason:
+            raise LLMStreamError(f"The prompt was blocked ({_reason_name(block_reason)})")
+        for candidate in getattr(chunk, "candidates", None) or []:
+            reason = _reason_name(candidate.finish_reason)
+            if reason not in ("STOP", "FINISH_REASON_UNSPECIFIED"):
+                raise LLMStreamError(f"The answer was stopped by the model ({reason})")
+        return ""
+
+
+async def stream_llm(prompt) -> AsyncIterator[str]:
+    """
+    yield the answer text chunk by chunk as the model produces it. raises
+    LLMStreamError if the answer gets blocked or the call fails midway
+    """
+    try:
+        model = get_model()
+        start = time.perf_counter()
+        first_token = False
+        response = await model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                if not first_token:
+                    first_token = True
+                    LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start)
+                yield text
+        LLM_SECONDS.labels(call="stream").observe(time.perf_counter() - start)
+    except LLMStreamError as e:
+        print(f"LLM stream stopped: {str(e)}")
+        raise
+    except Exception as e:
+        print(f"Error streaming from LLM: {str(e)}")
+        raise LLMStreamError(f"Sorry, I encountered an error: {str(e)}") from e
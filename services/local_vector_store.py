@@ -0,0 +1,481 @@
+import json
+import math
+import os
+import threading
+from collections import namedtuple
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+from qdrant_client.http import models
+from services.config import Config
+from services.embedding import embedding_dimensions
+from services.qdrant_filters import build_search_filter, parse_filter_options
+from services.sparse import sparse_vector_for_query
+from services.vector_backend import VectorBackend, process_hits, rrf_fuse, strong_sparse_hits
+
+try:
+    import hnswlib
+except ImportError:  # optional, only needed for LOCAL_VECTOR_INDEX=hnsw
+    hnswlib = None
+
+cfg = Config()
+
+_Hit = namedtuple("_Hit", ["id", "payload", "score"])
+
+# point type codes for _Partition.types, anything else is -1
+_TYPE_CODES = {"vm": 0, "host": 1}
+# version code for points without one (datasets embedded before versioning)
+_NO_VERSION = -1
+
+
+def _as_list(value) -> List[Any]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def payload_matches(payload: Dict[str, Any], condition) -> bool:
+    """evaluate the qdrant filters build_search_filter produces against a plain payload"""
+    if isinstance(condition, models.Filter):
+        if not all(payload_matches(payload, c) for c in _as_list(condition.must)):
+            return False
+        should = _as_list(condition.should)
+        if should and not any(payload_matches(payload, c) for c in should):
+            return False
+        return not any(payload_matches(payload, c) for c in _as_list(condition.must_not))
+
+    values = _as_list(payload.get(condition.key))
+    match = condition.match
+    if isinstance(match, models.MatchValue):
+        return any(v == match.value for v in values)
+    if isinstance(match, models.MatchAny):
+        return any(v in match.any for v in values)
+    if isinstance(match, models.MatchText):
+        text = match.text.lower()
+        return any(text in str(v).lower() for v in values)
+    if condition.range is not None:
+        r = condition.range
+        for v in values:
+            if not isinstance(v, (int, float)) or isinstance(v, bool):
+                continue
+            if r.gte is not None and v < r.gte:
+                continue
+            if r.lte is not None and v > r.lte:
+                continue
+            if r.gt is not None and v <= r.gt:
+                continue
+            if r.lt is not None and v >= r.lt:
+                continue
+            return True
+        return False
+    print(f"Unsupported filter condition on {condition.key}, ignoring it")
+    return True
+
+
+class _IvfIndex:
+    """coarse k-means partitioning, search only looks at the nprobe closest lists"""
+
+    def __init__(self, vectors: np.ndarray, iterations: int = 10):
+        n = len(vectors)
+        nlist = max(1, int(math.sqrt(n)))
+        rng = np.random.default_rng(0)
+        centroids = vectors[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = vectors[assign == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+        self.centroids = centroids
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        self.lists = [np.flatnonzero(assign == c) for c in range(nlist)]
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        nprobe = min(nprobe, len(self.lists))
+        closest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self.lists[c] for c in closest])
+
+
+def _version_code(payload: Dict[str, Any]) -> int:
+    version = payload.get("version")
+    return version if isinstance(version, int) and not isinstance(version, bool) else _NO_VERSION
+
+
+def _type_code(payload: Dict[str, Any]) -> int:
+    return _TYPE_CODES.get(payload.get("type"), -1)
+
+
+class _Partition:
+    """
+    all points of one dataset: a row per point in a (capacity, dim) float32 matrix,
+    plus version and type columns so the common filters don't have to touch payloads
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.payloads: List[Dict[str, Any]] = []
+        self.sparse: List[Dict[int, float]] = []
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.versions = np.zeros(0, dtype=np.int64)
+        self.types = np.zeros(0, dtype=np.int8)
+        self.writable = True
+        self.dirty = False
+        self.index = None
+        # rows written since the index was built, searched exactly until the next rebuild
+        self.stale: Set[int] = set()
+        self.doc_freq: Optional[Dict[int, int]] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self.matrix[: self.size]
+
+    def _changed(self, row: Optional[int]):
+        self.dirty = True
+        if self.index is not None and row is not None:
+            self.stale.add(row)
+        self.doc_freq = None
+
+    def _set_columns(self, row: int, payload: Dict[str, Any]):
+        self.versions[row] = _version_code(payload)
+        self.types[row] = _type_code(payload)
+
+    def load_columns(self):
+        self.versions = np.fromiter(map(_version_code, self.payloads), dtype=np.int64, count=self.size)
+        self.types = np.fromiter(map(_type_code, self.payloads), dtype=np.int8, count=self.size)
+
+    def _reserve(self, extra: int):
+        if not self.writable:
+            # loaded as a read-only memmap, copy on first write
+            self.matrix = np.array(self.matrix, dtype=np.float32)
+            self.writable = True
+        needed = self.size + extra
+        if needed > len(self.matrix):
+            capacity = max(needed, 2 * len(self.matrix), 64)
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[: self.size] = self.vectors
+            self.matrix = grown
+        if needed > len(self.versions):
+            capacity = max(needed, len(self.matrix))
+            self.versions = np.resize(self.versions, capacity)
+            self.types = np.resize(self.types, capacity)
+
+    def upsert(self, doc_id: str, vector: np.ndarray, payload, sparse):
+        row = self.rows.get(doc_id)
+        if row is None:
+            self._reserve(1)
+            row = self.size
+            self.rows[doc_id] = row
+            self.ids.append(doc_id)
+            self.payloads.append(payload)
+            self.sparse.append(sparse)
+        else:
+            self._reserve(0)
+            self.payloads[row] = payload
+            self.sparse[row] = sparse
+        self.matrix[row] = vector
+        self._set_columns(row, payload)
+        self._changed(row)
+
+    def delete(self, doc_id: str) -> bool:
+        row = self.rows.pop(doc_id, None)
+        if row is None:
+            return False
+        self._reserve(0)
+        last = self.size - 1
+        if row != last:
+            # move the last row into the hole
+            moved = self.ids[last]
+            self.matrix[row] = self.matrix[last]
+            self.versions[row] = self.versions[last]
+            self.types[row] = self.types[last]
+            self.ids[row] = moved
+            self.payloads[row] = self.payloads[last]
+            self.sparse[row] = self.sparse[last]
+            self.rows[moved] = row
+        self.ids.pop()
+        self.payloads.pop()
+        self.sparse.pop()
+        # the index may still hand out `last`, search drops rows past size
+        self.stale.discard(last)
+        self._changed(row if row != last else None)
+        return True
+
+
+class LocalVectorStore(VectorBackend):
+    """
+    in-process backend: numpy matrices per dataset_id, brute force search for small
+    datasets and IVF or HNSW (if hnswlib is installed) above LOCAL_INDEX_MIN_POINTS.
+    flush() saves each dataset as a .npy matrix plus a json sidecar under root,
+    loading maps the .npy read-only so large datasets don't get copied into memory.
+    """
+
+    def __init__(self, root: str, dim: Optional[int] = None):
+        self.root = root
+        self.dim = dim or embedding_dimensions()
+        self.partitions: Dict[int, _Partition] = {}
+        self.lock = threading.RLock()
+
+    def _dir(self, dataset_id: int) -> str:
+        return os.path.join(self.root, f"dataset_{dataset_id}")
+
+    def _partition(self, dataset_id: int, create: bool = False) -> Optional[_Partition]:
+        part = self.partitions.get(dataset_id)
+        if part is None:
+            part = self._load(dataset_id)
+            if part is None and create:
+                part = _Partition(self.dim)
+            if part is not None:
+                self.partitions[dataset_id] = part
+        return part
+
+    def _load(self, dataset_id: int) -> Optional[_Partition]:
+        path = self._dir(dataset_id)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        part = _Partition(self.dim)
+        part.ids = meta["ids"]
+        part.rows = {doc_id: row for row, doc_id in enumerate(part.ids)}
+        part.payloads = meta["payloads"]
+        part.sparse = [dict(zip(i, v)) for i, v in meta["sparse"]]
+        part.matrix = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        part.writable = False
+        part.load_columns()
+        return part
+
+    def _load_all(self):
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            if name.startswith("dataset_"):
+                try:
+                    self._partition(int(name[len("dataset_"):]))
+                except ValueError:
+                    continue
+
+    def upsert(self, doc_ids, vectors, metadata_list, sparse_vectors=None) -> List[str]:
+        failed_ids = []
+        with self.lock:
+            for i, doc_id in enumerate(doc_ids):
+                vector = np.asarray(vectors[i], dtype=np.float32)
+                if vector.shape != (self.dim,):
+                    print(f"Error creating point for document {doc_id}: wrong dimension")
+                    failed_ids.append(str(doc_id))
+                    continue
+                # store unit vectors so dot product is cosine similarity
+                vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+                sparse = {}
+                if sparse_vectors is not None:
+                    indices, values = sparse_vectors[i]
+                    sparse = dict(zip(indices, values))
+                part = self._partition(metadata_list[i].get("dataset_id"), create=True)
+                part.upsert(str(doc_id), vector, metadata_list[i], sparse)
+        return failed_ids
+
+    def _mask(
+        self, part: _Partition, dataset_id: int, filter_options, version
+    ) -> Optional[np.ndarray]:
+        """
+        dataset_id, version and type conditions are numpy comparisons on the partition
+        columns, anything else is checked against the payloads of the rows left over
+        """
+        options = parse_filter_options(filter_options)
+        if options is None and version is None:
+            # the partition already is the dataset_id filter
+            return None
+        query_filter = build_search_filter(dataset_id, options, version)
+        mask = np.ones(part.size, dtype=bool)
+        rest = []
+        for condition in _as_list(query_filter.must):
+            key = getattr(condition, "key", None)
+            match = getattr(condition, "match", None)
+            if key == "dataset_id" and isinstance(match, models.MatchValue):
+                continue
+            if key == "version" and isinstance(match, models.MatchValue):
+                mask &= part.versions[: part.size] == match.value
+            elif key == "type" and isinstance(match, models.MatchValue):
+                mask &= part.types[: part.size] == _TYPE_CODES.get(match.value, -2)
+            else:
+                rest.append(condition)
+        if rest or query_filter.should or query_filter.must_not:
+            rest_filter = models.Filter(
+                must=rest, should=query_filter.should, must_not=query_filter.must_not
+            )
+            for row in np.flatnonzero(mask):
+                if not payload_matches(part.payloads[row], rest_filter):
+                    mask[row] = False
+        return mask
+
+    def _ensure_index(self, part: _Partition):
+        """build the index on first search, rebuild it once too many rows changed since"""
+        if part.size < cfg.LOCAL_INDEX_MIN_POINTS:
+            part.index = None
+            part.stale.clear()
+            return
+        if part.index is not None and len(part.stale) <= cfg.LOCAL_INDEX_STALE_RATIO * part.size:
+            return
+        part.index = None
+        part.stale.clear()
+        if cfg.LOCAL_VECTOR_INDEX == "ivf":
+            part.index = _IvfIndex(np.asarray(part.vectors))
+        elif cfg.LOCAL_VECTOR_INDEX == "hnsw" and hnswlib is not None:
+            index = hnswlib.Index(space="ip", dim=self.dim)
+            index.init_index(max_elements=part.size, ef_construction=200, M=16)
+            index.add_items(np.asarray(part.vectors), np.arange(part.size))
+            part.index = index
+
+    def _dense(self, part: _Partition, query: np.ndarray, limit: int, mask) -> List[_Hit]:
+        self._ensure_index(part)
+        rows = None
+        if isinstance(part.index, _IvfIndex):
+            rows = part.index.candidates(query, cfg.LOCAL_IVF_NPROBE)
+        elif part.index is not None:
+            # over-fetch, the filter is applied afterwards
+            k = min(part.index.get_current_count(), limit * 4 if mask is not None else limit)
+            labels, _ = part.index.knn_query(query, k=k)
+            rows = labels[0].astype(np.int64)
+        if rows is not None:
+            # rows written since the build are scored exactly, deleted ones dropped
+            if part.stale:
+                rows = np.union1d(rows, np.fromiter(part.stale, dtype=np.int64))
+            rows = rows[rows < part.size]
+        if rows is not None and mask is not None:
+            rows = rows[mask[rows]]
+        if rows is None or len(rows) < limit:
+            # small dataset, no index, or the index came up short: exact scan
+            rows = np.flatnonzero(mask) if mask is not None else np.arange(part.size)
+
+        if not len(rows):
+            return []
+        scores = part.vectors[rows] @ query
+        if len(rows) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top])]
+        return [
+            _Hit(part.ids[rows[t]], part.payloads[rows[t]], float(scores[t])) for t in top
+        ]
+
+    def _sparse(self, part: _Partition, query_text: str, limit: int, mask) -> List[_Hit]:
+        indices, values = sparse_vector_for_query(query_text)
+        if not indices:
+            return []
+        if part.doc_freq is None:
+            doc_freq: Dict[int, int] = {}
+            for terms in part.sparse:
+                for term in terms:
+                    doc_freq[term] = doc_freq.get(term, 0) + 1
+            part.doc_freq = doc_freq
+        n = part.size
+        # same idf qdrant's Modifier.IDF uses
+        weights = {
+            term: value
+            * math.log(1 + (n - part.doc_freq.get(term, 0) + 0.5) / (part.doc_freq.get(term, 0) + 0.5))
+            for term, value in zip(indices, values)
+        }
+        hits = []
+        for row, terms in enumerate(part.sparse):
+            if mask is not None and not mask[row]:
+                continue
+            score = sum(w * terms[t] for t, w in weights.items() if t in terms)
+            if score > 0:
+                hits.append(_Hit(part.ids[row], part.payloads[row], score))
+        hits.sort(key=lambda h: h.score, reverse=True)
+        return hits[:limit]
+
+    def search(
+        self,
+        query_vector,
+        dataset_id,
+        top_k=5,
+        filter_options=None,
+        mode="dense",
+        query_text=None,
+        hnsw_ef=None,
+        oversampling=None,
+        version=None,
+    ):
+        """oversampling doesn't apply (no quantization), hnsw_ef only to the hnsw index"""
+        with self.lock:
+            part = self._partition(dataset_id)
+            if part is None or part.size == 0:
+                return []
+            query = np.asarray(query_vector, dtype=np.float32)
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+            mask = self._mask(part, dataset_id, filter_options, version)
+            self._ensure_index(part)
+            if part.index is not None and not isinstance(part.index, _IvfIndex):
+                part.index.set_ef(max(hnsw_ef or cfg.LOCAL_HNSW_EF, top_k))
+
+            if mode != "hybrid" or not query_text:
+                return process_hits(self._dense(part, query, top_k, mask))
+
+            limit = top_k * cfg.HYBRID_PREFETCH_FACTOR
+            result_lists = [self._dense(part, query, limit, mask)]
+            sparse_hits = strong_sparse_hits(
+                self._sparse(part, query_text, limit, mask), cfg.SPARSE_MIN_SCORE_RATIO
+            )
+            if sparse_hits:
+                result_lists.append(sparse_hits)
+            if len(result_lists) == 1:
+                return process_hits(result_lists[0][:top_k])
+            return process_hits(*rrf_fuse(result_lists, top_k))
+
+    def delete(self, doc_ids):
+        with self.lock:
+            self._load_all()
+            for doc_id in doc_ids:
+                for part in self.partitions.values():
+                    part.delete(str(doc_id))
+
+    def delete_dataset(self, dataset_id, keep_version=None):
+        with self.lock:
+            if keep_version is not None:
+                part = self._partition(dataset_id)
+                if part is not None:
+                    stale = [
+                        part.ids[row]
+                        for row in np.flatnonzero(part.versions[: part.size] != keep_version)
+                    ]
+                    for doc_id in stale:
+                        part.delete(doc_id)
+                    self.flush()
+                return
+            self.partitions.pop(dataset_id, None)
+            path = self._dir(dataset_id)
+            for name in ("vectors.npy", "meta.json"):
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+
+    def flush(self):
+        """write every changed dataset to disk, tmp file + rename so readers never see half a file"""
+        with self.lock:
+            for dataset_id, part in self.partitions.items():
+                if not part.dirty:
+                    continue
+                path = self._dir(dataset_id)
+                os.makedirs(path, exist_ok=True)
+                with open(os.path.join(path, "vectors.tmp.npy"), "wb") as f:
+                    np.save(f, np.asarray(part.vectors))
+                meta = {
+                    "ids": part.ids,
+                    "payloads": part.payloads,
+                    "sparse": [[list(s.keys()), list(s.values())] for s in part.sparse],
+                }
+                with open(os.path.join(path, "meta.tmp.json"), "w") as f:
+                    json.dump(meta, f, default=str)
+                os.replace(os.path.join(path, "vectors.tmp.npy"), os.path.join(path, "vectors.npy"))
+                os.replace(os.path.join(path, "meta.tmp.json"), os.path.join(path, "meta.json"))
+                part.dirty = False
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,124 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+
+from services.config import Config
+from services.task_manager import task_manager
+
+# prometheus metrics for the embed and chat hot paths. the API serves them at
+# /metrics, a standalone worker on METRICS_PORT. worker processes of the prepare
+# pool don't report, their time shows up as the parent's "prepare" stage.
+
+cfg = Config()
+
+# remote calls can take a while, go further out than the default buckets
+_SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+EMBED_REQUEST_SECONDS = Histogram(
+    "exempla_embed_request_seconds",
+    "one embedding API request, single text or multi-doc batch",
+    ["kind"],
+    buckets=_SLOW_BUCKETS,
+)
+VECTOR_UPSERT_SECONDS = Histogram(
+    "exempla_vector_upsert_seconds", "one batch upsert into the vector store", ["backend"]
+)
+VECTOR_SEARCH_SECONDS = Histogram(
+    "exempla_vector_search_seconds", "one vector store search", ["backend", "mode"]
+)
+MONGO_FETCH_SECONDS = Histogram(
+    "exempla_mongo_fetch_seconds", "reading one batch (or full list) of rows", ["collection"]
+)
+LLM_SECONDS = Histogram(
+    "exempla_llm_seconds", "a full LLM answer", ["call"], buckets=_SLOW_BUCKETS
+)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "exempla_llm_first_token_seconds", "time until a streamed answer starts", buckets=_SLOW_BUCKETS
+)
+PIPELINE_STAGE_SECONDS = Histogram(
+    "exempla_pipeline_stage_seconds",
+    "one batch through a stage of the embed pipeline",
+    ["stage"],
+    buckets=_SLOW_BUCKETS,
+)
+CHAT_STAGE_SECONDS = Histogram(
+    "exempla_chat_stage_seconds", "chat request phases", ["stage"], buckets=_SLOW_BUCKETS
+)
+
+RETRIES = Counter("exempla_retries_total", "retried remote calls", ["call", "reason"])
+RATE_LIMITED = Counter("exempla_rate_limited_total", "429 / rate limit responses", ["call"])
+EMBED_ITEMS = Counter(
+    "exempla_embed_items_total", "rows through embed jobs by outcome", ["outcome"]
+)
+CACHE_LOOKUPS = Counter("exempla_cache_lookups_total", "cache lookups", ["cache", "result"])
+
+ACTIVE_TASKS = Gauge("exempla_active_tasks", "tasks registered with the task manager")
+ACTIVE_TASKS.set_function(lambda: len(task_manager.get_active_tasks()))
+QUEUE_DEPTH = Gauge("exempla_queue_depth", "items waiting in an in-process queue", ["queue"])
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    """observe how long the with block took"""
+    metric = histogram.labels(**labels) if labels else histogram
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric.observe(time.perf_counter() - start)
+
+
+def count_cache(cache: str, hits: int, misses: int):
+    if hits:
+        CACHE_LOOKUPS.labels(cache=cache, result="hit").inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels(cache=cache, result="miss").inc(misses)
+
+
+class RequestTimings:
+    """
+    per-request phase timings, each one also goes into CHAT_STAGE_SECONDS.
+    header() renders them as a Server-Timing header (shows up in browser devtools).
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+            CHAT_STAGE_SECONDS.labels(stage=name).observe(elapsed)
+
+    def as_ms(self) -> Dict[str, float]:
+        timings = {name: round(secs * 1000, 1) for name, secs in self.phases.items()}
+        timings["total"] = round((time.perf_counter() - self.start) * 1000, 1)
+        return timings
+
+    def header(self) -> str:
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.as_ms().items())
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server():
+    """for processes without the API (python -m services.worker), METRICS_PORT=0 disables"""
+    if cfg.METRICS_PORT:
+        start_http_server(cfg.METRICS_PORT)
+        print(f"Serving metrics on :{cfg.METRICS_PORT}/metrics")
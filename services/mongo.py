@@ -1,18 +1,142 @@
-from typing import List, Dict
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+from bson.raw_bson import RawBSONDocument
 from pymongo import MongoClient
 from services.config import Config
+from services.metrics import MONGO_FETCH_SECONDS
 
 cfg = Config()
 
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+
+
 def get_mongo_client() -> MongoClient:
-    return MongoClient(cfg.MONGO_URI)
+    """
+    one pooled client per process. MongoClient is thread safe and does its own
+    connection pooling, so everything shares this instead of reconnecting.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(
+                    cfg.MONGO_URI,
+                    maxPoolSize=cfg.MONGO_MAX_POOL_SIZE,
+                    minPoolSize=cfg.MONGO_MIN_POOL_SIZE,
+                    connectTimeoutMS=cfg.MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=cfg.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    socketTimeoutMS=cfg.MONGO_SOCKET_TIMEOUT_MS or None,
+                    readPreference=cfg.MONGO_READ_PREFERENCE,
+                    appname="exempla-ai",
+                )
+    return _client
+
+
+def close_mongo_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def _reset_after_fork():
+    # pymongo clients aren't fork safe, a forked child has to build its own
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def ensure_status_indexes():
+    """status polls and job bookkeeping all look embedding_status up by dataset_id"""
+    get_mongo_client().exempla.embedding_status.create_index("dataset_id")
+
 
-def fetch_vms_for_dataset(dataset_id: int) -> List[Dict]:
+def _iter_batches(
+    collection_name: str,
+    dataset_id: int,
+    batch_size: int,
+    after_id: Optional[Any] = None,
+    fields: Optional[List[str]] = None,
+    raw: bool = False,
+) -> Iterator[List[Dict]]:
+    """
+    stream a dataset's documents off a cursor in _id order, batch_size docs at a time.
+    after_id picks up right after a checkpoint, fields limits what comes over the wire.
+    raw=True yields RawBSONDocuments and leaves decoding to whoever needs the fields.
+    """
     client = get_mongo_client()
     db = client[cfg.MONGO_DB]
-    return list(db["rvtools_vms"].find({"dataset_id": dataset_id}))
+    collection = db[collection_name]
+    if raw:
+        collection = collection.with_options(
+            codec_options=collection.codec_options.with_options(
+                document_class=RawBSONDocument
+            )
+        )
+    query: Dict[str, Any] = {"dataset_id": dataset_id}
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+    cursor = collection.find(query, fields, batch_size=batch_size).sort("_id", 1)
+    fetch_seconds = MONGO_FETCH_SECONDS.labels(collection=collection_name)
+    try:
+        batch = []
+        # only the time spent pulling off the cursor, not while the consumer has the batch
+        started = time.perf_counter()
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                fetch_seconds.observe(time.perf_counter() - started)
+                yield batch
+                batch = []
+                started = time.perf_counter()
+        if batch:
+            fetch_seconds.observe(time.perf_counter() - started)
+            yield batch
+    finally:
+        cursor.close()
 
-def fetch_hosts_for_dataset(dataset_id: int) -> List[Dict]:
+
+def iter_vm_batches(
+    dataset_id: int,
+    batch_size: int,
+    after_id: Optional[Any] = None,
+    fields: Optional[List[str]] = None,
+    raw: bool = False,
+) -> Iterator[List[Dict]]:
+    return _iter_batches("rvtools_vms", dataset_id, batch_size, after_id, fields, raw)
+
+
+def iter_host_batches(
+    dataset_id: int,
+    batch_size: int,
+    after_id: Optional[Any] = None,
+    fields: Optional[List[str]] = None,
+    raw: bool = False,
+) -> Iterator[List[Dict]]:
+    return _iter_batches("rvtools_hosts", dataset_id, batch_size, after_id, fields, raw)
+
+
+def ensure_dataset_indexes():
+    """(dataset_id, _id) lets the readers walk a dataset in _id order off the index"""
     client = get_mongo_client()
     db = client[cfg.MONGO_DB]
-    return list(db["rvtools_hosts"].find({"dataset_id": dataset_id}))
+    for name in ("rvtools_vms", "rvtools_hosts"):
+        db[name].create_index([("dataset_id", 1), ("_id", 1)])
+
+
+def count_vms_for_dataset(dataset_id: int) -> int:
+    client = get_mongo_client()
+    return client[cfg.MONGO_DB]["rvtools_vms"].count_documents({"dataset_id": dataset_id})
+
+
+def count_hosts_for_dataset(dataset_id: int) -> int:
+    client = get_mongo_client()
+    return client[cfg.MONGO_DB]["rvtools_hosts"].count_documents({"dataset_id": dataset_id})
@@ -0,0 +1,200 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from services.metrics import PIPELINE_STAGE_SECONDS, QUEUE_DEPTH
+
+# end-of-stream marker passed down the queues
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    """raised inside stage threads once some other stage has failed"""
+
+
+class StreamingPipeline:
+    """
+    sources -> stage 1 -> stage 2 -> ... -> results
+
+    every stage is a small pool of threads and stages are connected by bounded
+    queues, so a slow stage (usually embedding) pushes back on the ones before it
+    and at most ~queue_size batches per stage are held in memory at any time.
+    a stage function may return None to drop a batch.
+
+    once should_stop() says so the pipeline drains: sources aren't read any further
+    and stages drop batches they haven't started, except the last stage, which still
+    finishes whatever reaches it (that work is already paid for). run() then ends
+    normally with .stopped set. should_abort() (e.g. a drain deadline) fails the
+    pipeline with InterruptedError right away, without waiting for busy stages.
+    """
+
+    def __init__(
+        self,
+        stages: List[Tuple[str, Callable[[Any], Any], int]],
+        queue_size: int,
+        should_stop: Optional[Callable[[], bool]] = None,
+        should_abort: Optional[Callable[[], bool]] = None,
+    ):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.should_stop = should_stop or (lambda: False)
+        self.should_abort = should_abort or (lambda: False)
+        # set once anything was left unread or dropped because of should_stop
+        self.stopped = False
+        self.failed = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.error_lock = threading.Lock()
+        self.queues: List[queue.Queue] = []
+        # queue -> depth gauge, named after the stage reading from it
+        self.depth: Dict[queue.Queue, Any] = {}
+
+    def _fail(self, e: BaseException):
+        with self.error_lock:
+            if self.error is None:
+                self.error = e
+        self.failed.set()
+
+    def _put(self, q: queue.Queue, item):
+        while True:
+            if self.failed.is_set():
+                raise PipelineAborted()
+            try:
+                q.put(item, timeout=0.5)
+                self.depth[q].set(q.qsize())
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue):
+        while True:
+            if self.failed.is_set():
+                raise PipelineAborted()
+            try:
+                item = q.get(timeout=0.5)
+                self.depth[q].set(q.qsize())
+                return item
+            except queue.Empty:
+                continue
+
+    def _read(self, source: Iterable):
+        try:
+            for item in source:
+                if self.should_stop():
+                    self.stopped = True
+                    return
+                self._put(self.queues[0], item)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def _work(self, index: int, fn: Callable[[Any], Any]):
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1]
+        stage_seconds = PIPELINE_STAGE_SECONDS.labels(stage=self.stages[index][0])
+        last_stage = index == len(self.stages) - 1
+        try:
+            while True:
+                item = self._get(inbox)
+                if item is _DONE:
+                    return
+                if not last_stage and self.should_stop():
+                    self.stopped = True
+                    continue
+                start = time.perf_counter()
+                result = fn(item)
+                stage_seconds.observe(time.perf_counter() - start)
+                if result is not None:
+                    self._put(outbox, result)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def _close_after(self, threads: List[threading.Thread], q: queue.Queue, consumers: int):
+        """once every producer thread is done, tell each consumer there's nothing left"""
+        for t in threads:
+            t.join()
+        try:
+            for _ in range(consumers):
+                self._put(q, _DONE)
+        except PipelineAborted:
+            pass
+
+    def run(self, sources: List[Iterable]) -> Iterator[Any]:
+        """start all stages and yield whatever comes out of the last one"""
+        self.queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self.queues.append(queue.Queue(maxsize=self.queue_size))
+        names = [name for name, _, _ in self.stages] + ["results"]
+        self.depth = {
+            q: QUEUE_DEPTH.labels(queue=f"pipeline_{name}")
+            for q, name in zip(self.queues, names)
+        }
+
+        threads: List[threading.Thread] = []
+        producers = [
+            threading.Thread(target=self._read, args=(src,), daemon=True)
+            for src in sources
+        ]
+        threads.extend(producers)
+
+        for index, (name, fn, workers) in enumerate(self.stages):
+            stage_threads = [
+                threading.Thread(
+                    target=self._work,
+                    args=(index, fn),
+                    name=f"pipeline-{name}-{n}",
+                    daemon=True,
+                )
+                for n in range(workers)
+            ]
+            threads.append(
+                threading.Thread(
+                    target=self._close_after,
+                    args=(producers, self.queues[index], workers),
+                    daemon=True,
+                )
+            )
+            threads.extend(stage_threads)
+            producers = stage_threads
+
+        threads.append(
+            threading.Thread(
+                target=self._close_after,
+                args=(producers, self.queues[-1], 1),
+                daemon=True,
+            )
+        )
+
+        for t in threads:
+            t.start()
+
+        results = self.queues[-1]
+        try:
+            while True:
+                if self.should_abort():
+                    self._fail(InterruptedError("Pipeline aborted, in-flight batches dropped"))
+                    break
+                if self.failed.is_set():
+                    break
+                try:
+                    item = results.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                self.depth[results].set(results.qsize())
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            # caller stopped early or something blew up, make every stage bail out
+            if not self.failed.is_set() and any(t.is_alive() for t in threads):
+                self.failed.set()
+            if not self.should_abort():
+                for t in threads:
+                    t.join()
+            # when aborting, stage threads stuck in a remote call are daemons and
+            # are left to finish (or die with the process) on their own
+
+        if self.error is not None:
+            raise self.error
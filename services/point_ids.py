@@ -0,0 +1,25 @@
+import uuid
+from typing import Any, Dict
+
+# fixed so the same row always maps to the same point id
+POINT_ID_NAMESPACE = uuid.UUID("665b4d85-0530-48b0-9b5a-9b5e10c2944d")
+
+
+def natural_key(doc: Dict[str, Any], hash_field: str, name_field: str) -> str:
+    """
+    what identifies a row across re-imports: its rvtools hash, else its name, else
+    the mongo _id (stable for the life of the row, unlike a random uuid)
+    """
+    if doc.get(hash_field):
+        return f"hash:{doc[hash_field]}"
+    if doc.get(name_field):
+        return f"name:{doc[name_field]}"
+    return f"row:{doc['_id']}"
+
+
+def point_id(dataset_id: int, version: int, kind: str, key: str) -> str:
+    """
+    uuid5 of (dataset_id, version, type, natural key). qdrant only takes uuids or
+    ints as ids, and a deterministic one makes re-runs overwrite in place
+    """
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{dataset_id}:{version}:{kind}:{key}"))
@@ -0,0 +1,136 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import bson
+
+from services.config import Config
+from services.fingerprints import compute_fingerprint
+from services.point_ids import natural_key, point_id
+from services.sparse import sparse_vector_for_payload
+from services.summarizer import (
+    create_host_summary_from_dict,
+    create_vm_summary_from_dict,
+    host_metadata,
+    vm_metadata,
+)
+
+# the cpu-bound half of an embed job: decoding rows, rendering summaries and
+# payloads, fingerprints, point ids and sparse vectors. everything here is a
+# module level function so it can run in a worker process. keep the imports
+# light, spawned workers import this module and the parent's __main__ (see
+# services.worker) and nothing else.
+
+cfg = Config()
+
+_ROW_BUILDERS = {
+    "vm": (create_vm_summary_from_dict, vm_metadata, "vm_hash", "vm"),
+    "host": (create_host_summary_from_dict, host_metadata, "host_hash", "host"),
+}
+
+
+def _prepare_batch(batch: List[Dict[str, Any]], kind: str) -> Dict[str, Any]:
+    """
+    one doc at a time, a doc that can't be summarized is skipped on its own.
+    seen has the key of every doc in the batch, skipped ones too, so an incremental
+    run doesn't delete a row's existing point as stale just because it failed here
+    """
+    build_summary, build_metadata, hash_field, name_field = _ROW_BUILDERS[kind]
+    summaries = []
+    ids = []
+    seen = []
+    metadata_list = []
+    fingerprints = []
+    skipped = 0
+
+    for doc in batch:
+        try:
+            doc_id = natural_key(doc, hash_field, name_field)
+            seen.append(doc_id)
+
+            summary = build_summary(doc)
+            metadata = build_metadata(doc)
+
+            summaries.append(summary)
+            ids.append(doc_id)
+            metadata_list.append(metadata)
+            fingerprints.append(compute_fingerprint(summary, metadata))
+        except Exception as e:
+            print(f"Error preparing {kind}: {str(e)}")
+            skipped += 1
+
+    return {
+        "kind": kind,
+        "summaries": summaries,
+        "ids": ids,
+        "seen": seen,
+        "metadata_list": metadata_list,
+        "fingerprints": fingerprints,
+        "skipped": skipped,
+    }
+
+
+def prepare_vm_batch(batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """summaries, point ids and payloads for a batch of VM docs"""
+    return _prepare_batch(batch, "vm")
+
+
+def prepare_host_batch(batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """summaries, point ids and payloads for a batch of host docs"""
+    return _prepare_batch(batch, "host")
+
+
+def prepare_batch(
+    kind: str, batch: List[Dict[str, Any]], dataset_id: int, version: int
+) -> Dict[str, Any]:
+    """everything the embed and write stages need for one batch of decoded docs"""
+    prepared = _prepare_batch(batch, kind)
+    prepared["ids"] = [point_id(dataset_id, version, kind, key) for key in prepared["ids"]]
+    prepared["seen"] = [point_id(dataset_id, version, kind, key) for key in prepared["seen"]]
+    for metadata in prepared["metadata_list"]:
+        metadata["version"] = version
+    prepared["sparse"] = [
+        sparse_vector_for_payload(metadata) for metadata in prepared["metadata_list"]
+    ]
+    return prepared
+
+
+def prepare_raw_batch(
+    kind: str, raw_docs: List[bytes], dataset_id: int, version: int
+) -> Dict[str, Any]:
+    """prepare_batch for raw BSON, runs in a worker process so decoding is off the GIL too"""
+    batch = bson.decode_all(b"".join(raw_docs))
+    return prepare_batch(kind, batch, dataset_id, version)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_prepare_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    one process pool per process, None when EMBED_PREPARE_PROCESSES is 0 (prep then
+    runs on the pipeline threads). spawn rather than fork, the parent has mongo and
+    qdrant clients and a bunch of threads that don't survive a fork
+    """
+    global _pool
+    if cfg.EMBED_PREPARE_PROCESSES <= 0:
+        return None
+    # a worker that died (oom kill etc) breaks the whole pool, start a fresh one
+    if _pool is None or getattr(_pool, "_broken", False):
+        with _pool_lock:
+            if _pool is None or getattr(_pool, "_broken", False):
+                _pool = ProcessPoolExecutor(
+                    max_workers=cfg.EMBED_PREPARE_PROCESSES,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+def shutdown_prepare_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
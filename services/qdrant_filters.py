@@ -0,0 +1,175 @@
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from models.rvtools_filters import FilterOptions, VmFilterOptions
+
+# the "match everything" default ranges on VmFilterOptions
+_DEFAULT_RANGE = VmFilterOptions().memory_gb_range
+
+if TYPE_CHECKING:
+    from qdrant_client.http import models
+
+# payload fields we filter on, created as indexes so filtered HNSW search stays fast.
+# the schemas are PayloadSchemaType values, kept as plain strings so importing this
+# module doesn't pull in qdrant_client (most of the app's import time)
+PAYLOAD_INDEXES = {
+    "dataset_id": "integer",
+    "version": "integer",
+    "type": "keyword",
+    "vcenter": "keyword",
+    "datacenter": "keyword",
+    "cluster": "keyword",
+    "host": "keyword",
+    "vm": "keyword",
+    "powerstate": "keyword",
+    "network": "keyword",
+    "switch": "keyword",
+    "thin": "bool",
+    "memory_gb": "integer",
+    "in_use_mib": "float",
+    "config_os": "text",
+    "vm_tools_os": "text",
+    "model": "keyword",
+    "vendor": "keyword",
+    "cpu_model": "keyword",
+    "esx_version": "keyword",
+    "ht_active": "bool",
+}
+
+
+def parse_filter_options(raw: Optional[Dict[str, Any]]) -> Optional[FilterOptions]:
+    """the chat endpoints take filter_options as a loose dict, missing groups are fine"""
+    if not raw:
+        return None
+    try:
+        return FilterOptions(**raw)
+    except Exception as e:
+        print(f"Ignoring invalid filter_options: {str(e)}")
+        return None
+
+
+def _match_any(key: str, values: List[Any]) -> Optional["models.FieldCondition"]:
+    from qdrant_client.http import models
+
+    if not values:
+        return None
+    return models.FieldCondition(key=key, match=models.MatchAny(any=list(values)))
+
+
+def _match_bools(key: str, values: List[bool]) -> Optional["models.FieldCondition"]:
+    from qdrant_client.http import models
+
+    values = set(values)
+    if not values or len(values) > 1:
+        # nothing picked, or both true and false picked, either way no constraint
+        return None
+    return models.FieldCondition(key=key, match=models.MatchValue(value=values.pop()))
+
+
+def _range(key: str, bounds: Dict[str, int]) -> Optional["models.FieldCondition"]:
+    from qdrant_client.http import models
+
+    if not bounds or bounds == _DEFAULT_RANGE:
+        return None
+    return models.FieldCondition(
+        key=key, range=models.Range(gte=bounds.get("min"), lte=bounds.get("max"))
+    )
+
+
+def _text_any(keys: List[str], values: List[str]) -> Optional["models.Filter"]:
+    """substring-ish match of any value against any of the keys (full text index)"""
+    from qdrant_client.http import models
+
+    if not values:
+        return None
+    return models.Filter(
+        should=[
+            models.FieldCondition(key=key, match=models.MatchText(text=value))
+            for key in keys
+            for value in values
+        ]
+    )
+
+
+def _vm_conditions(vm_filters) -> List[Any]:
+    conditions = [
+        _match_any("vm", vm_filters.vm_names),
+        _text_any(["config_os", "vm_tools_os"], vm_filters.os_types),
+        _text_any(["config_os", "vm_tools_os"], vm_filters.os_versions),
+        _match_any("powerstate", vm_filters.power_states),
+        _match_bools("thin", vm_filters.thin_values),
+        _match_any("switch", vm_filters.switches),
+        _match_any("network", vm_filters.networks),
+        _range("memory_gb", vm_filters.memory_gb_range),
+        _range("in_use_mib", vm_filters.in_use_mib_range),
+    ]
+    # apps isn't in the payload, it only reaches the model through the prompt
+    return [c for c in conditions if c is not None]
+
+
+def _host_conditions(host_filters) -> List[Any]:
+    ht_actives = [str(v).lower() == "true" for v in host_filters.ht_actives]
+    conditions = [
+        _match_any("host", host_filters.host_names),
+        _match_any("model", host_filters.models),
+        _match_any("cpu_model", host_filters.cpu_models),
+        _match_any("vendor", host_filters.vendors),
+        _match_any("esx_version", host_filters.esx_versions),
+        _match_bools("ht_active", ht_actives),
+        _match_any("memory_gb", host_filters.memory_gb_values),
+    ]
+    return [c for c in conditions if c is not None]
+
+
+def _type_is(kind: str) -> "models.FieldCondition":
+    from qdrant_client.http import models
+
+    return models.FieldCondition(key="type", match=models.MatchValue(value=kind))
+
+
+def build_search_filter(
+    dataset_id: int,
+    filter_options: Optional[FilterOptions] = None,
+    version: Optional[int] = None,
+) -> "models.Filter":
+    """
+    dataset_id (and the active version, once the dataset has one) always applies,
+    infrastructure filters apply to every point, vm filters only to vm points and
+    host filters only to host points.
+    if only one of the vm/host groups is set, search is limited to that type.
+    """
+    from qdrant_client.http import models
+
+    must: List[Any] = [
+        models.FieldCondition(key="dataset_id", match=models.MatchValue(value=dataset_id))
+    ]
+    if version is not None:
+        must.append(models.FieldCondition(key="version", match=models.MatchValue(value=version)))
+    if filter_options is None:
+        return models.Filter(must=must)
+
+    infra = filter_options.infrastructure_filters
+    for condition in (
+        _match_any("vcenter", infra.vcenters),
+        _match_any("datacenter", infra.datacenters),
+        _match_any("cluster", infra.clusters),
+    ):
+        if condition is not None:
+            must.append(condition)
+
+    vm_conditions = _vm_conditions(filter_options.vm_filters)
+    host_conditions = _host_conditions(filter_options.host_filters)
+
+    if vm_conditions and host_conditions:
+        must.append(
+            models.Filter(
+                should=[
+                    models.Filter(must=[_type_is("vm"), *vm_conditions]),
+                    models.Filter(must=[_type_is("host"), *host_conditions]),
+                ]
+            )
+        )
+    elif vm_conditions:
+        must.extend([_type_is("vm"), *vm_conditions])
+    elif host_conditions:
+        must.extend([_type_is("host"), *host_conditions])
+
+    return models.Filter(must=must)
@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from services.config import Config
+from services.embedding import aembed_text, embed_text
+from services.metrics import count_cache
+from services.mongo import get_mongo_client
+from services.vector_store import asearch_vectors, search_vectors
+
+cfg = Config()
+
+_MISSING = object()
+
+
+class TTLCache:
+    """small thread safe LRU where entries also expire after ttl seconds"""
+
+    def __init__(self, max_size: int, ttl: float, name: str):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self.data.move_to_end(key)
+                    self.hits += 1
+                    count_cache(self.name, 1, 0)
+                    return value
+                del self.data[key]
+            self.misses += 1
+            count_cache(self.name, 0, 1)
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def invalidate(self, predicate) -> int:
+        """drop every entry whose key matches predicate(key)"""
+        with self.lock:
+            stale = [key for key in self.data if predicate(key)]
+            for key in stale:
+                del self.data[key]
+            return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+query_embedding_cache = TTLCache(
+    cfg.QUERY_CACHE_SIZE, cfg.QUERY_CACHE_TTL_SECONDS, "query_embedding"
+)
+search_result_cache = TTLCache(
+    cfg.SEARCH_CACHE_SIZE, cfg.SEARCH_CACHE_TTL_SECONDS, "search_result"
+)
+
+# dataset_id -> (checked_at, (epoch, active_version)). the epoch is when the dataset
+# was last embedded, so results cached before a re-embed (possibly done by another
+# process) stop matching. active_version is the version chat should search.
+_epochs: Dict[int, Tuple[float, Tuple[Optional[str], Optional[int]]]] = {}
+_epochs_lock = threading.Lock()
+
+
+def _fresh_state(dataset_id: int) -> Optional[Tuple[Optional[str], Optional[int]]]:
+    now = time.monotonic()
+    with _epochs_lock:
+        cached = _epochs.get(dataset_id)
+        if cached and now - cached[0] < cfg.CACHE_EPOCH_TTL_SECONDS:
+            return cached[1]
+    return None
+
+
+def dataset_state(dataset_id: int) -> Tuple[Optional[str], Optional[int]]:
+    state = _fresh_state(dataset_id)
+    if state is not None:
+        return state
+
+    now = time.monotonic()
+    record = get_mongo_client().exempla.embedding_status.find_one(
+        {"dataset_id": dataset_id}, {"_id": 0, "completed_at": 1, "active_version": 1}
+    )
+    if record:
+        state = (str(record.get("completed_at")), record.get("active_version"))
+    else:
+        state = (None, None)
+    with _epochs_lock:
+        _epochs[dataset_id] = (now, state)
+    return state
+
+
+async def adataset_state(dataset_id: int) -> Tuple[Optional[str], Optional[int]]:
+    state = _fresh_state(dataset_id)
+    if state is not None:
+        return state
+    # pymongo blocks, keep it off the event loop
+    return await asyncio.to_thread(dataset_state, dataset_id)
+
+
+def dataset_epoch(dataset_id: int) -> Optional[str]:
+    return dataset_state(dataset_id)[0]
+
+
+def vector_hash(vector: List[float]) -> str:
+    return hashlib.sha1(array("f", vector).tobytes()).hexdigest()
+
+
+def get_query_embedding(text: str) -> List[float]:
+    key = (cfg.GOOGLE_EMBED_MODEL, text)
+    vector = query_embedding_cache.get(key)
+    if vector is not None:
+        return vector
+
+    vector = embed_text(text)
+    # failed embeds come back as zeros, don't pin those in the cache
+    if any(vector):
+        query_embedding_cache.put(key, vector)
+    return vector
+
+
+async def aget_query_embedding(text: str) -> List[float]:
+    key = (cfg.GOOGLE_EMBED_MODEL, text)
+    vector = query_embedding_cache.get(key)
+    if vector is not None:
+        return vector
+
+    vector = await aembed_text(text)
+    if any(vector):
+        query_embedding_cache.put(key, vector)
+    return vector
+
+
+def _search_key(query_vector, dataset_id, epoch, top_k, filters, mode, query_text):
+    return (
+        dataset_id,
+        epoch,
+        vector_hash(query_vector),
+        top_k,
+        json.dumps(filters or {}, sort_keys=True, default=str),
+        mode,
+        query_text if mode == "hybrid" else None,
+    )
+
+
+def cached_search_vectors(
+    query_vector: List[float],
+    dataset_id: int,
+    top_k: int = 5,
+    filters: Optional[Dict[str, Any]] = None,
+    mode: str = "dense",
+    query_text: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    epoch, version = dataset_state(dataset_id)
+    key = _search_key(query_vector, dataset_id, epoch, top_k, filters, mode, query_text)
+    docs = search_result_cache.get(key)
+    if docs is not None:
+        return docs
+
+    docs = search_vectors(
+        query_vector,
+        dataset_id=dataset_id,
+        top_k=top_k,
+        filter_options=filters,
+        mode=mode,
+        query_text=query_text,
+        version=version,
+    )
+    if docs:
+        search_result_cache.put(key, docs)
+    return docs
+
+
+async def acached_search_vectors(
+    query_vector: List[float],
+    dataset_id: int,
+    top_k: int = 5,
+    filters: Optional[Dict[str, Any]] = None,
+    mode: str = "dense",
+    query_text: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    epoch, version = await adataset_state(dataset_id)
+    key = _search_key(query_vector, dataset_id, epoch, top_k, filters, mode, query_text)
+    docs = search_result_cache.get(key)
+    if docs is not None:
+        return docs
+
+    docs = await asearch_vectors(
+        query_vector,
+        dataset_id=dataset_id,
+        top_k=top_k,
+        filter_options=filters,
+        mode=mode,
+        query_text=query_text,
+        version=version,
+    )
+    if docs:
+        search_result_cache.put(key, docs)
+    return docs
+
+
+def invalidate_dataset(dataset_id: int):
+    """drop cached search results for a dataset, called when it gets re-embedded"""
+    search_result_cache.invalidate(lambda key: key[0] == dataset_id)
+    with _epochs_lock:
+        _epochs.pop(dataset_id, None)
+
+
+def cache_stats() -> Dict[str, Any]:
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "search_results": search_result_cache.stats(),
+    }
@@ -0,0 +1,59 @@
+import re
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+# payload fields that hold names/identifiers people search for verbatim
+SPARSE_FIELDS = {
+    "vm": ["vm", "vm_hash", "host", "cluster", "datacenter", "path", "resource_pool", "network", "switch"],
+    "host": ["host", "host_hash", "cluster", "datacenter", "vcenter", "model", "cpu_model"],
+}
+
+_SPLIT = re.compile(r"[^a-z0-9]+")
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9_.\-/]*[a-z0-9]|[a-z0-9]")
+
+
+def _terms(value: str) -> List[str]:
+    """'esx-prd-042' -> ['esx-prd-042', 'esx', 'prd', '042']"""
+    value = value.lower().strip()
+    if not value:
+        return []
+    terms = [value]
+    parts = [p for p in _SPLIT.split(value) if p]
+    if len(parts) > 1 or (parts and parts[0] != value):
+        terms.extend(parts)
+    return terms
+
+
+def _index(term: str) -> int:
+    # stable across processes, unlike hash()
+    return zlib.crc32(term.encode("utf-8")) & 0x7FFFFFFF
+
+
+def _to_sparse(counts: Counter) -> Tuple[List[int], List[float]]:
+    merged: Dict[int, float] = {}
+    for term, count in counts.items():
+        idx = _index(term)
+        merged[idx] = merged.get(idx, 0.0) + float(count)
+    indices = sorted(merged)
+    return indices, [merged[i] for i in indices]
+
+
+def sparse_vector_for_payload(metadata: Dict[str, Any]) -> Tuple[List[int], List[float]]:
+    """term-frequency sparse vector over a point's identifier fields, qdrant applies idf"""
+    counts: Counter = Counter()
+    for field in SPARSE_FIELDS.get(metadata.get("type"), []):
+        value = metadata.get(field)
+        values = value if isinstance(value, list) else [value]
+        for v in values:
+            if v is None:
+                continue
+            counts.update(_terms(str(v)))
+    return _to_sparse(counts)
+
+
+def sparse_vector_for_query(text: str) -> Tuple[List[int], List[float]]:
+    counts: Counter = Counter()
+    for token in _TOKEN.findall(text.lower()):
+        counts.update(_terms(token))
+    return _to_sparse(counts)
@@ -1,5 +1,59 @@
 from typing import Dict, Any
 
+# everything the summaries, payloads and point ids read, for mongo projections
+VM_FIELDS = [
+    "dataset_id", "vm", "vm_hash", "host", "cluster", "datacenter", "vcenter", "path",
+    "resource_pool", "powerstate", "created_at", "cpus", "memory", "memory_gb", "disks",
+    "nics", "provisioned_mib", "provisioned_gb", "in_use_mib", "in_use_gb", "consumed_mib",
+    "capacity_mib", "network", "switch", "config_os", "vm_tools_os", "phys_cores_used",
+    "phys_ram_used", "is_desktop", "thin", "collection",
+]
+HOST_FIELDS = [
+    "dataset_id", "host", "host_hash", "datacenter", "cluster", "vcenter", "vendor", "model",
+    "cpu_model", "cpus", "cores", "vcpus", "speed", "memory", "memory_gb", "nics", "hbas",
+    "cpu_usage", "memory_usage", "vms", "desktop_vms", "server_vms", "vram", "esx_version",
+    "ht_active", "collection", "created_at",
+]
+
+
+# the summary text, one positional argument per placeholder. the only copy of the
+# wording, the *_from_dict builders below (and benchmarks.bench_summaries) fill it in
+def render_vm_summary(
+    vm, vm_hash, dataset_id, power, host, cluster, datacenter, cpus, memory_gb,
+    provisioned_gb, in_use_gb, consumed_gb, os_info, is_desktop, networks, switches,
+    thin_count, disks, resource_pool, path, phys_cores, phys_ram, created_at,
+) -> str:
+    return (
+        f"VM '{vm}' (hash={vm_hash}), dataset {dataset_id}. "
+        f"It is {power} on host '{host}', cluster '{cluster}', in datacenter '{datacenter}'. "
+        f"Has {cpus} vCPUs, {memory_gb} GB memory. Provisioned ~{provisioned_gb} GB, in-use ~{in_use_gb} GB, consumed ~{consumed_gb} GB. "
+        f"OS: {os_info}. is_desktop: {is_desktop}. "
+        f"Networks: {networks}. Switches: {switches}. "
+        f"Thin-provisioned disks: {thin_count} of {disks}. "
+        f"Resource pool: {resource_pool}. Path: {path}. "
+        f"Physical cores used: {phys_cores}, physical RAM used: {phys_ram} GB. "
+        f"Record created at {created_at}."
+    )
+
+
+def render_host_summary(
+    host, host_hash, dataset_id, datacenter, cluster, vendor, model, cpu_model,
+    esx_version, ht, cores, vcpus, cpu_usage, memory, memory_gb, memory_usage, vms,
+    desktop_vms, server_vms, vram, nics, hbas, cpus, speed, vcenter, created_at,
+) -> str:
+    return (
+        f"Host '{host}' (hash={host_hash}), dataset {dataset_id}. "
+        f"Datacenter: '{datacenter}'. Cluster: '{cluster}'. "
+        f"Vendor: {vendor}, Model: {model}, CPU model: {cpu_model}. "
+        f"ESXi version: {esx_version}, hyper-threading: {ht}. "
+        f"Cores: {cores}, total vCPUs: {vcpus}, usage at {cpu_usage}%. "
+        f"Memory: {memory} MB (~{memory_gb} GB), usage {memory_usage}%. "
+        f"{vms} VMs total, {desktop_vms} desktop, {server_vms} server. VRAM: {vram} MB. "
+        f"NICS: {nics}, HBAs: {hbas}, CPU packages: {cpus}, speed: {speed} MHz. "
+        f"vCenter: {vcenter}. Created at {created_at}."
+    )
+
+
 def create_vm_summary_from_dict(vm_dict: Dict[str, Any]) -> str:
     power_state = vm_dict.get("powerstate", "unknown")
     power_state_str = "powered on" if power_state == "poweredOn" else power_state
@@ -14,38 +68,135 @@ def create_vm_summary_from_dict(vm_dict: Dict[str, Any]) -> str:
     consumed_mib = vm_dict.get("consumed_mib", 0)
     consumed_gb = consumed_mib / 1024 if consumed_mib else 0
     thin_list = vm_dict.get("thin", []) or []
-    thin_count = len([t for t in thin_list if t])
-    total_disks = vm_dict.get("disks", 0)
     network_list = vm_dict.get("network", []) or []
     switch_list = vm_dict.get("switch", []) or []
-    config_os = vm_dict.get("config_os")
-    vm_tools_os = vm_dict.get("vm_tools_os")
-    os_info = config_os or vm_tools_os or "unknown"
-
-    summary = (
-        f"VM '{vm_dict.get('vm', 'unknown')}' (hash={vm_dict.get('vm_hash', 'unknown')}), dataset {vm_dict.get('dataset_id', 'unknown')}. "
-        f"It is {power_state_str} on host '{vm_dict.get('host', 'unknown')}', cluster '{vm_dict.get('cluster', 'unknown')}', in datacenter '{vm_dict.get('datacenter', 'unknown')}'. "
-        f"Has {vm_dict.get('cpus', 0)} vCPUs, {memory_gb} GB memory. Provisioned ~{round(provisioned_gb, 2)} GB, in-use ~{round(in_use_gb, 2)} GB, consumed ~{round(consumed_gb, 2)} GB. "
-        f"OS: {os_info}. is_desktop: {vm_dict.get('is_desktop', False)}. "
-        f"Networks: {', '.join(network_list) if network_list else 'none'}. Switches: {', '.join(switch_list) if switch_list else 'none'}. "
-        f"Thin-provisioned disks: {thin_count} of {total_disks}. "
-        f"Resource pool: {vm_dict.get('resource_pool') or 'N/A'}. Path: {vm_dict.get('path') or 'N/A'}. "
-        f"Physical cores used: {vm_dict.get('phys_cores_used') or 'unknown'}, physical RAM used: {vm_dict.get('phys_ram_used') or 'unknown'} GB. "
-        f"Record created at {vm_dict.get('created_at') or 'unknown time'}. "
+    os_info = vm_dict.get("config_os") or vm_dict.get("vm_tools_os") or "unknown"
+
+    return render_vm_summary(
+        vm_dict.get("vm", "unknown"),
+        vm_dict.get("vm_hash", "unknown"),
+        vm_dict.get("dataset_id", "unknown"),
+        power_state_str,
+        vm_dict.get("host", "unknown"),
+        vm_dict.get("cluster", "unknown"),
+        vm_dict.get("datacenter", "unknown"),
+        vm_dict.get("cpus", 0),
+        memory_gb,
+        round(provisioned_gb, 2),
+        round(in_use_gb, 2),
+        round(consumed_gb, 2),
+        os_info,
+        vm_dict.get("is_desktop", False),
+        ", ".join(network_list) if network_list else "none",
+        ", ".join(switch_list) if switch_list else "none",
+        len([t for t in thin_list if t]),
+        vm_dict.get("disks", 0),
+        vm_dict.get("resource_pool") or "N/A",
+        vm_dict.get("path") or "N/A",
+        vm_dict.get("phys_cores_used") or "unknown",
+        vm_dict.get("phys_ram_used") or "unknown",
+        vm_dict.get("created_at") or "unknown time",
     )
-    return summary.strip()
 
 
 def create_host_summary_from_dict(host_dict: Dict[str, Any]) -> str:
-    summary = (
-        f"Host '{host_dict.get('host', 'unknown')}' (hash={host_dict.get('host_hash', 'unknown')}), dataset {host_dict.get('dataset_id', 'unknown')}. "
-        f"Datacenter: '{host_dict.get('datacenter', 'unknown')}'. Cluster: '{host_dict.get('cluster', 'unknown')}'. "
-        f"Vendor: {host_dict.get('vendor', 'unknown')}, Model: {host_dict.get('model', 'unknown')}, CPU model: {host_dict.get('cpu_model', 'unknown')}. "
-        f"ESXi version: {host_dict.get('esx_version', 'unknown')}, hyper-threading: {'active' if host_dict.get('ht_active', False) else 'inactive'}. "
-        f"Cores: {host_dict.get('cores', 0)}, total vCPUs: {host_dict.get('vcpus', 0)}, usage at {host_dict.get('cpu_usage', 0)}%. "
-        f"Memory: {host_dict.get('memory', 0)} MB (~{host_dict.get('memory_gb', 0)} GB), usage {host_dict.get('memory_usage', 0)}%. "
-        f"{host_dict.get('vms', 0)} VMs total, {host_dict.get('desktop_vms', 0)} desktop, {host_dict.get('server_vms', 0)} server. VRAM: {host_dict.get('vram', 0)} MB. "
-        f"NICS: {host_dict.get('nics', 0)}, HBAs: {host_dict.get('hbas', 0)}, CPU packages: {host_dict.get('cpus', 0)}, speed: {host_dict.get('speed', 0)} MHz. "
-        f"vCenter: {host_dict.get('vcenter', 'unknown')}. Created at {host_dict.get('created_at') or 'unknown time'}. "
+    return render_host_summary(
+        host_dict.get("host", "unknown"),
+        host_dict.get("host_hash", "unknown"),
+        host_dict.get("dataset_id", "unknown"),
+        host_dict.get("datacenter", "unknown"),
+        host_dict.get("cluster", "unknown"),
+        host_dict.get("vendor", "unknown"),
+        host_dict.get("model", "unknown"),
+        host_dict.get("cpu_model", "unknown"),
+        host_dict.get("esx_version", "unknown"),
+        "active" if host_dict.get("ht_active", False) else "inactive",
+        host_dict.get("cores", 0),
+        host_dict.get("vcpus", 0),
+        host_dict.get("cpu_usage", 0),
+        host_dict.get("memory", 0),
+        host_dict.get("memory_gb", 0),
+        host_dict.get("memory_usage", 0),
+        host_dict.get("vms", 0),
+        host_dict.get("desktop_vms", 0),
+        host_dict.get("server_vms", 0),
+        host_dict.get("vram", 0),
+        host_dict.get("nics", 0),
+        host_dict.get("hbas", 0),
+        host_dict.get("cpus", 0),
+        host_dict.get("speed", 0),
+        host_dict.get("vcenter", "unknown"),
+        host_dict.get("created_at") or "unknown time",
     )
-    return summary.strip()
+
+
+def vm_metadata(vm: Dict[str, Any]) -> Dict[str, Any]:
+    """qdrant payload for a VM row"""
+    return {
+        "dataset_id": vm.get("dataset_id"),
+        "type": "vm",
+        "vm": vm.get("vm", "unknown"),
+        "vm_hash": vm.get("vm_hash"),
+        "host": vm.get("host", "unknown"),
+        "cluster": vm.get("cluster", "unknown"),
+        "datacenter": vm.get("datacenter", "unknown"),
+        "vcenter": vm.get("vcenter"),
+        "path": vm.get("path"),
+        "resource_pool": vm.get("resource_pool"),
+        "powerstate": vm.get("powerstate", "unknown"),
+        "created_at": vm.get("created_at"),
+        "cpus": vm.get("cpus"),
+        "memory": vm.get("memory"),
+        "memory_gb": vm.get("memory_gb"),
+        "disks": vm.get("disks"),
+        "nics": vm.get("nics"),
+        "provisioned_mib": vm.get("provisioned_mib"),
+        "provisioned_gb": vm.get("provisioned_gb"),
+        "in_use_mib": vm.get("in_use_mib"),
+        "in_use_gb": vm.get("in_use_gb"),
+        "consumed_mib": vm.get("consumed_mib"),
+        "capacity_mib": vm.get("capacity_mib"),
+        "network": vm.get("network", []),
+        "switch": vm.get("switch", []),
+        "config_os": vm.get("config_os"),
+        "vm_tools_os": vm.get("vm_tools_os"),
+        "phys_cores_used": vm.get("phys_cores_used"),
+        "phys_ram_used": vm.get("phys_ram_used"),
+        "is_desktop": vm.get("is_desktop", False),
+        "thin": vm.get("thin", []),
+        "collection": vm.get("collection"),
+    }
+
+
+def host_metadata(host: Dict[str, Any]) -> Dict[str, Any]:
+    """qdrant payload for a host row"""
+    return {
+        "dataset_id": host.get("dataset_id"),
+        "type": "host",
+        "host": host.get("host", "unknown"),
+        "host_hash": host.get("host_hash"),
+        "datacenter": host.get("datacenter", "unknown"),
+        "cluster": host.get("cluster"),
+        "vcenter": host.get("vcenter"),
+        "vendor": host.get("vendor"),
+        "model": host.get("model"),
+        "cpu_model": host.get("cpu_model"),
+        "cpus": host.get("cpus"),
+        "cores": host.get("cores"),
+        "vcpus": host.get("vcpus"),
+        "speed": host.get("speed"),
+        "memory": host.get("memory"),
+        "memory_gb": host.get("memory_gb"),
+        "nics": host.get("nics"),
+        "hbas": host.get("hbas"),
+        "cpu_usage": host.get("cpu_usage"),
+        "memory_usage": host.get("memory_usage"),
+        "vms": host.get("vms"),
+        "desktop_vms": host.get("desktop_vms"),
+        "server_vms": host.get("server_vms"),
+        "vram": host.get("vram"),
+        "esx_version": host.get("esx_version"),
+        "ht_active": host.get("ht_active"),
+        "collection": host.get("collection"),
+        "created_at": host.get("created_at"),
+    }
@@ -1,17 +1,55 @@
+import os
 import threading
 import signal
 import time
-from typing import Dict, Set, Any
-import sys
+from typing import Dict, Optional, Set, Any
+
+from services.config import Config
+
+cfg = Config()
+
 
 class TaskManager:
     def __init__(self):
         self.tasks: Dict[str, Any] = {}
         self.lock = threading.Lock()
+        # notified whenever a task unregisters
+        self.idle = threading.Condition(self.lock)
         self.shutdown_event = threading.Event()
+        # time.monotonic() by which background tasks have to be done, once shutting down
+        self.drain_deadline: Optional[float] = None
+
+    def install_signal_handlers(self):
+        """
+        only for standalone processes (python -m services.worker). under uvicorn the
+        server owns SIGINT/SIGTERM (serve.py forwards them to request_shutdown())
+        """
         signal.signal(signal.SIGINT, self.handle_shutdown)
         signal.signal(signal.SIGTERM, self.handle_shutdown)
 
+    def request_shutdown(self):
+        """
+        tell running jobs to stop at their next batch boundary and start the drain
+        deadline. safe to call more than once and from a signal handler (no locks)
+        """
+        if self.drain_deadline is None:
+            self.drain_deadline = time.monotonic() + cfg.SHUTDOWN_DRAIN_SECONDS
+            print(
+                f"Shutdown requested, draining {len(self.tasks)} background tasks "
+                f"for up to {cfg.SHUTDOWN_DRAIN_SECONDS:.0f}s"
+            )
+        self.shutdown_event.set()
+
+    def drain_remaining(self) -> float:
+        """seconds left until the drain deadline (the full drain time if not shutting down)"""
+        if self.drain_deadline is None:
+            return cfg.SHUTDOWN_DRAIN_SECONDS
+        return max(self.drain_deadline - time.monotonic(), 0.0)
+
+    def drain_expired(self) -> bool:
+        """shutting down and out of time, in-flight work should be dropped now"""
+        return self.drain_deadline is not None and time.monotonic() >= self.drain_deadline
+
     def register_task(self, task_id: str, task: Any):
         """register a new background task"""
         with self.lock:
@@ -26,34 +64,34 @@ class TaskManager:
                 print(
                     f"Task {task_id} unregistered. Remaining tasks: {len(self.tasks)}"
                 )
+            self.idle.notify_all()
 
     def get_active_tasks(self) -> Set[str]:
         """get active tasks"""
         with self.lock:
             return set(self.tasks.keys())
 
-    def handle_shutdown(self, signum, frame):
-        print(f"Received shutdown signal {signum}. Initiating graceful shutdown...")
-        self.shutdown_event.set()
-
-        print(f"Waiting for {len(self.tasks)} background tasks to complete...")
-        shutdown_timeout = 30  # secs
-
-        start_time = time.time()
-        while self.tasks and time.time() - start_time < shutdown_timeout:
-            time.sleep(1)
-            print(f"Still waiting for {len(self.tasks)} tasks...")
-
-        if self.tasks:
-            print(f"Forcing shutdown with {len(self.tasks)} tasks still running")
+    def wait_for_tasks(self) -> bool:
+        """block until every task has unregistered or the drain deadline passes, True if they all did"""
+        with self.idle:
+            finished = self.idle.wait_for(lambda: not self.tasks, timeout=self.drain_remaining())
+            remaining = len(self.tasks)
+        if finished:
+            print("All background tasks completed")
         else:
-            print("All tasks completed successfully")
+            print(f"Drain deadline passed with {remaining} background tasks still running")
+        return finished
 
-        # exit after timeout
-        if signum == signal.SIGINT:
-            sys.exit(130)
-        else:
-            sys.exit(0)
+    def handle_shutdown(self, signum, frame):
+        """
+        signal handler, never blocks: the process's main loop notices should_shutdown()
+        and does the draining. a second signal exits straight away
+        """
+        if self.shutdown_event.is_set():
+            print(f"Received signal {signum} again, exiting without draining")
+            os._exit(130 if signum == signal.SIGINT else 143)
+        print(f"Received shutdown signal {signum}. Initiating graceful shutdown...")
+        self.request_shutdown()
 
     def should_shutdown(self) -> bool:
         """Check if shutdown has been requested"""
@@ -61,4 +99,4 @@ class TaskManager:
 
 
 task_manager = TaskManager()
-__all__ = ["task_manager"]
\ No newline at end of file
+__all__ = ["task_manager"]
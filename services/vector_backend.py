@@ -0,0 +1,133 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+SparseVector = Tuple[List[int], List[float]]
+
+
+class VectorBackend(ABC):
+    """
+    what the embed and chat paths need from a vector store. the module level
+    functions in services.vector_store call whichever backend VECTOR_BACKEND picks.
+    search results are dicts of score, content and metadata (the payload).
+    """
+
+    def ensure_collection(self):
+        pass
+
+    def ensure_payload_indexes(self):
+        pass
+
+    def ping(self):
+        """raise if the store can't serve searches right now, for the readiness probe"""
+
+    @abstractmethod
+    def upsert(
+        self,
+        doc_ids: List[str],
+        vectors: List[List[float]],
+        metadata_list: List[Dict[str, Any]],
+        sparse_vectors: Optional[List[SparseVector]] = None,
+    ) -> List[str]:
+        """write points, returns the ids that could not be written"""
+
+    @abstractmethod
+    def search(
+        self,
+        query_vector: List[float],
+        dataset_id: int,
+        top_k: int = 5,
+        filter_options: Optional[Dict[str, Any]] = None,
+        mode: str = "dense",
+        query_text: Optional[str] = None,
+        hnsw_ef: Optional[int] = None,
+        oversampling: Optional[float] = None,
+        version: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        filter_options is the raw FilterOptions dict from the chat request.
+        version limits the search to one version of the dataset (None = any).
+        hnsw_ef / oversampling are ann tuning knobs, backends can ignore them
+        """
+
+    async def asearch(
+        self,
+        query_vector: List[float],
+        dataset_id: int,
+        top_k: int = 5,
+        filter_options: Optional[Dict[str, Any]] = None,
+        mode: str = "dense",
+        query_text: Optional[str] = None,
+        hnsw_ef: Optional[int] = None,
+        oversampling: Optional[float] = None,
+        version: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(
+            self.search,
+            query_vector,
+            dataset_id,
+            top_k,
+            filter_options,
+            mode,
+            query_text,
+            hnsw_ef,
+            oversampling,
+            version,
+        )
+
+    @abstractmethod
+    def delete(self, doc_ids: List[str]):
+        pass
+
+    @abstractmethod
+    def delete_dataset(self, dataset_id: int, keep_version: Optional[int] = None):
+        """drop every point of a dataset, or every point outside keep_version"""
+
+    def flush(self):
+        """make sure everything upserted so far is durable and searchable"""
+
+    def close(self):
+        pass
+
+
+def process_hits(hits, scores=None) -> List[Dict[str, Any]]:
+    """hits are anything with .payload and .score (qdrant ScoredPoint or similar)"""
+    processed_results = []
+    for i, hit in enumerate(hits):
+        payload = hit.payload
+        metadata = {}
+        for key, value in payload.items():
+            if key != "content":
+                metadata[key] = value
+
+        processed_doc = {
+            "score": scores[i] if scores is not None else hit.score,
+            "content": payload.get("content", ""),
+            "metadata": metadata,
+        }
+        processed_results.append(processed_doc)
+
+    return processed_results
+
+
+def strong_sparse_hits(hits, min_ratio: float):
+    """
+    every vm shares terms like "vm" or "prod", keep only sparse hits close to the
+    best one so those don't crowd an exact name match out of the fusion
+    """
+    if not hits:
+        return hits
+    cutoff = hits[0].score * min_ratio
+    return [hit for hit in hits if hit.score >= cutoff]
+
+
+def rrf_fuse(result_lists, top_k: int, k: int = 60):
+    """reciprocal rank fusion: score = sum of 1 / (k + rank) over the lists a point shows up in"""
+    fused: Dict[Any, float] = {}
+    points: Dict[Any, Any] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results):
+            fused[result.id] = fused.get(result.id, 0.0) + 1.0 / (k + rank + 1)
+            points.setdefault(result.id, result)
+    ranked = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return [points[pid] for pid in ranked], [round(fused[pid], 6) for pid in ranked]
@@ -1,95 +1,592 @@
-from typing import List, Dict, Any
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple
 from services.config import Config
+from services.embedding import embedding_dimensions
+from services.metrics import (
+    RATE_LIMITED,
+    RETRIES,
+    VECTOR_SEARCH_SECONDS,
+    VECTOR_UPSERT_SECONDS,
+    timed,
+)
+from services.qdrant_filters import PAYLOAD_INDEXES, build_search_filter, parse_filter_options
+from services.sparse import sparse_vector_for_query
 from services.task_manager import task_manager
+from services.vector_backend import VectorBackend, process_hits, rrf_fuse, strong_sparse_hits
+
+if TYPE_CHECKING:
+    from qdrant_client import AsyncQdrantClient, QdrantClient
+    from qdrant_client.http import models
 
 cfg = Config()
-qdrant = QdrantClient(url=cfg.QDRANT_URL, api_key=cfg.QDRANT_API_KEY)
 
+# built on first use, not at import, so importing the app never touches the network.
+# qdrant_client itself is imported the same way, it's about half of `import main`
+_qdrant: Optional["QdrantClient"] = None
+_async_qdrant: Optional["AsyncQdrantClient"] = None
+_qdrant_lock = threading.Lock()
 
-def upsert_vector(doc_id: str, vector: List[float], metadata: Dict[str, Any]):
-    # shutdown check
-    if task_manager.should_shutdown():
-        raise InterruptedError("Vector store operation interrupted by server shutdown")
 
-    qdrant.upsert(
-        collection_name="dataset_vectors",
-        points=[models.PointStruct(id=doc_id, vector=vector, payload=metadata)],
+def _client_kwargs() -> Dict[str, Any]:
+    return dict(
+        url=cfg.QDRANT_URL,
+        api_key=cfg.QDRANT_API_KEY,
+        prefer_grpc=cfg.QDRANT_PREFER_GRPC,
+        grpc_port=cfg.QDRANT_GRPC_PORT,
+        timeout=cfg.QDRANT_TIMEOUT,
     )
 
 
+def get_qdrant() -> "QdrantClient":
+    global _qdrant
+    if _qdrant is None:
+        with _qdrant_lock:
+            if _qdrant is None:
+                from qdrant_client import QdrantClient
+
+                _qdrant = QdrantClient(**_client_kwargs())
+    return _qdrant
+
+
+def get_async_qdrant() -> "AsyncQdrantClient":
+    """for the async chat path, only ever used from the API's event loop"""
+    global _async_qdrant
+    if _async_qdrant is None:
+        with _qdrant_lock:
+            if _async_qdrant is None:
+                from qdrant_client import AsyncQdrantClient
+
+                _async_qdrant = AsyncQdrantClient(**_client_kwargs())
+    return _async_qdrant
+
+
+async def close_qdrant_clients():
+    global _qdrant, _async_qdrant
+    with _qdrant_lock:
+        client, async_client = _qdrant, _async_qdrant
+        _qdrant = _async_qdrant = None
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        await async_client.close()
+
+
+# named sparse vector (identifier terms) living next to the default dense vector
+SPARSE_VECTOR_NAME = "text-sparse"
+
+
+class QdrantBackend(VectorBackend):
+    def __init__(self):
+        self._sparse_enabled: Optional[bool] = None
+        # shared by every writer thread so total concurrent upserts stay bounded
+        self._upsert_pool = ThreadPoolExecutor(
+            max_workers=cfg.QDRANT_UPSERT_PARALLELISM, thread_name_prefix="qdrant-upsert"
+        )
+        # most recent fire-and-forget chunk, re-sent with wait=True as a barrier
+        self._last_unacked_chunk: Optional[List["models.PointStruct"]] = None
+        self._last_unacked_lock = threading.Lock()
+
+    def _quantization_config(self):
+        from qdrant_client.http import models
+
+        if cfg.QDRANT_QUANTIZATION == "scalar":
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+                )
+            )
+        if cfg.QDRANT_QUANTIZATION == "binary":
+            return models.BinaryQuantization(
+                binary=models.BinaryQuantizationConfig(always_ram=True)
+            )
+        return None
+
+    def _hnsw_config(self):
+        from qdrant_client.http import models
+
+        return models.HnswConfigDiff(
+            m=cfg.QDRANT_HNSW_M,
+            ef_construct=cfg.QDRANT_HNSW_EF_CONSTRUCT,
+            on_disk=cfg.QDRANT_HNSW_ON_DISK,
+        )
+
+    def ensure_collection(self):
+        """
+        create the collection (dense + sparse vectors) sized for the embed model, or
+        bring an existing one's storage settings in line with the config
+        """
+        from qdrant_client.http import models
+
+        size = embedding_dimensions()
+        if not get_qdrant().collection_exists(cfg.QDRANT_COLLECTION):
+            get_qdrant().create_collection(
+                collection_name=cfg.QDRANT_COLLECTION,
+                vectors_config=models.VectorParams(
+                    size=size,
+                    distance=models.Distance.COSINE,
+                    on_disk=cfg.QDRANT_ON_DISK_VECTORS,
+                ),
+                sparse_vectors_config={
+                    SPARSE_VECTOR_NAME: models.SparseVectorParams(
+                        index=models.SparseIndexParams(on_disk=cfg.QDRANT_ON_DISK_VECTORS),
+                        modifier=models.Modifier.IDF,
+                    )
+                },
+                hnsw_config=self._hnsw_config(),
+                quantization_config=self._quantization_config(),
+                on_disk_payload=cfg.QDRANT_ON_DISK_PAYLOAD,
+            )
+            print(
+                f"Created Qdrant collection {cfg.QDRANT_COLLECTION} "
+                f"({size} dims, {cfg.QDRANT_QUANTIZATION} quantization)"
+            )
+            return
+
+        info = get_qdrant().get_collection(cfg.QDRANT_COLLECTION)
+        params = info.config.params
+        dense = params.vectors.get("") if isinstance(params.vectors, dict) else params.vectors
+        if dense is not None and dense.size != size:
+            raise RuntimeError(
+                f"Collection {cfg.QDRANT_COLLECTION} holds {dense.size}-dim vectors but "
+                f"{cfg.GOOGLE_EMBED_MODEL} returns {size}, use a new QDRANT_COLLECTION"
+            )
+
+        hnsw = info.config.hnsw_config
+        quantization = self._quantization_config()
+        current = info.config.quantization_config
+        update = {}
+        if dense is not None and bool(dense.on_disk) != cfg.QDRANT_ON_DISK_VECTORS:
+            update["vectors_config"] = {
+                "": models.VectorParamsDiff(on_disk=cfg.QDRANT_ON_DISK_VECTORS)
+            }
+        if (hnsw.m, hnsw.ef_construct, bool(hnsw.on_disk)) != (
+            cfg.QDRANT_HNSW_M,
+            cfg.QDRANT_HNSW_EF_CONSTRUCT,
+            cfg.QDRANT_HNSW_ON_DISK,
+        ):
+            update["hnsw_config"] = self._hnsw_config()
+        if type(current) is not type(quantization):
+            update["quantization_config"] = quantization or models.Disabled.DISABLED
+        if bool(params.on_disk_payload) != cfg.QDRANT_ON_DISK_PAYLOAD:
+            update["collection_params"] = models.CollectionParamsDiff(
+                on_disk_payload=cfg.QDRANT_ON_DISK_PAYLOAD
+            )
+        if update:
+            # qdrant rebuilds the affected segments in the background
+            get_qdrant().update_collection(collection_name=cfg.QDRANT_COLLECTION, **update)
+            print(f"Updated Qdrant collection {cfg.QDRANT_COLLECTION}: {', '.join(update)}")
+
+    def ensure_payload_indexes(self):
+        """create the payload indexes our search filters use, no-op for ones that exist"""
+        from qdrant_client.http import models
+
+        info = get_qdrant().get_collection(cfg.QDRANT_COLLECTION)
+        existing = set((info.payload_schema or {}).keys())
+        for field, schema in PAYLOAD_INDEXES.items():
+            if field in existing:
+                continue
+            get_qdrant().create_payload_index(
+                collection_name=cfg.QDRANT_COLLECTION,
+                field_name=field,
+                field_schema=models.PayloadSchemaType(schema),
+            )
+            print(f"Created payload index on {field}")
+
+    def sparse_enabled(self) -> bool:
+        """collections created before hybrid search have no sparse vector, cache the check"""
+        if self._sparse_enabled is None:
+            try:
+                info = get_qdrant().get_collection(cfg.QDRANT_COLLECTION)
+                sparse = info.config.params.sparse_vectors or {}
+                self._sparse_enabled = SPARSE_VECTOR_NAME in sparse
+                if not self._sparse_enabled:
+                    print(
+                        f"Collection {cfg.QDRANT_COLLECTION} has no sparse vector, hybrid search "
+                        "falls back to dense until it is recreated"
+                    )
+            except Exception as e:
+                print(f"Error checking for sparse vector support: {str(e)}")
+                return False
+        return self._sparse_enabled
+
+    def _upsert_chunk(self, points: List["models.PointStruct"], wait: bool) -> bool:
+        """upsert one chunk with retries, returns False if it never made it"""
+        backoff = 0.5
+        for attempt in range(cfg.QDRANT_UPSERT_MAX_RETRIES):
+            try:
+                get_qdrant().upsert(collection_name=cfg.QDRANT_COLLECTION, points=points, wait=wait)
+                if not wait:
+                    with self._last_unacked_lock:
+                        self._last_unacked_chunk = points
+                return True
+            except Exception as e:
+                print(
+                    f"Error upserting batch of {len(points)} to Qdrant "
+                    f"(attempt {attempt+1}/{cfg.QDRANT_UPSERT_MAX_RETRIES}): {str(e)}"
+                )
+                status_code = getattr(e, "status_code", None)
+                if status_code == 429:
+                    RATE_LIMITED.labels(call="qdrant_upsert").inc()
+                if status_code is not None and 400 <= status_code < 500 and status_code != 429:
+                    # bad request, sending it again won't help
+                    return False
+                if attempt < cfg.QDRANT_UPSERT_MAX_RETRIES - 1:
+                    RETRIES.labels(
+                        call="qdrant_upsert",
+                        reason="rate_limited" if status_code == 429 else "error",
+                    ).inc()
+                    time.sleep(backoff)
+                    backoff *= 2
+        return False
+
+    def upsert(self, doc_ids, vectors, metadata_list, sparse_vectors=None) -> List[str]:
+        """
+        upsert in chunks of QDRANT_UPSERT_BATCH_SIZE, several chunks at once.
+        with QDRANT_UPSERT_WAIT off qdrant acks before indexing, so flush()
+        once the job is done writing.
+        """
+        from qdrant_client.http import models
+
+        with_sparse = sparse_vectors is not None and self.sparse_enabled()
+
+        # points for batch upsert
+        points = []
+        failed_ids = []
+        for i in range(len(doc_ids)):
+            try:
+                point_id = str(doc_ids[i])
+                # qdrant rejects the whole request over one bad id, catch it per point
+                uuid.UUID(point_id)
+                vector = vectors[i]
+                if with_sparse:
+                    indices, values = sparse_vectors[i]
+                    vector = {
+                        "": vectors[i],
+                        SPARSE_VECTOR_NAME: models.SparseVector(indices=indices, values=values),
+                    }
+                point = models.PointStruct(
+                    id=point_id, vector=vector, payload=metadata_list[i]
+                )
+                points.append(point)
+            except Exception as e:
+                print(f"Error creating point for document {doc_ids[i]}: {str(e)}")
+                failed_ids.append(str(doc_ids[i]))
+
+        if not points:
+            return failed_ids
+
+        batch_size = cfg.QDRANT_UPSERT_BATCH_SIZE
+        chunks = [points[i : i + batch_size] for i in range(0, len(points), batch_size)]
+        futures = [
+            self._upsert_pool.submit(self._upsert_chunk, chunk, cfg.QDRANT_UPSERT_WAIT)
+            for chunk in chunks
+        ]
+        for chunk, future in zip(chunks, futures):
+            if not future.result():
+                failed_ids.extend(str(p.id) for p in chunk)
+
+        return failed_ids
+
+    def flush(self):
+        """
+        consistency barrier for wait=False upserts: updates are applied in order, so
+        once a wait=True re-send of the last chunk returns everything before it is in too.
+        the re-send is an idempotent overwrite of the same points.
+        """
+        with self._last_unacked_lock:
+            chunk = self._last_unacked_chunk
+            self._last_unacked_chunk = None
+        if chunk:
+            if not self._upsert_chunk(chunk, wait=True):
+                raise RuntimeError("Qdrant did not acknowledge pending upserts")
+
+    def _search_params(self, hnsw_ef, oversampling):
+        from qdrant_client.http import models
+
+        quantization = None
+        if cfg.QDRANT_QUANTIZATION in ("scalar", "binary"):
+            quantization = models.QuantizationSearchParams(
+                rescore=cfg.QDRANT_SEARCH_RESCORE,
+                oversampling=oversampling or cfg.QDRANT_SEARCH_OVERSAMPLING,
+            )
+        return models.SearchParams(
+            hnsw_ef=hnsw_ef or cfg.QDRANT_SEARCH_HNSW_EF, quantization=quantization
+        )
+
+    def _search_requests(
+        self, query_vector, query_text, query_filter, top_k, sparse, hnsw_ef, oversampling
+    ):
+        """
+        kwargs for each qdrant query_points call, sparse says whether to add the
+        sparse side (hybrid mode, a query text and a collection that has one)
+        """
+        from qdrant_client.http import models
+
+        dense = {
+            "query": query_vector,
+            "search_params": self._search_params(hnsw_ef, oversampling),
+        }
+        common = {
+            "collection_name": cfg.QDRANT_COLLECTION,
+            "query_filter": query_filter,
+            "with_payload": True,
+            "with_vectors": False,
+        }
+        if not sparse:
+            return [{**common, **dense, "limit": top_k}]
+
+        # over-fetch from both sides so fusion has something to work with
+        limit = top_k * cfg.HYBRID_PREFETCH_FACTOR
+        indices, values = sparse_vector_for_query(query_text)
+        requests = [{**common, **dense, "limit": limit}]
+        if indices:
+            requests.append(
+                {
+                    **common,
+                    "query": models.SparseVector(indices=indices, values=values),
+                    "using": SPARSE_VECTOR_NAME,
+                    "limit": limit,
+                }
+            )
+        return requests
+
+    def search(
+        self,
+        query_vector,
+        dataset_id,
+        top_k=5,
+        filter_options=None,
+        mode="dense",
+        query_text=None,
+        hnsw_ef=None,
+        oversampling=None,
+        version=None,
+    ):
+        query_filter = build_search_filter(
+            dataset_id, parse_filter_options(filter_options), version
+        )
+        sparse = mode == "hybrid" and bool(query_text) and self.sparse_enabled()
+        requests = self._search_requests(
+            query_vector, query_text, query_filter, top_k, sparse, hnsw_ef, oversampling
+        )
+        result_lists = [get_qdrant().query_points(**request).points for request in requests]
+        if len(result_lists) == 1:
+            return process_hits(result_lists[0])
+        result_lists[1] = strong_sparse_hits(result_lists[1], cfg.SPARSE_MIN_SCORE_RATIO)
+        return process_hits(*rrf_fuse(result_lists, top_k))
+
+    async def asearch(
+        self,
+        query_vector,
+        dataset_id,
+        top_k=5,
+        filter_options=None,
+        mode="dense",
+        query_text=None,
+        hnsw_ef=None,
+        oversampling=None,
+        version=None,
+    ):
+        query_filter = build_search_filter(
+            dataset_id, parse_filter_options(filter_options), version
+        )
+        sparse = mode == "hybrid" and bool(query_text)
+        if sparse:
+            # the first check is a blocking get_collection, keep it off the event loop
+            sparse = self._sparse_enabled
+            if sparse is None:
+                sparse = await asyncio.to_thread(self.sparse_enabled)
+        requests = self._search_requests(
+            query_vector, query_text, query_filter, top_k, sparse, hnsw_ef, oversampling
+        )
+        responses = await asyncio.gather(
+            *(get_async_qdrant().query_points(**request) for request in requests)
+        )
+        result_lists = [response.points for response in responses]
+        if len(result_lists) == 1:
+            return process_hits(result_lists[0])
+        result_lists[1] = strong_sparse_hits(result_lists[1], cfg.SPARSE_MIN_SCORE_RATIO)
+        return process_hits(*rrf_fuse(result_lists, top_k))
+
+    def delete(self, doc_ids):
+        from qdrant_client.http import models
+
+        batch_size = 1000
+        for i in range(0, len(doc_ids), batch_size):
+            batch = [str(doc_id) for doc_id in doc_ids[i : i + batch_size]]
+            get_qdrant().delete(
+                collection_name=cfg.QDRANT_COLLECTION,
+                points_selector=models.PointIdsList(points=batch),
+            )
+
+    def delete_dataset(self, dataset_id, keep_version=None):
+        from qdrant_client.http import models
+
+        must_not = []
+        if keep_version is not None:
+            must_not.append(
+                models.FieldCondition(key="version", match=models.MatchValue(value=keep_version))
+            )
+        # one filtered delete, qdrant finds the points through the payload indexes
+        get_qdrant().delete(
+            collection_name=cfg.QDRANT_COLLECTION,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="dataset_id", match=models.MatchValue(value=dataset_id)
+                        )
+                    ],
+                    must_not=must_not,
+                )
+            ),
+            wait=True,
+        )
+
+    def ping(self):
+        if not get_qdrant().collection_exists(cfg.QDRANT_COLLECTION):
+            raise RuntimeError(f"Collection {cfg.QDRANT_COLLECTION} does not exist")
+
+    def close(self):
+        self._upsert_pool.shutdown(wait=True)
+
+
+_backend: Optional[VectorBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_vector_backend() -> VectorBackend:
+    """VECTOR_BACKEND=qdrant (default) or local for the in-process numpy store"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if cfg.VECTOR_BACKEND == "local":
+                    from services.local_vector_store import LocalVectorStore
+
+                    _backend = LocalVectorStore(cfg.LOCAL_VECTOR_PATH)
+                else:
+                    _backend = QdrantBackend()
+    return _backend
+
+
+def ensure_collection():
+    get_vector_backend().ensure_collection()
+
+
+def ensure_payload_indexes():
+    get_vector_backend().ensure_payload_indexes()
+
+
+def ping_vector_store():
+    get_vector_backend().ping()
+
+
+def upsert_vector(doc_id: str, vector: List[float], metadata: Dict[str, Any]):
+    batch_upsert_vectors([doc_id], [vector], [metadata])
+
+
 def batch_upsert_vectors(
-    doc_ids: List[str], vectors: List[List[float]], metadata_list: List[Dict[str, Any]]
-):
-    # shutdown check
-    if task_manager.should_shutdown():
+    doc_ids: List[str],
+    vectors: List[List[float]],
+    metadata_list: List[Dict[str, Any]],
+    sparse_vectors: Optional[List[Tuple[List[int], List[float]]]] = None,
+) -> List[str]:
+    """
+    sparse_vectors are (indices, values) pairs for hybrid search. writes may not
+    be searchable until wait_for_pending_upserts(). returns the ids that could not be written.
+    """
+    # batches in flight still get written on shutdown, just not past the drain deadline
+    if task_manager.drain_expired():
         raise InterruptedError("Vector store operation interrupted by server shutdown")
 
     if not (len(doc_ids) == len(vectors) == len(metadata_list)):
         raise ValueError(
             "doc_ids, vectors, and metadata_list must have the same length"
         )
+    with timed(VECTOR_UPSERT_SECONDS, backend=cfg.VECTOR_BACKEND):
+        return get_vector_backend().upsert(doc_ids, vectors, metadata_list, sparse_vectors)
 
-    # points for batch upsert
-    points = []
-    for i in range(len(doc_ids)):
-        try:
-            point_id = str(doc_ids[i])
-            point = models.PointStruct(
-                id=point_id, vector=vectors[i], payload=metadata_list[i]
-            )
-            points.append(point)
-        except Exception as e:
-            print(f"Error creating point for document {doc_ids[i]}: {str(e)}")
 
-    if not points:
-        return
-
-    batch_size = 100
-    for i in range(0, len(points), batch_size):
-        # shutdown check
-        if task_manager.should_shutdown():
-            raise InterruptedError(
-                "Vector store operation interrupted by server shutdown"
-            )
-
-        batch = points[i : i + batch_size]
-        try:
-            qdrant.upsert(collection_name="dataset_vectors", points=batch)
-        except Exception as e:
-            print(f"Error upserting batch to Qdrant: {str(e)}")
+def wait_for_pending_upserts():
+    get_vector_backend().flush()
 
 
-def search_vectors(query_vector, dataset_id, top_k=5):
+def search_vectors(
+    query_vector,
+    dataset_id,
+    top_k=5,
+    filter_options=None,
+    mode="dense",
+    query_text=None,
+    hnsw_ef=None,
+    oversampling=None,
+    version=None,
+):
+    """
+    filter_options is the raw FilterOptions dict from the chat request.
+    version is the dataset's active version, None for datasets embedded before versioning.
+    mode="hybrid" also runs a sparse search over names/hashes/paths/networks with
+    query_text and fuses both rankings with RRF.
+    hnsw_ef / oversampling trade speed for recall, None means the QDRANT_SEARCH_* config.
+    """
     try:
-        search_results = qdrant.search(
-            collection_name="dataset_vectors",
-            query_vector=query_vector,
-            query_filter={
-                "must": [{"key": "dataset_id", "match": {"value": dataset_id}}]
-            },
-            limit=top_k,
-            with_payload=True,
-            with_vectors=False,
-        )
+        with timed(VECTOR_SEARCH_SECONDS, backend=cfg.VECTOR_BACKEND, mode=mode):
+            return get_vector_backend().search(
+                query_vector,
+                dataset_id,
+                top_k,
+                filter_options,
+                mode,
+                query_text,
+                hnsw_ef=hnsw_ef,
+                oversampling=oversampling,
+                version=version,
+            )
+    except Exception as e:
+        print(f"Error searching vectors: {str(e)}")
+        return []
 
-        processed_results = []
-        for result in search_results:
-            payload = result.payload
-            metadata = {}
-            for key, value in payload.items():
-                if key != "content":
-                    metadata[key] = value
-
-            processed_doc = {
-                "score": result.score,
-                "content": payload.get("content", ""),
-                "metadata": metadata,
-            }
-            processed_results.append(processed_doc)
 
-        return processed_results
+async def asearch_vectors(
+    query_vector,
+    dataset_id,
+    top_k=5,
+    filter_options=None,
+    mode="dense",
+    query_text=None,
+    hnsw_ef=None,
+    oversampling=None,
+    version=None,
+):
+    try:
+        with timed(VECTOR_SEARCH_SECONDS, backend=cfg.VECTOR_BACKEND, mode=mode):
+            return await get_vector_backend().asearch(
+                query_vector,
+                dataset_id,
+                top_k,
+                filter_options,
+                mode,
+                query_text,
+                hnsw_ef=hnsw_ef,
+                oversampling=oversampling,
+                version=version,
+            )
     except Exception as e:
         print(f"Error searching vectors: {str(e)}")
         return []
+
+
+def delete_vectors(doc_ids: List[str]):
+    """delete points by id, used to drop rows that no longer exist in mongo"""
+    if not doc_ids:
+        return
+    get_vector_backend().delete(doc_ids)
+
+
+def delete_dataset_vectors(dataset_id: int, keep_version: Optional[int] = None):
+    get_vector_backend().delete_dataset(dataset_id, keep_version=keep_version)
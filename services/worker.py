@@ -0,0 +1,157 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from services.config import Config
+from services.metrics import start_metrics_server
+from services.mongo import close_mongo_client, ensure_status_indexes
+from services.prepare import shutdown_prepare_pool
+from services.job_queue import (
+    claim_job,
+    complete_job,
+    ensure_job_indexes,
+    fail_exhausted_jobs,
+    fail_job,
+    heartbeat,
+    release_job,
+    requeue_interrupted_jobs,
+)
+from services.task_manager import task_manager
+
+cfg = Config()
+
+# embed_job and vector_store (qdrant, numpy, grpc) are imported where they're used.
+# the prepare pool's spawned processes re-import whatever module is __main__, which
+# is this one under `python -m services.worker`, so its top level has to stay light
+
+# how long past the drain deadline a job gets to write its checkpoint
+JOB_CLEANUP_GRACE_SECONDS = 5
+
+
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def _heartbeat_loop(
+    job_id: Any, worker_id: str, done: threading.Event, lease_lost: threading.Event
+):
+    interval = max(cfg.EMBED_JOB_LEASE_SECONDS / 3, 1)
+    while not done.wait(interval):
+        try:
+            if not heartbeat(job_id, worker_id):
+                print(f"Worker {worker_id} lost the lease on job {job_id}, stopping it")
+                lease_lost.set()
+                return
+        except Exception as e:
+            # a missed beat or two is fine, the lease is 3x the interval
+            print(f"Error sending heartbeat for job {job_id}: {str(e)}")
+
+
+def run_job(job: Dict[str, Any], worker_id: str):
+    dataset_id = job["dataset_id"]
+    # a job that's been attempted before always continues from its checkpoint
+    resume = bool(job.get("resume")) or job.get("attempts", 1) > 1
+    task_id = f"embed-{dataset_id}-{job['_id']}"
+    print(f"Worker {worker_id} running job {job['_id']} for dataset {dataset_id}")
+
+    done = threading.Event()
+    # set when another worker took the job over, so the two don't write the same
+    # dataset version at once
+    lease_lost = threading.Event()
+    beat = threading.Thread(
+        target=_heartbeat_loop, args=(job["_id"], worker_id, done, lease_lost), daemon=True
+    )
+    beat.start()
+
+    from services.embed_job import process_embeddings_with_tracking
+
+    try:
+        outcome = process_embeddings_with_tracking(
+            dataset_id,
+            task_id,
+            incremental=job.get("incremental", False),
+            resume=resume,
+            lease_lost=lease_lost,
+        )
+    finally:
+        done.set()
+        beat.join()
+
+    if lease_lost.is_set():
+        # the job isn't ours to complete or fail anymore
+        print(f"Worker {worker_id} gave up job {job['_id']} ({outcome}) after losing its lease")
+        return
+    if outcome == "completed":
+        complete_job(job["_id"], worker_id)
+    elif outcome == "interrupted":
+        release_job(job["_id"], worker_id)
+    else:
+        fail_job(job, worker_id, f"Embedding job ended with status {outcome}")
+
+
+def run_worker(stop_event: Optional[threading.Event] = None, worker_id: Optional[str] = None):
+    """
+    claim and run embed jobs until told to stop. jobs run on their own thread so
+    the loop (and the signal handlers on the main thread) stay responsive.
+    """
+    from services.vector_store import ensure_collection
+
+    stop_event = stop_event or task_manager.shutdown_event
+    worker_id = worker_id or make_worker_id()
+    ensure_status_indexes()
+    ensure_job_indexes()
+    try:
+        ensure_collection()
+    except Exception as e:
+        print(f"Error setting up Qdrant collection: {str(e)}")
+    if cfg.EMBED_AUTO_RESUME:
+        try:
+            requeue_interrupted_jobs()
+        except Exception as e:
+            print(f"Error requeueing interrupted embedding jobs: {str(e)}")
+    print(f"Embedding worker {worker_id} started")
+
+    while not stop_event.is_set():
+        try:
+            fail_exhausted_jobs()
+            job = claim_job(worker_id)
+        except Exception as e:
+            print(f"Error claiming embedding job: {str(e)}")
+            job = None
+
+        if job is None:
+            stop_event.wait(cfg.EMBED_JOB_POLL_SECONDS)
+            continue
+
+        runner = threading.Thread(target=run_job, args=(job, worker_id), daemon=True)
+        runner.start()
+        while runner.is_alive():
+            runner.join(timeout=1)
+            # the job aborts itself at the drain deadline and records its checkpoint. if
+            # it's still stuck after that the lease expires and another worker resumes it
+            deadline = task_manager.drain_deadline
+            if deadline is not None and time.monotonic() > deadline + JOB_CLEANUP_GRACE_SECONDS:
+                print(f"Worker {worker_id} leaving job {job['_id']} behind at the drain deadline")
+                break
+
+    print(f"Embedding worker {worker_id} stopped")
+
+
+def start_background_worker() -> threading.Thread:
+    """run a worker inside the API process, handy for local dev"""
+    thread = threading.Thread(target=run_worker, name="embedding-worker", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    task_manager.install_signal_handlers()
+    start_metrics_server()
+    try:
+        run_worker()
+    finally:
+        shutdown_prepare_pool()
+        close_mongo_client()
@@ -0,0 +1,95 @@
+import pytest
+
+from services.aggregation import parse_aggregate_intent
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        # a condition the parse can't express, a dataset-wide number would be wrong
+        "how many VMs have more than 8 GB of memory",
+        "how many VMs have vmware tools installed",
+        "how many VMs run Windows Server 2022",
+        # about one named VM, the record answers that
+        "how much memory does vm-0000000 have in total",
+        "what is the total memory of 'web-frontend'",
+        # "which" about something that can't be grouped or ranked
+        "which VMs are powered off",
+        "which cluster has the most and least vms",
+        "how many VMs and hosts are there",
+    ],
+)
+def test_unparsed_qualifiers_fall_back_to_retrieval(question):
+    assert parse_aggregate_intent(question) is None
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "How many VMs are in the prod cluster?",
+        "How many VMs are in the cluster named prod?",
+        "how many VMs are in cluster prod",
+    ],
+)
+def test_cluster_scope_word_orders(question):
+    intent = parse_aggregate_intent(question)
+    assert intent is not None
+    assert (intent.kind, intent.op, intent.match) == ("vm", "count", {"cluster": "prod"})
+
+
+def test_max_number_of_is_a_max_not_a_count():
+    intent = parse_aggregate_intent("max number of vcpus")
+    assert (intent.op, intent.field) == ("max", "cpus")
+
+
+def test_total_number_of_is_a_count():
+    intent = parse_aggregate_intent("total number of VMs")
+    assert (intent.op, intent.field) == ("count", None)
+
+
+def test_which_host_has_the_highest_value_ranks_hosts():
+    intent = parse_aggregate_intent("Which host has the highest cpu usage?")
+    assert intent.kind == "host"
+    assert (intent.op, intent.field, intent.group_by, intent.ascending) == (
+        "max",
+        "cpu_usage",
+        "host",
+        False,
+    )
+
+
+def test_which_group_has_the_fewest_ranks_row_counts_ascending():
+    intent = parse_aggregate_intent("which host has the fewest vms")
+    assert (intent.kind, intent.op, intent.group_by, intent.ascending) == (
+        "vm",
+        "count",
+        "host",
+        True,
+    )
+
+
+def test_which_group_has_the_lowest_total_sums_per_group():
+    intent = parse_aggregate_intent("Which datacenter has the lowest total memory?")
+    assert (intent.op, intent.field, intent.group_by, intent.ascending) == (
+        "sum",
+        "memory",
+        "datacenter",
+        True,
+    )
+
+
+def test_filters_and_scope_together():
+    intent = parse_aggregate_intent("how many powered on windows VMs are in cluster prod-01?")
+    assert intent.match["powerstate"] == "poweredOn"
+    assert intent.match["cluster"] == "prod-01"
+    assert intent.match["config_os"]["$regex"] == "windows"
+
+
+def test_group_by():
+    intent = parse_aggregate_intent("total memory per cluster")
+    assert (intent.op, intent.field, intent.group_by, intent.match) == (
+        "sum",
+        "memory",
+        "cluster",
+        {},
+    )